@@ -0,0 +1,65 @@
+"""
+관리자용 계측 페이지입니다.
+TELEMETRY_ADMIN=on일 때만 app.py가 이 페이지를 내비게이션에 등록하고, 이 파일을 직접 실행해도 같은 설정을 확인합니다.
+
+같은 프로세스의 telemetry 모듈에 쌓인 단계별 지연 시간(p50/p95/p99), LLM 토큰 수,
+캐시 적중률, 파싱 실패 횟수를 보여줍니다.
+"""
+import os
+import streamlit as st
+from telemetry import telemetry
+
+st.set_page_config(page_title="계측 현황", page_icon="📊", layout="wide")
+
+if os.environ.get("TELEMETRY_ADMIN") != "on":
+    st.info("관리자 페이지가 비활성화되어 있습니다.")
+    st.stop()
+
+st.title("단계별 계측 현황 📊")
+st.caption("이 프로세스가 시작된 뒤의 누적 값입니다. 백분위수는 단계별 최근 호출 기준입니다.")
+
+rows = telemetry.summary()
+if rows:
+    st.subheader("단계별 지연 시간 (ms)")
+    st.dataframe(
+        [
+            {
+                "단계": row["stage"],
+                "호출 수": row["count"],
+                "오류 수": row["errors"],
+                "p50": round(row["p50"] * 1000, 1),
+                "p95": round(row["p95"] * 1000, 1),
+                "p99": round(row["p99"] * 1000, 1),
+            }
+            for row in rows
+        ],
+        use_container_width=True,
+        hide_index=True,
+    )
+else:
+    st.write("아직 기록된 단계가 없습니다.")
+
+counters = telemetry.counter_values()
+
+cache = {dict(labels)["result"]: value for (name, labels), value in counters.items() if name == "llm_cache_requests_total"}
+cache_total = sum(cache.values())
+col1, col2, col3 = st.columns(3)
+hit_rate = (cache.get("local_hit", 0) + cache.get("redis_hit", 0)) / cache_total if cache_total else 0.0
+col1.metric("캐시 적중률", f"{hit_rate:.1%}", f"요청 {cache_total:.0f}건", delta_color="off")
+parse_failures = sum(value for (name, _), value in counters.items() if name == "llm_parse_failures_total")
+col2.metric("응답 파싱 실패", f"{parse_failures:.0f}건")
+tokens = sum(value for (name, _), value in counters.items() if name == "llm_tokens_total")
+col3.metric("LLM 토큰", f"{tokens:,.0f}")
+
+if counters:
+    st.subheader("카운터")
+    st.dataframe(
+        [
+            {"이름": name, "레이블": ", ".join(f"{k}={v}" for k, v in labels), "값": value}
+            for (name, labels), value in sorted(counters.items())
+        ],
+        use_container_width=True,
+        hide_index=True,
+    )
+
+st.download_button("Prometheus 형식으로 내려받기", telemetry.render_prometheus(), file_name="metrics.txt", mime="text/plain")
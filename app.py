@@ -1,28 +1,108 @@
-__import__('pysqlite3')
-import sys
-sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
-
-import streamlit as st
 import os
-from model import EmotionBasedPsychotherapy
-from data_loader import load_env, load_emotion_data, load_markdown_retriever # import 수정
+import streamlit as st
+import streamlit.components.v1 as components
+import time
+from model import EmotionBasedPsychotherapy, new_session_state
+from data_loader import load_env, start_loader_warmup
+from pdf_worker import get_pdf_service, PdfServiceBusy
+from session_engine import NARRATIVE_PROMPT
+from session_state import get_session_store, SessionConflict, SESSION_COOKIE, session_token, verify_session_token
+from telemetry import span, traced, start_metrics_server
 
 st.set_page_config(page_title="우울하신가요?", page_icon="❤️", layout="wide")
+# TELEMETRY_METRICS_PORT가 설정되어 있으면 /metrics 서버를 한 번만 띄움
+start_metrics_server()
+
+
+def consultation():
+    """상담 화면 (아래 모듈 본문이 그대로 그립니다)"""
+
+
+# 관리자 계측 페이지는 TELEMETRY_ADMIN=on일 때만 등록
+# (pages/ 디렉터리에 두면 자동 탐색되어 모든 사용자의 사이드바에 보이므로 admin.py로 분리)
+if os.environ.get("TELEMETRY_ADMIN") == "on":
+    admin_page = st.Page("admin.py", title="계측 현황", icon="📊", url_path="admin")
+    if st.navigation([st.Page(consultation, title="우울하신가요?", icon="❤️", default=True), admin_page]) == admin_page:
+        admin_page.run()
+        st.stop()
 
-# --- 세션 상태 초기화 수정 ---
-if 'bot' not in st.session_state:
+# --- 세션 상태 초기화 ---
+# 상담 진행 상태(단계, 점수, 대화 기록 등)는 세션 저장소에 두고, 쿠키의 서명된 세션 토큰으로 찾아옵니다.
+# 그래서 서버가 재시작되거나 다른 레플리카로 연결되어도 같은 브라우저면 이어서 진행됩니다.
+# (토큰을 URL에 넣으면 공유된 링크나 브라우저 기록으로 상담 내용이 노출되므로 쿠키만 사용)
+# 말뭉치/인덱스 로딩은 백그라운드에서 시작해 두고, 입력 폼은 로딩을 기다리지 않고 바로 그립니다.
+if 'session' not in st.session_state:
     try:
         load_env()
-        emotion_df = load_emotion_data()
-        md_retriever = load_markdown_retriever()
-        st.session_state.bot = EmotionBasedPsychotherapy(emotion_df, md_retriever)
+        start_loader_warmup()
 
-        st.session_state.messages = []
-        st.session_state.phase = "user_info_gathering" # 현재 단계를 관리할 'phase' 추가
-        st.session_state.user_data = {} # 사용자 정보를 저장할 딕셔너리
+        # 예전 방식(URL의 sid)으로 들어온 주소는 세션 재개에 쓰지 않고 주소에서 지움
+        if "sid" in st.query_params:
+            del st.query_params["sid"]
+        session_id = None
+        if not st.session_state.pop("start_new_session", False):
+            session_id = verify_session_token(st.context.cookies.get(SESSION_COOKIE))
+        state = get_session_store().load(session_id) if session_id else None
+        if state is None:
+            state = new_session_state()
+        st.session_state.session = state
     except Exception as e:
         st.error(f"초기화 오류: {e}.")
         st.stop()
+else:
+    # 다른 레플리카에서 진행된 내용이 있으면 최신 스냅샷으로 교체
+    latest = get_session_store().load(st.session_state.session.session_id)
+    if latest is not None and latest.version != st.session_state.session.version:
+        st.session_state.session = latest
+
+session = st.session_state.session
+
+
+def remember_session_cookie():
+    """다음에 접속할 때 이어서 진행할 수 있도록 서명된 세션 토큰을 이 브라우저의 쿠키에 저장합니다."""
+    # Streamlit은 쿠키를 쓰는 API가 없으므로 높이 0의 컴포넌트에서 상위 문서의 쿠키를 설정
+    # (매 실행 같은 위치에 같은 내용으로 그리므로 다시 불러와지지 않음)
+    cookie = (f"{SESSION_COOKIE}={session_token(session.session_id)}; Path=/; "
+              f"Max-Age={get_session_store().ttl}; SameSite=Strict")
+    components.html(f"<script>window.parent.document.cookie = {cookie!r};</script>", height=0)
+
+
+remember_session_cookie()
+
+
+def get_bot():
+    """상담 모델을 반환합니다. 처음 필요할 때 백그라운드 로딩이 끝나기를 기다렸다가 만듭니다."""
+    if 'bot' not in st.session_state:
+        try:
+            with st.spinner("상담을 준비하고 있어요..."), span("app.wait_for_loaders"):
+                emotion_corpus, md_retriever, example_selector = start_loader_warmup().result()
+        except Exception as e:
+            # 다음 실행에서 로딩을 다시 시도
+            start_loader_warmup.clear()
+            st.error(f"초기화 오류: {e}.")
+            st.stop()
+        st.session_state.bot = EmotionBasedPsychotherapy(emotion_corpus, md_retriever, example_selector, state=session)
+    st.session_state.bot.state = st.session_state.session
+    return st.session_state.bot
+
+
+@traced("app.save_session")
+def save_session():
+    """
+    현재 세션 상태를 저장합니다. 다른 곳에서 먼저 바뀌었으면 최신 상태를 다시 불러와 스크립트를 처음부터 다시 실행합니다.
+    (모듈 수준의 session은 이전 객체를 가리키므로, 이번 실행을 계속하면 이후 변경이 저장되지 않고 사라짐)
+    """
+    try:
+        get_session_store().save(session)
+    except SessionConflict as e:
+        print(f"세션 저장 충돌: {e}")
+        latest = get_session_store().load(session.session_id)
+        if latest is not None:
+            st.session_state.session = latest
+            if 'bot' in st.session_state:
+                st.session_state.bot.state = latest
+        st.rerun()
+
 
 st.title("우울증 자가 진단 챗봇 🌟")
 st.markdown("안녕하세요. 당신의 마음 상태를 이해하고 도움을 드리기 위해 몇 가지 질문을 시작하겠습니다.")
@@ -30,7 +110,7 @@ st.markdown("안녕하세요. 당신의 마음 상태를 이해하고 도움을
 # --- 단계별 UI 분기 처리 ---
 
 # 1단계: 사용자 정보 입력
-if st.session_state.phase == "user_info_gathering":
+if session.phase == "user_info_gathering":
     st.subheader("먼저 자신에 대해 조금만 알려주시겠어요?")
     with st.form("user_info_form"):
         name = st.text_input("이름")
@@ -41,133 +121,173 @@ if st.session_state.phase == "user_info_gathering":
         submitted = st.form_submit_button("입력 완료")
 
         if submitted:
-            st.session_state.user_data = {
+            session.user_data = {
                 "이름": name, "성별": gender, "나이": age, 
                 "주요 증상": symptoms, "과거 병력": history
             }
-            st.session_state.phase = "screening_questions"
+            session.phase = "screening_questions"
+            save_session()
             st.rerun()
 
 # 채팅 기록 표시 (2단계부터 표시)
-if st.session_state.phase != "user_info_gathering":
-    for message in st.session_state.messages:
+if session.phase != "user_info_gathering":
+    for message in session.messages:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
 
 # 2단계: 5가지 질문 평가
-if st.session_state.phase == "screening_questions":
+if session.phase == "screening_questions":
     # 첫 질문 시작
-    if not st.session_state.messages:
+    if not session.messages:
         with st.chat_message("assistant"):
             # 어색한 안내 메시지 삭제 후 바로 첫 질문 표시
-            first_question = st.session_state.bot.screening_questions[0]
-            st.session_state.messages.append({"role": "assistant", "content": first_question})
+            first_question = session.screening_questions[0]
+            session.messages.append({"role": "assistant", "content": first_question})
             st.markdown(first_question)
+        save_session()
 
     if prompt := st.chat_input("답변을 입력해주세요..."):
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        bot = get_bot()
+        session.messages.append({"role": "user", "content": prompt})
         with st.chat_message("user"):
             st.markdown(prompt)
 
-        analysis_result = st.session_state.bot.process_and_score_answer(prompt)
+        # 점수 분석은 백그라운드에서 진행하고, 공감 응답(다음 질문)은 바로 스트리밍
+        reply_stream = bot.start_screening_answer(prompt)
+        if reply_stream is not None:
+            with st.chat_message("assistant"):
+                response = st.write_stream(reply_stream)
+                session.messages.append({"role": "assistant", "content": response})
+
+        analysis_result = bot.finish_screening_answer()
         with st.expander("답변 분석 결과 보기"):
             st.info(analysis_result)
+        save_session()
 
-        if st.session_state.bot.is_test_finished():
-            st.session_state.phase = "narrative_input"
+        if bot.is_test_finished():
+            session.phase = "narrative_input"
+            # 서술형 답변을 쓰는 동안 보고서용 검색을 미리 실행
+            bot.start_report_prefetch(session.user_data)
             with st.chat_message("assistant"):
-                narrative_prompt = "마지막으로, 현재 심정에 대해 일기를 쓰듯 자유롭게 이야기해주세요. 어떤 내용이든 괜찮습니다."
-                st.session_state.messages.append({"role": "assistant", "content": narrative_prompt})
-                st.markdown(narrative_prompt)
+                session.messages.append({"role": "assistant", "content": NARRATIVE_PROMPT})
+                st.markdown(NARRATIVE_PROMPT)
+            save_session()
             st.rerun()
-        else:
-            with st.chat_message("assistant"):
-                with st.spinner("생각 중..."):
-                    response = st.session_state.bot.generate_empathetic_response_and_ask_question(prompt)
-                    st.session_state.messages.append({"role": "assistant", "content": response})
-                    st.markdown(response)
 
 # 3단계: 서술형/일기 입력
-if st.session_state.phase == "narrative_input":
+if session.phase == "narrative_input":
     if prompt := st.chat_input("여기에 자유롭게 작성해주세요..."):
+        bot = get_bot()
         # 1. 서술형 답변을 user_data에 저장
-        st.session_state.user_data["서술형 답변"] = prompt
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        session.user_data["서술형 답변"] = prompt
+        session.messages.append({"role": "user", "content": prompt})
         with st.chat_message("user"):
             st.markdown(prompt)
 
+        # 선별 질문 뒤에 받아 둔 검색 결과는 두고, 서술형 답변 질의만 추가로 검색 (점수 분석과 동시에 진행)
+        bot.start_report_prefetch(session.user_data)
+
         # --- 2. 서술형 답변 점수 분석 및 반영 (수정된 부분) ---
         with st.spinner("답변을 분석하여 점수에 반영하고 있어요..."):
             # 질문 총점 기록
-            st.session_state.user_data["질문 총점"] = st.session_state.bot.score
+            session.user_data["질문 총점"] = bot.score
 
             # 서술형 답변 분석 및 점수 획득
-            narrative_score_result = st.session_state.bot.score_narrative_answer(prompt)
+            narrative_score_result = bot.score_narrative_answer(prompt)
             narrative_points = narrative_score_result.get("points", 0)
             narrative_reason = narrative_score_result.get("reason", "")
             
             # 서술형 점수와 이유를 user_data에 저장
-            st.session_state.user_data["서술형 점수"] = narrative_points
+            session.user_data["서술형 점수"] = narrative_points
             
             # 챗봇의 총점에 추가
-            st.session_state.bot.score += narrative_points
+            bot.score += narrative_points
 
         # 분석 결과를 사용자에게 보여줌
         with st.expander("서술형 답변 분석 결과 보기"):
-            st.info(f"분석 결과: {narrative_reason} ({narrative_points}점 추가, 현재 총점: {st.session_state.bot.score}점)")
+            st.info(f"분석 결과: {narrative_reason} ({narrative_points}점 추가, 현재 총점: {bot.score}점)")
         
         # 3. 최종 분석 단계로 전환
-        st.session_state.phase = "final_analysis"
+        session.phase = "final_analysis"
+        save_session()
         st.rerun()
 
 # 4단계: 최종 분석 및 정보 제공
-if st.session_state.phase == "final_analysis":
+if session.phase == "final_analysis":
+    bot = get_bot()
     with st.chat_message("assistant"):
         with st.spinner("모든 정보를 바탕으로 맞춤형 분석을 진행하고 있습니다..."):
-            # 1. 모델로부터 헤더와 본문을 분리해서 받음 (수정)
-            report_header, report_body = st.session_state.bot.generate_final_analysis(
-                st.session_state.user_data
+            # 1. 모델로부터 헤더와 본문 토큰 스트림을 분리해서 받음
+            report_header, body_stream = bot.stream_final_analysis(
+                session.user_data
                 )
 
-            # 2. 대화 기록에는 전체 내용을 합쳐서 저장 (수정)
-            final_report_for_history = report_header + report_body
-            st.session_state.messages.append({"role": "assistant", "content": final_report_for_history})
+        # 2. 화면에는 분리해서 출력
+        # HTML 헤더 출력
+        st.markdown(report_header, unsafe_allow_html=True)
+        # Markdown 본문은 생성되는 대로 출력
+        report_body = st.write_stream(body_stream)
 
-            # 3. 화면에는 분리해서 출력 (수정)
-            # HTML 헤더 출력
-            st.markdown(report_header, unsafe_allow_html=True)
-            # Markdown 본문 출력
-            st.markdown(report_body)
-    st.session_state.phase = "finished"
+        # 3. 대화 기록에는 전체 내용을 합쳐서 저장
+        final_report_for_history = report_header + report_body
+        session.messages.append({"role": "assistant", "content": final_report_for_history})
+    session.phase = "finished"
+    save_session()
 
 # 5단계: 종료
-if st.session_state.phase == "finished":
+if session.phase == "finished":
     st.info("상담이 종료되었습니다. 이 내용이 마음에 조금이나마 도움이 되었기를 바랍니다.")
 
-    # PDF 생성 및 다운로드 기능 추가
+    # PDF 생성 및 다운로드 기능 추가 (렌더링은 백그라운드 프로세스 풀에서 진행)
     if st.button("진단 결과서 PDF 문서화 생성"):
-        with st.spinner("PDF 보고서를 생성하고 있습니다..."):
-            try:
-                # 1. 보고서 데이터 요약
-                report_data = st.session_state.bot.summarize_for_report(st.session_state.user_data, st.session_state.bot.score)
-                
-
-                # 2. PDF 파일 생성
-                pdf_path = "우울증_자가_진단_결과서.pdf"
-                success = st.session_state.bot.create_report_pdf(report_data, pdf_path)
-
-                if success and os.path.exists(pdf_path):
-                    # 3. 다운로드 버튼 제공
-                    with open(pdf_path, "rb") as f:
-                        pdf_bytes = f.read()
-
-                    st.download_button(
-                        label="여기를 클릭하여 PDF 다운로드",
-                        data=pdf_bytes,
-                        file_name=f"{st.session_state.user_data.get('이름', '사용자')}_우울증_진단결과서.pdf",
-                        mime="application/pdf"
-                    )
-                else:
-                    st.error("PDF 파일 생성에 실패했습니다.")
-            except Exception as e:
-                st.error(f"PDF 생성 중 오류가 발생했습니다: {e}")
\ No newline at end of file
+        bot = get_bot()
+        try:
+            # 1. 보고서 데이터 요약 (최종 분석 때 캐시된 내용 사용)
+            report_data = bot.summarize_for_report(session.user_data, bot.score)
+
+            # 2. PDF 렌더링 작업 등록
+            st.session_state.pdf_job = get_pdf_service().submit(report_data, bot.score)
+            st.session_state.pdf_job_started = time.time()
+            st.session_state.pdf_bytes = None
+        except PdfServiceBusy as e:
+            st.warning(str(e))
+        except Exception as e:
+            st.error(f"PDF 생성 중 오류가 발생했습니다: {e}")
+
+    # 작업이 진행 중일 때만 주기적으로 상태를 확인
+    pdf_pending = st.session_state.get("pdf_job") is not None
+
+    @st.fragment(run_every=0.5 if pdf_pending else None)
+    def pdf_download_section():
+        job_id = st.session_state.get("pdf_job")
+        if job_id is not None:
+            status = get_pdf_service().poll(job_id)
+            if status["status"] == "done":
+                st.session_state.pdf_job = None
+                st.session_state.pdf_bytes = status["result"]
+                st.rerun()
+            elif status["status"] in ("failed", "unknown"):
+                st.session_state.pdf_job = None
+                st.error(f"PDF 생성 중 오류가 발생했습니다: {status.get('error', '작업을 찾을 수 없습니다.')}")
+            else:
+                elapsed = time.time() - st.session_state.pdf_job_started
+                state_text = "대기 중" if status["status"] == "pending" else "생성 중"
+                st.info(f"PDF 보고서를 {state_text}입니다... ({elapsed:.0f}초)")
+
+        # 3. 다운로드 버튼 제공
+        if st.session_state.get("pdf_bytes"):
+            st.download_button(
+                label="여기를 클릭하여 PDF 다운로드",
+                data=st.session_state.pdf_bytes,
+                file_name=f"{session.user_data.get('이름', '사용자')}_우울증_진단결과서.pdf",
+                mime="application/pdf"
+            )
+
+    pdf_download_section()
+
+    # 쿠키의 세션 대신 새 세션으로 처음부터 시작
+    if st.button("새 상담 시작하기"):
+        for key in ("session", "bot", "pdf_job", "pdf_bytes"):
+            st.session_state.pop(key, None)
+        st.session_state.start_new_session = True
+        st.rerun()
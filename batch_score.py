@@ -0,0 +1,210 @@
+"""
+보관된 상담 기록을 Streamlit 없이 일괄 채점하는 CLI입니다.
+
+입력 JSONL (한 줄에 한 세션):
+    {"session_id": "s1",
+     "user_data": {"이름": ..., "나이": ..., "성별": ..., "주요 증상": ..., "과거 병력": ...},
+     "answers": [{"question": "...", "answer": "..."}, ...],
+     "narrative": "..."}
+
+사용법:
+    python batch_score.py sessions.jsonl results.jsonl --concurrency 32
+    python batch_score.py sessions.jsonl results.jsonl --report --pdf-dir reports/
+
+출력 파일이 체크포인트 역할을 합니다. 다시 실행하면 이미 성공한 세션은 건너뛰고 이어서 처리합니다.
+실행 중에는 결과를 끝나는 대로 덧붙이고, 실행이 끝나면 session_id마다 한 줄(성공한 결과가 있으면 그것, 없으면 마지막 오류)만
+남도록 입력 순서대로 다시 씁니다.
+LLM 호출의 일시적 오류는 클라이언트(llm_client.ResilientChatModel)가 재시도하므로 여기서 다시 재시도하지 않습니다.
+그래도 실패한 세션은 오류와 함께 기록되며, 다시 실행하면 처리됩니다.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from dotenv import load_dotenv
+from model import EmotionBasedPsychotherapy
+
+
+def read_sessions(input_path):
+    with open(input_path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def read_completed_ids(output_path):
+    """출력 파일에서 오류 없이 끝난 세션 ID를 읽어옵니다. (마지막 줄이 잘린 경우는 무시)"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "error" not in record:
+                completed.add(record["session_id"])
+    return completed
+
+
+def compact_results(output_path, sessions):
+    """
+    결과 파일을 session_id마다 한 줄로 정리합니다. (이전 실행의 오류 줄과 재실행한 성공 줄이 함께 남지 않도록)
+    성공한 결과를 오류보다 우선하고, 같은 종류면 나중 줄을 남깁니다. 임시 파일에 쓴 뒤 교체하므로 중간에 멈춰도 원본은 그대로입니다.
+    """
+    latest = {}
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # 중단되며 잘린 줄
+            previous = latest.get(record["session_id"])
+            if previous is None or "error" in previous or "error" not in record:
+                latest[record["session_id"]] = record
+
+    order = [session["session_id"] for session in sessions]
+    known = set(order)
+    # 입력에서 빠진 세션의 결과도 버리지 않고 뒤에 남김
+    order += [session_id for session_id in latest if session_id not in known]
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        for session_id in order:
+            if session_id in latest:
+                out.write(json.dumps(latest.pop(session_id), ensure_ascii=False) + "\n")
+    os.replace(tmp_path, output_path)
+
+
+async def score_session(session, args, md_retriever):
+    """한 세션의 선택형 답변과 서술형 답변을 채점하고, 옵션에 따라 보고서/PDF를 생성합니다."""
+    bot = EmotionBasedPsychotherapy(None, md_retriever)
+    answers = session.get("answers", [])
+    bot.screening_questions = [item["question"] for item in answers]
+
+    scores = []
+    for item in answers:
+        # 공감 응답은 만들지 않고 채점만 (실패하면 세션 전체를 오류로 기록)
+        async for event in bot.astream_screening_step(item["answer"], reply=False, strict=True):
+            points, reason = event["points"], event["reason"]
+        scores.append({"question": item["question"], "answer": item["answer"], "points": points, "reason": reason})
+
+    user_data = dict(session.get("user_data", {}))
+    user_data["질문 총점"] = bot.score
+
+    result = {"session_id": session["session_id"], "scores": scores, "question_total": bot.score}
+
+    narrative = session.get("narrative")
+    if narrative:
+        points, reason = await bot.ascore_narrative(narrative)
+        bot.score += points
+        user_data["서술형 답변"] = narrative
+        user_data["서술형 점수"] = points
+        result["narrative_points"] = points
+        result["narrative_reason"] = reason
+    result["total"] = bot.score
+
+    if args.report:
+        report_header, report_body = await asyncio.to_thread(bot.generate_final_analysis, user_data)
+        report_data = bot.summarize_for_report(user_data, bot.score)
+        result["analysis"] = report_body
+        result["report"] = report_data
+
+        if args.pdf_dir:
+            pdf_path = os.path.join(args.pdf_dir, f"{session['session_id']}.pdf")
+            await asyncio.to_thread(bot.create_report_pdf, report_data, pdf_path)
+            result["pdf"] = pdf_path
+
+    return result
+
+
+class Progress:
+    """처리량과 남은 시간을 주기적으로 stderr에 출력합니다."""
+
+    def __init__(self, total, interval=2.0):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.interval = interval
+        self._last = 0.0
+
+    def update(self, failed=False):
+        self.done += 1
+        self.failed += int(failed)
+        now = time.monotonic()
+        if now - self._last < self.interval and self.done < self.total:
+            return
+        self._last = now
+        elapsed = now - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else float("inf")
+        print(f"[{self.done}/{self.total}] 실패 {self.failed}건, {rate:.1f} 세션/초, 경과 {elapsed:.0f}초, 남은 시간 {eta:.0f}초",
+              file=sys.stderr)
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        print(f"완료: {self.done}개 세션 (실패 {self.failed}건), {elapsed:.1f}초, 평균 {rate:.1f} 세션/초", file=sys.stderr)
+
+
+async def run(args):
+    sessions = read_sessions(args.input)
+    if args.overwrite and os.path.exists(args.output):
+        os.remove(args.output)
+    completed = read_completed_ids(args.output)
+    pending = [s for s in sessions if s["session_id"] not in completed]
+    print(f"전체 {len(sessions)}개 세션 중 {len(completed)}개 완료, {len(pending)}개 처리 예정", file=sys.stderr)
+
+    md_retriever = None
+    if args.report:
+        from data_loader import load_markdown_retriever
+        md_retriever = load_markdown_retriever()
+        if args.pdf_dir:
+            os.makedirs(args.pdf_dir, exist_ok=True)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    progress = Progress(len(pending))
+
+    with open(args.output, "a", encoding="utf-8") as out:
+        async def worker(session):
+            async with semaphore:
+                try:
+                    result = await score_session(session, args, md_retriever)
+                except Exception as e:
+                    result = {"session_id": session["session_id"], "error": str(e)}
+            # 결과는 끝나는 대로 한 줄씩 기록 (중단되어도 여기까지가 체크포인트)
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            progress.update(failed="error" in result)
+
+        await asyncio.gather(*(worker(s) for s in pending))
+
+    compact_results(args.output, sessions)
+    progress.summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="보관된 상담 기록을 일괄 채점합니다.")
+    parser.add_argument("input", help="세션 JSONL 파일")
+    parser.add_argument("output", help="결과 JSONL 파일 (체크포인트 겸용)")
+    parser.add_argument("--concurrency", type=int, default=16, help="동시에 처리할 최대 세션 수")
+    parser.add_argument("--report", action="store_true", help="최종 분석과 보고서 항목도 생성")
+    parser.add_argument("--pdf-dir", help="지정하면 세션별 PDF 보고서를 이 디렉터리에 저장 (--report 필요)")
+    parser.add_argument("--overwrite", action="store_true", help="기존 결과를 지우고 처음부터 다시 실행")
+    parser.add_argument("--rate-limit", type=float,
+                        help="프로세스 전체의 초당 LLM 요청 수 제한 (기본: LLM_RATE_LIMIT 환경 변수, 없으면 제한 없음)")
+    args = parser.parse_args()
+
+    if args.pdf_dir and not args.report:
+        parser.error("--pdf-dir는 --report와 함께 사용해야 합니다.")
+
+    load_dotenv()
+    if args.rate_limit is not None:
+        # 공유 LLM 클라이언트는 첫 세션에서 만들어지므로 그 전에 설정
+        os.environ["LLM_RATE_LIMIT"] = str(args.rate_limit)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+API 사용량 없이 처리량과 성능 회귀를 재는 벤치마크입니다.
+
+로컬 가짜 Upstage 서버(fake_upstage.py)를 같은 프로세스에 띄워 LLM과 임베딩을 대신하고,
+EmotionBasedPsychotherapy로 N개의 세션을 동시에 끝까지 진행합니다.
+(선별 질문 → 서술형 채점 → 최종 분석 스트리밍 → 보고서 요약 → PDF 렌더링)
+
+측정 항목
+- 초당 완료 세션 수, 세션 지연 시간
+- 단계별 지연 시간 백분위수 (telemetry의 span 기준)
+- 최대 RSS (본 프로세스, PDF 워커 프로세스)
+- 콜드 스타트 시간 (load_emotion_data, load_markdown_retriever, load_example_selector)
+
+인덱스와 캐시는 임시 작업 디렉터리에서 새로 만들므로 data/index의 실제 인덱스는 건드리지 않습니다.
+감성대화 원본 JSON이 없으면 고정된 시드로 만든 합성 말뭉치를 사용합니다.
+
+사용법:
+    python benchmark.py --sessions 50 --concurrency 10 --output bench/result.json
+    python benchmark.py --latency 0.3 --pro-latency 2 --distribution lognormal --baseline bench/result.json
+
+결과는 JSON 파일로 저장하며(커밋 해시 포함), --baseline을 주면 이전 결과와 비교해 출력합니다.
+"""
+import os
+import json
+import time
+import random
+import shutil
+import platform
+import resource
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_upstage import LATENCY_DISTRIBUTIONS, make_server
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULT_FORMAT = 1
+SYNTHETIC_EMOTIONS = ["분노", "슬픔", "불안", "상처", "당황", "기쁨"]
+
+# 사전 채점기(risk_prescorer)에 걸리지 않는 애매한 답변만 사용해 모든 채점이 LLM을 거치게 합니다.
+ANSWER_TEMPLATES = [
+    "요즘 {n}주째 잠들기가 어렵고 아침에 일어나기가 버거운 편이에요.",
+    "예전만큼 재미있는 일이 별로 없고 {n}번 정도 약속도 미뤘어요.",
+    "입맛이 조금 줄었는데 이게 계절 탓인지 잘 모르겠어요. ({n})",
+    "일에 집중하려고 해도 자꾸 다른 생각이 나서 {n}시간씩 멍하게 있을 때가 있어요.",
+    "가끔은 제가 쓸모없는 사람처럼 느껴지는 날도 있어요. 이번 주에는 {n}번쯤요.",
+]
+NARRATIVE_TEMPLATE = (
+    "최근 {n}주 동안 회사 일이 많아서 지친 상태로 지냈습니다. 주말에도 누워만 있게 되고 "
+    "친구들 연락에 답장하는 것도 미루게 돼요. 이러다 나아질지 걱정이 됩니다."
+)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_synthetic_emotion_json(path, rows, seed):
+    """감성대화 말뭉치와 같은 형식의 합성 데이터를 만듭니다."""
+    rng = random.Random(seed)
+    data = []
+    for i in range(rows):
+        emotion = rng.choice(SYNTHETIC_EMOTIONS)
+        data.append({
+            "감정_대분류": emotion,
+            "사람문장1": f"요즘 {emotion} 감정이 자주 들어요. ({i})",
+            "시스템문장1": "그런 감정이 드셨군요. 어떤 일이 있었는지 조금 더 이야기해 주시겠어요?",
+            "사람문장2": "별일은 없는데 마음이 계속 무거워요.",
+            "시스템문장2": "이유를 모르는 무거움도 충분히 힘들 수 있어요.",
+        })
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def prepare_workspace(args):
+    """임시 작업 디렉터리에 data/를 구성하고 그 디렉터리로 이동합니다. (인덱스는 여기서 새로 생성)"""
+    workspace = tempfile.mkdtemp(prefix="bench-")
+    os.makedirs(os.path.join(workspace, "data", "index"))
+    os.symlink(os.path.abspath(args.markdown), os.path.join(workspace, "data", "depression.md"))
+    if os.path.isdir(os.path.join(REPO_DIR, "font")):
+        os.symlink(os.path.join(REPO_DIR, "font"), os.path.join(workspace, "font"))
+
+    from emotion_corpus import EMOTION_JSON_PATH
+    source_json = os.path.join(REPO_DIR, EMOTION_JSON_PATH)
+    target_json = os.path.join(workspace, EMOTION_JSON_PATH)
+    if os.path.exists(source_json) and not args.synthetic_corpus:
+        os.symlink(source_json, target_json)
+    else:
+        write_synthetic_emotion_json(target_json, args.corpus_rows, args.seed)
+    os.chdir(workspace)
+    return workspace
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def measure_cold_start():
+    """프로세스에서 처음 호출할 때의 로딩 시간(초)을 잽니다."""
+    from data_loader import load_emotion_data, load_markdown_retriever, load_example_selector
+    emotion_corpus, emotion_seconds = timed(load_emotion_data)
+    retriever, retriever_seconds = timed(load_markdown_retriever)
+    selector, selector_seconds = timed(load_example_selector)
+    cold_start = {
+        "load_emotion_data": emotion_seconds,
+        "load_markdown_retriever": retriever_seconds,
+        "load_example_selector": selector_seconds,
+    }
+    return (emotion_corpus, retriever, selector), cold_start
+
+
+def run_session(index, resources, pdf_service):
+    """app.py와 같은 순서로 한 세션을 끝까지 진행하고 세션 지연 시간(초)을 반환합니다."""
+    from model import EmotionBasedPsychotherapy
+    from pdf_worker import PdfServiceBusy
+    from telemetry import span
+
+    started = time.perf_counter()
+    with span("bench.session"):
+        bot = EmotionBasedPsychotherapy(*resources)
+        user_data = {"이름": f"사용자{index}", "성별": "여성" if index % 2 else "남성", "나이": 20 + index % 60,
+                     "주요 증상": "불면, 의욕 저하", "과거 병력": ""}
+        bot.state.user_data = user_data
+
+        # 2단계: 선별 질문 (공감 응답을 끝까지 받은 뒤 점수 반영)
+        while not bot.is_test_finished():
+            answer = ANSWER_TEMPLATES[bot.question_index % len(ANSWER_TEMPLATES)].format(n=index)
+            reply_stream = bot.start_screening_answer(answer)
+            if reply_stream is not None:
+                "".join(reply_stream)
+            bot.finish_screening_answer()
+        bot.start_report_prefetch(user_data)
+
+        # 3단계: 서술형 답변 채점
+        user_data["서술형 답변"] = NARRATIVE_TEMPLATE.format(n=index)
+        bot.start_report_prefetch(user_data)
+        user_data["질문 총점"] = bot.score
+        narrative = bot.score_narrative_answer(user_data["서술형 답변"])
+        user_data["서술형 점수"] = narrative.get("points", 0)
+        bot.score += user_data["서술형 점수"]
+
+        # 4단계: 최종 분석 스트리밍
+        _, body_stream = bot.stream_final_analysis(user_data)
+        "".join(body_stream)
+
+        # 5단계: 보고서 요약과 PDF 렌더링
+        report_data = bot.summarize_for_report(user_data, bot.score)
+        while True:
+            try:
+                job_id = pdf_service.submit(report_data, bot.score)
+                break
+            except PdfServiceBusy:
+                time.sleep(0.05)
+        while True:
+            status = pdf_service.poll(job_id)
+            if status["status"] == "done":
+                break
+            if status["status"] in ("failed", "unknown"):
+                raise RuntimeError(f"PDF 생성 실패: {status.get('error')}")
+            time.sleep(0.02)
+    return time.perf_counter() - started
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def run_benchmark(args):
+    from pdf_worker import get_pdf_service
+    from telemetry import telemetry
+
+    resources, cold_start = measure_cold_start()
+    cold_stages = telemetry.summary()
+    telemetry.reset()
+
+    pdf_service = get_pdf_service()
+    latencies = []
+    errors = []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="bench") as pool:
+        futures = [pool.submit(run_session, i, resources, pdf_service) for i in range(args.sessions)]
+        for future in futures:
+            try:
+                latencies.append(future.result())
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+    elapsed = time.perf_counter() - started
+    pdf_service.shutdown()
+
+    latencies.sort()
+    counters = telemetry.counter_values()
+    cache = {dict(labels)["result"]: value for (name, labels), value in counters.items()
+             if name == "llm_cache_requests_total"}
+    return {
+        "format": RESULT_FORMAT,
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "sessions_completed": len(latencies),
+        "sessions_failed": len(errors),
+        "errors": errors[:10],
+        "elapsed_seconds": elapsed,
+        "sessions_per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "session_latency": {"p50": percentile(latencies, 0.5), "p95": percentile(latencies, 0.95),
+                            "p99": percentile(latencies, 0.99), "max": latencies[-1] if latencies else None},
+        "stages": telemetry.summary(),
+        "cold_start_seconds": cold_start,
+        "cold_start_stages": cold_stages,
+        "cache_requests": cache,
+        "counters": [{"name": name, "labels": dict(labels), "value": value}
+                     for (name, labels), value in sorted(counters.items())],
+        # 리눅스에서 ru_maxrss 단위는 KB (PDF 워커는 종료된 뒤에 RUSAGE_CHILDREN에 반영)
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_rss_children_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+def print_result(result, baseline=None):
+    def change(new, old):
+        if new is None or not old:
+            return ""
+        return f" ({(new - old) / old:+.1%})"
+
+    old = baseline or {}
+    print(f"\n세션 {result['sessions_completed']}개 완료, 실패 {result['sessions_failed']}개, "
+          f"{result['elapsed_seconds']:.1f}초")
+    print(f"처리량: {result['sessions_per_second']:.2f} 세션/초"
+          f"{change(result['sessions_per_second'], old.get('sessions_per_second'))}")
+    p95 = result["session_latency"]["p95"]
+    print(f"세션 지연 p50 {result['session_latency']['p50'] or 0:.2f}초, p95 {p95 or 0:.2f}초"
+          f"{change(p95, old.get('session_latency', {}).get('p95'))}")
+    print(f"최대 RSS: {result['peak_rss_mb']:.0f}MB{change(result['peak_rss_mb'], old.get('peak_rss_mb'))}, "
+          f"PDF 워커 {result['peak_rss_children_mb']:.0f}MB")
+    for name, seconds in result["cold_start_seconds"].items():
+        print(f"콜드 스타트 {name}: {seconds:.2f}초{change(seconds, old.get('cold_start_seconds', {}).get(name))}")
+
+    old_stages = {row["stage"]: row for row in old.get("stages", [])}
+    print(f"\n{'단계':<45}{'호출':>7}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    for row in result["stages"]:
+        old_p95 = old_stages.get(row["stage"], {}).get("p95")
+        print(f"{row['stage']:<45}{row['count']:>7}{row['p50'] * 1000:>10.1f}{row['p95'] * 1000:>10.1f}"
+              f"{row['p99'] * 1000:>10.1f}{change(row['p95'], old_p95)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="가짜 LLM/임베딩으로 전체 세션 처리량을 측정합니다.")
+    parser.add_argument("--sessions", type=int, default=20, help="진행할 세션 수")
+    parser.add_argument("--concurrency", type=int, default=5, help="동시에 진행할 세션 수")
+    parser.add_argument("--latency", type=float, default=0.2, help="solar-mini/임베딩 평균 지연(초)")
+    parser.add_argument("--pro-latency", type=float, default=1.0, help="solar-pro 평균 지연(초)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="지연 표준편차 (평균 대비 비율)")
+    parser.add_argument("--distribution", choices=LATENCY_DISTRIBUTIONS, default="normal", help="지연 시간 분포")
+    parser.add_argument("--token-interval", type=float, default=0.01, help="스트리밍 청크 간격(초)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="가짜 서버가 503을 돌려줄 확률")
+    parser.add_argument("--score", type=int, default=1, help="가짜 채점 응답의 점수 (0-3)")
+    parser.add_argument("--dim", type=int, default=256, help="가짜 임베딩 차원")
+    parser.add_argument("--seed", type=int, default=0, help="가짜 서버 지연/오류와 합성 말뭉치의 시드")
+    parser.add_argument("--retrieval-mode", default="hybrid", help="RAG_RETRIEVAL_MODE (hybrid/lexical/vector)")
+    parser.add_argument("--markdown", default=os.path.join(REPO_DIR, "data", "depression.md"), help="RAG 문서 경로")
+    parser.add_argument("--synthetic-corpus", action="store_true", help="원본이 있어도 합성 감성대화 말뭉치 사용")
+    parser.add_argument("--corpus-rows", type=int, default=2000, help="합성 감성대화 말뭉치 행 수")
+    parser.add_argument("--output", default="benchmark_result.json", help="결과 JSON 저장 경로")
+    parser.add_argument("--baseline", help="비교할 이전 결과 JSON 경로")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    server = make_server("127.0.0.1", 0, latency=args.latency, pro_latency=args.pro_latency, jitter=args.jitter,
+                         distribution=args.distribution, token_interval=args.token_interval,
+                         error_rate=args.error_rate, score=args.score, dim=args.dim, seed=args.seed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # 모델/데이터 모듈을 불러오기 전에 가짜 서버와 벤치마크용 설정을 지정
+    os.environ["UPSTAGE_API_BASE"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    os.environ["UPSTAGE_API_KEY"] = "fake"
+    os.environ["RAG_RETRIEVAL_MODE"] = args.retrieval_mode
+
+    workspace = prepare_workspace(args)
+    try:
+        result = run_benchmark(args)
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workspace, ignore_errors=True)
+        server.shutdown()
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print_result(result, baseline)
+    print(f"\n결과 저장: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+배포 전에 미리 실행하는 오프라인 인덱스 빌드 스크립트입니다.
+
+사용법:
+    python build_index.py              # 전체 빌드
+    python build_index.py markdown     # data/의 Markdown/docx 문서로 RAG 벡터 인덱스 + BM25 역색인
+    python build_index.py lexical      # RAG BM25 역색인만 (네트워크 호출 없음)
+    python build_index.py markdown --watch  # 빌드 후 data/를 감시하며 바뀐 문서만 다시 색인
+    python build_index.py emotion      # 감성대화 컬럼 캐시만
+    python build_index.py emotion-vectors  # 감성대화 예시 검색용 임베딩 행렬 (emotion 이후)
+
+UPSTAGE_API_KEY는 .env 파일 또는 환경 변수에서 읽습니다.
+"""
+import argparse
+from dotenv import load_dotenv
+from data_loader import (DATA_DIR, CHROMA_DIR, LEXICAL_INDEX_PATH, MANIFEST_PATH, EMBEDDING_MODEL,
+                         ingest_documents, watch_documents)
+from emotion_corpus import EMOTION_JSON_PATH, EMOTION_CACHE_PATH, EmotionCorpus, convert_emotion_data
+from example_selector import EMOTION_VECTORS_PATH, build_emotion_vectors
+from langchain_upstage import UpstageEmbeddings
+
+TARGETS = ["markdown", "lexical", "emotion", "emotion-vectors"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG 인덱스와 데이터 캐시를 미리 빌드합니다.")
+    parser.add_argument("targets", nargs="*", choices=TARGETS, help="빌드할 대상 (기본값: 전체)")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="인덱싱할 Markdown/docx 문서 디렉터리")
+    parser.add_argument("--chroma-dir", default=CHROMA_DIR, help="Chroma 인덱스를 저장할 디렉터리")
+    parser.add_argument("--lexical-index", default=LEXICAL_INDEX_PATH, help="BM25 역색인 저장 경로")
+    parser.add_argument("--manifest", default=MANIFEST_PATH, help="문서별 내용 해시 매니페스트 저장 경로")
+    parser.add_argument("--emotion-json", default=EMOTION_JSON_PATH, help="감성대화 말뭉치 원본 JSON 경로")
+    parser.add_argument("--emotion-cache", default=EMOTION_CACHE_PATH, help="감성대화 컬럼 캐시 저장 경로")
+    parser.add_argument("--emotion-vectors", default=EMOTION_VECTORS_PATH, help="감성대화 임베딩 행렬 저장 경로")
+    parser.add_argument("--watch", action="store_true", help="빌드 후 문서 변경을 감시하며 계속 다시 색인")
+    args = parser.parse_args()
+    targets = args.targets or TARGETS
+
+    load_dotenv()
+    if "markdown" in targets or "lexical" in targets:
+        # markdown 대상은 BM25 역색인도 함께 갱신합니다.
+        ingest_documents(args.data_dir, args.chroma_dir, args.lexical_index, args.manifest,
+                         vectors="markdown" in targets)
+    if "emotion" in targets:
+        convert_emotion_data(args.emotion_json, args.emotion_cache)
+    if "emotion-vectors" in targets:
+        corpus = EmotionCorpus.open(args.emotion_cache)
+        build_emotion_vectors(corpus, UpstageEmbeddings(model=EMBEDDING_MODEL), args.emotion_vectors)
+    if args.watch:
+        print(f"{args.data_dir} 문서 변경을 감시합니다. (Ctrl+C로 종료)")
+        watch_documents(None, "hybrid" if "markdown" in targets else "lexical", args.data_dir,
+                        chroma_dir=args.chroma_dir, index_path=args.lexical_index, manifest_path=args.manifest)
+
+
+if __name__ == "__main__":
+    main()
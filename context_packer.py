@@ -0,0 +1,138 @@
+"""
+보고서 프롬프트에 넣을 검색 결과와 서술형 답변을 토큰 예산 안으로 맞추는 모듈입니다.
+
+- 토큰 수는 solar-pro 토크나이저(Hugging Face upstage/solar-pro-tokenizer)로 셉니다.
+  요청 경로에서 네트워크를 기다리지 않도록 로컬 Hugging Face 캐시에 있을 때만 사용하고,
+  없으면 글자 수 기반 추정치를 사용합니다. (배포 시 huggingface-cli download upstage/solar-pro-tokenizer)
+- 청크 분할 시 겹치는 구간(CHUNK_OVERLAP)은 앞 청크와 이어지는 부분을 잘라내고,
+  이미 넣은 내용과 거의 같은 청크는 제외합니다.
+- 검색 순위(관련도) 순서대로 예산이 남는 만큼 채우고, 빠진 청크는 로그로 남깁니다.
+- 너무 긴 서술형 답변은 앞/뒤 부분만 남기고 가운데를 생략합니다.
+
+환경 변수
+- RAG_CONTEXT_TOKENS: 검색 결과에 쓸 토큰 예산, 기본 1200
+- NARRATIVE_TOKENS  : 서술형 답변에 쓸 토큰 예산, 기본 500
+"""
+import os
+import functools
+
+DEFAULT_CONTEXT_TOKENS = 1200
+DEFAULT_NARRATIVE_TOKENS = 500
+TOKENIZER_NAME = "upstage/solar-pro-tokenizer"
+# 이미 넣은 내용과 3-gram이 이 비율 이상 겹치면 중복으로 봅니다.
+DUPLICATE_CONTAINMENT = 0.8
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 120
+TRUNCATION_MARK = " …(중략)… "
+
+
+@functools.lru_cache(maxsize=1)
+def _load_tokenizer():
+    try:
+        from huggingface_hub import try_to_load_from_cache
+        from tokenizers import Tokenizer
+        path = try_to_load_from_cache(TOKENIZER_NAME, "tokenizer.json")
+        if not isinstance(path, str):
+            raise FileNotFoundError(f"{TOKENIZER_NAME}이(가) 로컬 캐시에 없습니다.")
+        return Tokenizer.from_file(path)
+    except Exception as e:
+        print(f"토크나이저를 불러올 수 없어 글자 수로 토큰을 추정합니다: {e}")
+        return None
+
+
+def count_tokens(text):
+    """solar 토크나이저 기준 토큰 수 (토크나이저가 없으면 한글 1글자≈1토큰, 그 외 4글자≈1토큰으로 추정)"""
+    if not text:
+        return 0
+    tokenizer = _load_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    hangul = sum(1 for ch in text if "가" <= ch <= "힣")
+    return hangul + (len(text) - hangul + 3) // 4
+
+
+def _shingles(text, n=3):
+    text = "".join(text.split())
+    return {text[i:i + n] for i in range(max(len(text) - n + 1, 1))}
+
+
+def _strip_overlap(other, text):
+    """분할 시 생긴 겹침(overlap)이 있으면, other와 이어지는 text의 앞/뒤 부분을 잘라낸 text를 반환합니다."""
+    for size in range(min(MAX_OVERLAP_CHARS, len(other), len(text)), MIN_OVERLAP_CHARS - 1, -1):
+        if other.endswith(text[:size]):
+            return text[size:].lstrip()
+        if other.startswith(text[-size:]):
+            return text[:-size].rstrip()
+    return text
+
+
+def _token_limit(text, budget):
+    """text 앞부분 중 budget 토큰 안에 들어가는 가장 긴 길이(글자 수)"""
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(text[:mid]) <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def truncate_text(text, max_tokens):
+    """max_tokens를 넘으면 앞 2/3, 뒤 1/3만 남기고 가운데를 생략합니다. (잘렸는지 여부를 함께 반환)"""
+    text = text or ""
+    if count_tokens(text) <= max_tokens:
+        return text, False
+
+    head_budget = max_tokens * 2 // 3
+    tail_budget = max_tokens - head_budget - count_tokens(TRUNCATION_MARK)
+    head = text[:_token_limit(text, head_budget)]
+    reversed_tail = text[::-1]
+    tail = reversed_tail[:_token_limit(reversed_tail, max(tail_budget, 0))][::-1]
+    return head.rstrip() + TRUNCATION_MARK + tail.lstrip(), True
+
+
+def pack_documents(docs, max_tokens=None):
+    """
+    검색된 Document들을 관련도 순서대로 토큰 예산 안에 채워 하나의 문자열로 만듭니다.
+    겹치는 구간과 거의 같은 청크는 제외하고, 제외한 내역을 출력합니다.
+    """
+    if max_tokens is None:
+        max_tokens = int(os.environ.get("RAG_CONTEXT_TOKENS", DEFAULT_CONTEXT_TOKENS))
+
+    selected = []
+    seen = set()
+    used_tokens = 0
+    duplicates = over_budget = 0
+    for doc in docs:
+        text = doc.page_content.strip()
+        for other in selected:
+            text = _strip_overlap(other, text)
+        shingles = _shingles(text)
+        if not text or len(shingles & seen) / len(shingles) >= DUPLICATE_CONTAINMENT:
+            duplicates += 1
+            continue
+
+        tokens = count_tokens(text)
+        if used_tokens + tokens > max_tokens:
+            over_budget += 1
+            continue
+
+        selected.append(text)
+        seen |= shingles
+        used_tokens += tokens
+
+    if duplicates or over_budget:
+        print(f"검색 결과 압축: {len(docs)}개 중 {len(selected)}개 사용 ({used_tokens}/{max_tokens} 토큰), "
+              f"중복 {duplicates}개, 예산 초과 {over_budget}개 제외")
+    return "\n".join(selected)
+
+
+def pack_narrative(text, max_tokens=None):
+    """서술형 답변을 토큰 예산에 맞게 줄입니다."""
+    if max_tokens is None:
+        max_tokens = int(os.environ.get("NARRATIVE_TOKENS", DEFAULT_NARRATIVE_TOKENS))
+    packed, truncated = truncate_text(text, max_tokens)
+    if truncated:
+        print(f"서술형 답변이 길어 가운데를 생략했습니다: {count_tokens(text)} → {count_tokens(packed)} 토큰")
+    return packed
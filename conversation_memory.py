@@ -0,0 +1,108 @@
+"""
+공감 응답과 최종 분석 프롬프트에 넣을 대화 기억을 일정한 토큰 예산 안으로 유지하는 모듈입니다.
+
+- 최근 MEMORY_RECENT_TURNS턴(사용자 답변 + 상담사 응답)은 그대로 보관합니다.
+- 그보다 오래된 턴은 기록에서 빼내 기존 요약과 합쳐 한 번 더 요약합니다. (점진적 요약)
+  요약은 solar-mini로 만들고, 실패하면 앞/뒤만 남기는 방식으로 줄여 예산을 지킵니다.
+- 프롬프트에 넣을 때는 요약 + 최근 대화를 최신 턴부터 예산이 남는 만큼 채웁니다.
+따라서 대화가 길어져도 세션 상태와 프롬프트 크기는 일정하게 유지됩니다.
+
+환경 변수
+- MEMORY_RECENT_TURNS  : 그대로 보관할 최근 턴 수, 기본 3
+- MEMORY_RECENT_TOKENS : 프롬프트에 넣을 최근 대화의 토큰 예산, 기본 600
+- MEMORY_SUMMARY_TOKENS: 이전 대화 요약의 토큰 예산, 기본 300
+"""
+import os
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from context_packer import count_tokens, truncate_text
+
+DEFAULT_RECENT_TURNS = 3
+DEFAULT_RECENT_TOKENS = 600
+DEFAULT_SUMMARY_TOKENS = 300
+ROLE_LABELS = {"user": "사용자", "assistant": "상담사"}
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def render_turns(history):
+    """대화 기록을 '- 사용자: ...' 형식의 줄로 바꿉니다."""
+    return "\n".join(f"- {ROLE_LABELS.get(m['role'], m['role'])}: {m['content']}" for m in history)
+
+
+def split_history(history, recent_turns=None):
+    """
+    대화 기록을 (요약으로 넘길 오래된 메시지, 그대로 둘 최근 메시지)로 나눕니다.
+    최근 recent_turns턴(메시지 2개씩)을 넘는 부분만 오래된 메시지로 봅니다.
+    """
+    if recent_turns is None:
+        recent_turns = _env_int("MEMORY_RECENT_TURNS", DEFAULT_RECENT_TURNS)
+    keep = max(recent_turns, 0) * 2
+    if len(history) <= keep:
+        return [], list(history)
+    cut = len(history) - keep
+    return list(history[:cut]), list(history[cut:])
+
+
+def _build_summary_messages(summary, evicted, max_tokens):
+    system_prompt = f"""
+    당신은 심리 상담 기록을 정리하는 보조자입니다. 기존 요약과 새로 추가된 대화를 합쳐 하나의 요약으로 다시 써주세요.
+    - 사용자가 말한 감정, 증상, 생활 상황, 위험 신호(자해/자살 관련 언급)를 빠짐없이 남기세요.
+    - 상담사의 공감 표현이나 질문 문구는 생략하세요.
+    - 한국어로 {max_tokens}토큰 이내의 짧은 문단으로 작성하고, 요약 외의 말은 덧붙이지 마세요.
+    """
+    human_prompt = f"""
+    ### 기존 요약
+    {summary or "(없음)"}
+
+    ### 새로 추가된 대화
+    {render_turns(evicted)}
+    """
+    return [SystemMessage(content=system_prompt), HumanMessage(content=human_prompt)]
+
+
+def fold_summary(llm, summary, evicted, max_tokens=None):
+    """오래된 메시지를 기존 요약에 합친 새 요약을 반환합니다. (항상 max_tokens 이내)"""
+    if max_tokens is None:
+        max_tokens = _env_int("MEMORY_SUMMARY_TOKENS", DEFAULT_SUMMARY_TOKENS)
+    if not evicted:
+        return summary
+    try:
+        response = llm.invoke(_build_summary_messages(summary, evicted, max_tokens),
+                              model="solar-mini", temperature=0.3)
+        folded = response.content.strip()
+    except Exception as e:
+        print(f"대화 요약 실패, 앞/뒤 부분만 남깁니다: {e}")
+        folded = "\n".join(part for part in (summary, render_turns(evicted)) if part)
+    return truncate_text(folded, max_tokens)[0]
+
+
+def render_memory(summary, history, max_tokens=None):
+    """
+    이전 대화 요약과 최근 대화를 프롬프트용 문자열로 만듭니다.
+    최근 대화는 최신 메시지부터 max_tokens가 남는 만큼만 넣습니다.
+    (가장 최근 메시지 하나가 예산을 넘으면 앞/뒤만 남기고, 그보다 오래된 메시지는 넣지 않습니다)
+    """
+    if max_tokens is None:
+        max_tokens = _env_int("MEMORY_RECENT_TOKENS", DEFAULT_RECENT_TOKENS)
+
+    lines = []
+    remaining = max_tokens
+    for message in reversed(history):
+        line = render_turns([message])
+        cost = count_tokens(line)
+        if cost > remaining:
+            if not lines:
+                lines.append(truncate_text(line, remaining)[0])
+            break
+        lines.append(line)
+        remaining -= cost
+
+    sections = []
+    if summary:
+        sections.append(f"이전 대화 요약: {summary}")
+    if lines:
+        sections.append("최근 대화:\n" + "\n".join(reversed(lines)))
+    return "\n".join(sections)
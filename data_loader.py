@@ -1,13 +1,42 @@
 from dotenv import load_dotenv
-from openai import OpenAI
 import os
-import pandas as pd
+import sys
 import json
-from langchain_community.document_loaders import TextLoader
-from langchain_text_splitters import MarkdownTextSplitter
-from langchain_upstage import UpstageEmbeddings
-from langchain_chroma import Chroma
+import atexit
+import hashlib
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
+from langchain_core.documents import Document
+from langchain_text_splitters import MarkdownHeaderTextSplitter, MarkdownTextSplitter
 import streamlit as st
+from emotion_corpus import EMOTION_JSON_PATH, EMOTION_CACHE_PATH, EmotionCorpus, convert_emotion_data
+from example_selector import EMOTION_VECTORS_PATH, FewShotSelector
+from llm_cache import CachedEmbeddings, get_response_cache
+from lexical_index import BM25Index, HybridRetriever, LiveRetriever, RETRIEVAL_MODES, section_audience
+from telemetry import traced, span
+
+# RAG 인덱스 설정 (값을 바꾸면 청크 해시가 달라져 해당 청크만 다시 임베딩됩니다)
+DATA_DIR = "data"
+MARKDOWN_PATH = os.path.join(DATA_DIR, "depression.md")
+DOCUMENT_SUFFIXES = (".md", ".docx")
+# 내용 없는 양식 문서는 색인하지 않음 (환경 변수 RAG_EXCLUDE_DOCUMENTS에 쉼표로 구분한 파일명으로 바꿀 수 있음)
+EXCLUDED_DOCUMENTS = ("진료기록지.docx",)
+INDEX_DIR = os.path.join(DATA_DIR, "index")
+CHROMA_DIR = os.path.join(INDEX_DIR, "chroma")
+LEXICAL_INDEX_PATH = os.path.join(INDEX_DIR, "bm25.json")
+# 파일별 내용 해시와 청크 ID 목록 (변경된 파일만 다시 분할하기 위함)
+# 분할/임베딩 설정도 함께 저장하여, 설정이 바뀌면 모든 파일을 다시 분할합니다.
+MANIFEST_PATH = os.path.join(INDEX_DIR, "manifest.json")
+MANIFEST_FORMAT = 1
+CHROMA_COLLECTION = "depression"
+EMBEDDING_MODEL = "solar-embedding-1-large"
+CHUNK_SIZE = 300
+CHUNK_OVERLAP = 50
+# 청크 메타데이터로 남길 헤더 단계
+HEADERS_TO_SPLIT_ON = [("##", "h2"), ("###", "h3"), ("####", "h4")]
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
 
 
 def load_env():
@@ -16,43 +45,363 @@ def load_env():
 
 
 @st.cache_resource
+@traced("loader.load_emotion_data")
 def load_emotion_data():
     """
-    지정된 경로에서 감성 대화 말뭉치 JSON 파일을 로드하여 Pandas DataFrame으로 반환합니다.
+    감성 대화 말뭉치를 메모리 매핑된 EmotionCorpus로 반환합니다.
+    컬럼 캐시 파일이 없으면 원본 JSON에서 한 번 변환해 둡니다.
+    """
+    if not os.path.exists(EMOTION_CACHE_PATH):
+        convert_emotion_data(EMOTION_JSON_PATH, EMOTION_CACHE_PATH)
+    return EmotionCorpus.open(EMOTION_CACHE_PATH)
+
+
+@st.cache_resource
+@traced("loader.load_example_selector")
+def load_example_selector():
+    """
+    공감 응답용 Few-shot 예시 선택기를 반환합니다.
+    미리 계산된 감성대화 벡터가 없으면 무작위 샘플링으로 동작합니다.
     """
-    # 사용자 환경에 맞게 파일 경로를 수정해야 할 수 있습니다.
-    file_path = "data/감성대화말뭉치_최종데이터_Training.json"
+    embeddings = get_embeddings()
+    return FewShotSelector.load(load_emotion_data(), embeddings, EMOTION_VECTORS_PATH)
 
+
+def get_embeddings():
+    """쿼리 임베딩 캐시가 적용된 Upstage 임베딩 모델을 반환합니다."""
+    from langchain_upstage import UpstageEmbeddings
+    return CachedEmbeddings(UpstageEmbeddings(model=EMBEDDING_MODEL), get_response_cache(), EMBEDDING_MODEL)
+
+
+def _docx_heading_levels(archive):
+    """styles.xml에서 제목 스타일 ID → Markdown 헤더 단계 (Title → 1, heading N → N + 1)"""
+    levels = {}
     try:
-        with open(file_path, "r", encoding='utf-8') as f:
-            data = json.load(f)
-    except FileNotFoundError:
+        root = ElementTree.fromstring(archive.read("word/styles.xml"))
+    except KeyError:
+        return levels
+    for style in root.iter(f"{WORD_NS}style"):
+        name = style.find(f"{WORD_NS}name")
+        name = (name.get(f"{WORD_NS}val") if name is not None else "").lower()
+        if name == "title":
+            levels[style.get(f"{WORD_NS}styleId")] = 1
+        elif name.startswith("heading ") and name[8:].isdigit():
+            levels[style.get(f"{WORD_NS}styleId")] = int(name[8:]) + 1
+    return levels
+
+
+def read_docx(file_path):
+    """
+    docx 문서의 문단을 Markdown 텍스트로 변환합니다. (표 안의 문단 포함)
+    제목 스타일 문단은 Markdown 헤더로 바꾸어 .md 문서와 같은 방식으로 분할되게 합니다.
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        levels = _docx_heading_levels(archive)
+        root = ElementTree.fromstring(archive.read("word/document.xml"))
+
+    lines = []
+    for paragraph in root.iter(f"{WORD_NS}p"):
+        text = "".join(node.text or "" for node in paragraph.iter(f"{WORD_NS}t")).strip()
+        if not text:
+            continue
+        style = paragraph.find(f"{WORD_NS}pPr/{WORD_NS}pStyle")
+        level = levels.get(style.get(f"{WORD_NS}val")) if style is not None else None
+        lines.append(f"{'#' * min(level, 4)} {text}" if level else text)
+    return "\n\n".join(lines)
+
+
+def load_document(file_path):
+    """Markdown/docx 파일을 Document 목록으로 읽어옵니다."""
+    if not os.path.exists(file_path):
         raise FileNotFoundError(f"지정된 경로에 파일이 없습니다: {file_path}")
+    if file_path.endswith(".docx"):
+        return [Document(page_content=read_docx(file_path), metadata={"source": file_path})]
+    with open(file_path, encoding="utf-8") as f:
+        return [Document(page_content=f.read(), metadata={"source": file_path})]
+
+
+@traced("loader.split_document")
+def split_document(file_path=MARKDOWN_PATH):
+    """
+    Markdown/docx 파일을 로드하여 RAG용 청크 목록으로 분할합니다.
+    먼저 헤더(H2/H3/H4) 단위 섹션으로 나누어 헤더 경로와 대상(audience)을 메타데이터로 남기고,
+    긴 섹션은 다시 CHUNK_SIZE 크기로 나눕니다.
+    """
+    documents = load_document(file_path)
+
+    header_splitter = MarkdownHeaderTextSplitter(HEADERS_TO_SPLIT_ON, strip_headers=False)
+    sections = []
+    for document in documents:
+        for section in header_splitter.split_text(document.page_content):
+            section.metadata = {**document.metadata, **section.metadata,
+                                "audience": section_audience(section.metadata.get("h2"))}
+            sections.append(section)
 
-    df = pd.DataFrame(data)
+    # Markdown 문법 기준으로 텍스트 분할
+    markdown_splitter = MarkdownTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return markdown_splitter.split_documents(sections)
+
+
+def index_settings():
+    """청크 분할과 임베딩 결과를 바꾸는 설정 (매니페스트에 저장하여 바뀌었는지 비교)"""
+    return {
+        "embedding_model": EMBEDDING_MODEL,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "headers": [key for _, key in HEADERS_TO_SPLIT_ON],
+    }
+
+
+def chunk_id(doc):
+    """청크 내용, 헤더 경로와 분할/임베딩 설정으로 만든 해시를 청크의 고유 ID로 사용합니다."""
+    settings = f"{EMBEDDING_MODEL}|{CHUNK_SIZE}|{CHUNK_OVERLAP}"
+    header_path = " > ".join(doc.metadata.get(key, "") for _, key in HEADERS_TO_SPLIT_ON)
+    return hashlib.sha256(f"{settings}\n{header_path}\n{doc.page_content}".encode("utf-8")).hexdigest()
+
+
+def document_chunks(file_path=MARKDOWN_PATH):
+    """청크 ID → Document 딕셔너리 (같은 내용의 청크는 하나만 남김)"""
+    chunks = {}
+    for doc in split_document(file_path):
+        chunks.setdefault(chunk_id(doc), doc)
+    return chunks
+
+
+def file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def excluded_documents():
+    names = os.environ.get("RAG_EXCLUDE_DOCUMENTS")
+    if names is None:
+        return set(EXCLUDED_DOCUMENTS)
+    return {name.strip() for name in names.split(",") if name.strip()}
+
+
+def is_document(name, excluded=None):
+    """색인 대상 파일명인지 확인합니다. (Word 임시 파일, 숨김 파일, 양식 문서 제외)"""
+    if excluded is None:
+        excluded = excluded_documents()
+    return name.endswith(DOCUMENT_SUFFIXES) and not name.startswith(("~$", ".")) and name not in excluded
+
+
+def scan_documents(data_dir=DATA_DIR):
+    """data_dir 아래의 인덱싱 대상 문서 경로 목록 (인덱스 디렉터리, Word 임시 파일, 양식 문서 제외)"""
+    excluded = excluded_documents()
+    paths = []
+    for root, dirs, files in os.walk(data_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != INDEX_DIR and not d.startswith("."))
+        for name in sorted(files):
+            if is_document(name, excluded):
+                paths.append(os.path.join(root, name))
+    return paths
+
+
+def _load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("format") != MANIFEST_FORMAT:
+        return {}
+    if data.get("settings") != index_settings():
+        # 분할/임베딩 설정이 바뀌었으면 내용이 같아도 모든 파일을 다시 분할
+        print(f"인덱스 설정이 바뀌어 모든 문서를 다시 분할합니다: {data.get('settings')} → {index_settings()}")
+        return {}
+    return data.get("files", {})
+
+
+def _save_manifest(manifest_path, files):
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"format": MANIFEST_FORMAT, "settings": index_settings(), "files": files},
+                  f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+
+def collect_chunks(data_dir=DATA_DIR, manifest_path=MANIFEST_PATH, previous_index=None):
+    """
+    data_dir의 문서들을 내용 해시로 매니페스트와 비교하여 추가/변경/삭제된 파일만 다시 분할합니다.
+    변경 없는 파일의 청크는 이전 BM25 인덱스에 저장된 Document를 그대로 사용합니다.
+    (청크 ID → Document, 새 매니페스트, 변경 내역)을 반환합니다.
+    """
+    previous_files = _load_manifest(manifest_path)
+    previous_docs = dict(zip(previous_index.ids, previous_index.documents)) if previous_index else {}
+
+    chunks = {}
+    files = {}
+    changes = {"added": [], "changed": [], "deleted": []}
+    for path in scan_documents(data_dir):
+        digest = file_hash(path)
+        entry = previous_files.get(path)
+        if entry and entry["sha256"] == digest and all(i in previous_docs for i in entry["chunk_ids"]):
+            file_chunks = {i: previous_docs[i] for i in entry["chunk_ids"]}
+        else:
+            changes["changed" if entry else "added"].append(path)
+            file_chunks = document_chunks(path)
+        for i, doc in file_chunks.items():
+            chunks.setdefault(i, doc)
+        files[path] = {"sha256": digest, "chunk_ids": list(file_chunks)}
+    changes["deleted"] = [path for path in previous_files if path not in files]
+    return chunks, files, changes
+
+
+def _import_chroma():
+    """
+    Chroma(chromadb)는 벡터 인덱스를 열 때만 불러옵니다.
+    배포 환경의 시스템 sqlite3가 Chroma 요구 버전보다 낮으므로 먼저 pysqlite3로 바꿔 둡니다.
+    """
+    if "chromadb" not in sys.modules:
+        __import__('pysqlite3')
+        sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+    from langchain_chroma import Chroma
+    return Chroma
+
+
+@traced("loader.sync_vector_index")
+def sync_vector_index(chunks, persist_directory=CHROMA_DIR):
+    """
+    디스크에 저장된 Chroma 인덱스를 열고, 청크 목록과 비교하여 바뀐 부분만 반영합니다.
+    - 새로 생긴 청크만 임베딩하고, 더 이상 없는 청크는 삭제합니다.
+    - 검색 중인 세션이 빈 결과를 받지 않도록 새 청크를 먼저 추가한 뒤 없어진 청크를 지웁니다.
+    - 변경 사항이 없으면 임베딩 API를 한 번도 호출하지 않습니다.
+    """
+    # Upstage 임베딩과 디스크에 영속화된 Chroma DB 사용
+    embeddings = get_embeddings()
+    Chroma = _import_chroma()
+    vectorstore = Chroma(
+        collection_name=CHROMA_COLLECTION,
+        embedding_function=embeddings,
+        persist_directory=persist_directory,
+    )
+
+    existing_ids = set(vectorstore.get(include=[])["ids"])
+    new_ids = [i for i in chunks if i not in existing_ids]
+    stale_ids = [i for i in existing_ids if i not in chunks]
+
+    if new_ids:
+        vectorstore.add_documents([chunks[i] for i in new_ids], ids=new_ids)
+    if stale_ids:
+        vectorstore.delete(ids=stale_ids)
+
+    print(f"RAG 인덱스 갱신: 전체 {len(chunks)}개, 신규 임베딩 {len(new_ids)}개, 삭제 {len(stale_ids)}개")
+    return vectorstore
+
+
+@traced("loader.ingest_documents")
+def ingest_documents(data_dir=DATA_DIR, persist_directory=CHROMA_DIR, index_path=LEXICAL_INDEX_PATH,
+                     manifest_path=MANIFEST_PATH, vectors=True):
+    """
+    data_dir의 Markdown/docx 문서를 증분 색인합니다.
+    바뀐 파일만 다시 분할하고, 바뀐 청크만 임베딩하며, BM25 역색인은 청크 구성이 달라졌을 때만 다시 만듭니다.
+    vectors=False면 임베딩 API를 호출하지 않고 BM25 역색인만 갱신합니다.
+    (BM25Index, Chroma 또는 None)을 반환합니다.
+    """
+    previous_index = BM25Index.load(index_path)
+    chunks, files, changes = collect_chunks(data_dir, manifest_path, previous_index)
+    if any(changes.values()):
+        print("문서 변경: " + ", ".join(f"{kind} {len(paths)}개" for kind, paths in changes.items() if paths))
+
+    vectorstore = sync_vector_index(chunks, persist_directory) if vectors else None
+
+    index = previous_index
+    if index is None or index.ids != list(chunks):
+        index = BM25Index.build(chunks.keys(), chunks.values())
+        index.save(index_path)
+        print(f"BM25 인덱스 생성: 청크 {len(index)}개")
+
+    # 색인이 모두 끝난 뒤에 매니페스트를 기록 (중간에 실패하면 다음 실행에서 다시 처리)
+    # 바뀐 파일이 없으면 매니페스트도 그대로이므로 다시 쓰지 않음
+    if any(changes.values()):
+        _save_manifest(manifest_path, files)
+    return index, vectorstore
+
+
+def _make_retriever(index, vectorstore, mode):
+    vector_retriever = vectorstore.as_retriever() if vectorstore is not None else None
+    return HybridRetriever(lexical_index=index, vector_retriever=vector_retriever, mode=mode)
+
+
+def watch_documents(live_retriever, mode, data_dir=DATA_DIR, stop_event=None, chroma_dir=CHROMA_DIR,
+                    index_path=LEXICAL_INDEX_PATH, manifest_path=MANIFEST_PATH):
+    """
+    data_dir의 문서가 바뀔 때마다 증분 색인을 다시 실행하고, 완성된 Retriever로 교체합니다.
+    교체는 참조 하나를 바꾸는 것이므로 진행 중인 검색은 이전 인덱스로 끝까지 처리됩니다.
+    (live_retriever가 None이면 색인만 갱신 - build_index.py --watch)
+    """
+    from watchfiles import watch
+
+    def watch_filter(change, path):
+        return is_document(os.path.basename(path))
+
+    for changes in watch(data_dir, watch_filter=watch_filter, stop_event=stop_event):
+        print(f"문서 변경 감지: {', '.join(sorted({path for _, path in changes}))}")
+        try:
+            index, vectorstore = ingest_documents(data_dir, chroma_dir, index_path, manifest_path,
+                                                  vectors=mode != "lexical")
+            if live_retriever is not None:
+                live_retriever.swap(_make_retriever(index, vectorstore, mode))
+        except Exception as e:
+            # 색인에 실패하면 기존 Retriever를 그대로 사용
+            print(f"문서 재색인 실패, 기존 인덱스를 계속 사용합니다: {e}")
+
+
+def start_document_watcher(live_retriever, mode, data_dir=DATA_DIR):
+    stop_event = threading.Event()
+    thread = threading.Thread(target=watch_documents, args=(live_retriever, mode, data_dir, stop_event),
+                              name="document-watcher", daemon=True)
+    thread.start()
+
+    # 인터프리터 종료 시 감시 스레드를 먼저 정리 (파일 감시 중인 데몬 스레드가 강제 종료되지 않게)
+    def stop():
+        stop_event.set()
+        thread.join(timeout=5)
+    atexit.register(stop)
+    return thread
 
-    # 필요한 컬럼만 선택하여 반환
-    return df[['감정_대분류', '사람문장1', '시스템문장1', '사람문장2', '시스템문장2']]
 
 @st.cache_resource
+@traced("loader.load_markdown_retriever")
 def load_markdown_retriever():
     """
-    지정된 Markdown 파일을 로드하여 RAG Retriever를 생성합니다.
+    data/ 디렉터리의 Markdown/docx 문서로 RAG Retriever를 생성합니다.
+    인덱스는 디스크에 저장되므로, 미리 빌드해 두면 재시작 시 임베딩을 다시 하지 않습니다.
+
+    검색 방식 (환경 변수 RAG_RETRIEVAL_MODE)
+    - "hybrid" : BM25 + 벡터 검색을 RRF로 합침, 벡터 검색이 실패하면 BM25만 사용 (기본값)
+    - "lexical": BM25만 사용 (임베딩 API를 전혀 호출하지 않음)
+    - "vector" : 벡터 검색만 사용 (실패하면 BM25로 대체)
+
+    RAG_WATCH=on이면 문서 변경을 감시하여, 재시작 없이 새 인덱스의 Retriever로 교체합니다.
     """
-    file_path = "data/depression.md"
+    mode = os.environ.get("RAG_RETRIEVAL_MODE", "hybrid")
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"알 수 없는 검색 방식입니다: {mode}")
 
-    try:
-        loader = TextLoader(file_path, encoding='utf-8')
-        documents = loader.load()
-    except FileNotFoundError:
-        raise FileNotFoundError(f"지정된 경로에 파일이 없습니다: {file_path}")
+    index, vectorstore = ingest_documents(vectors=mode != "lexical")
+    live_retriever = LiveRetriever(current=_make_retriever(index, vectorstore, mode))
+    if os.environ.get("RAG_WATCH") == "on":
+        start_document_watcher(live_retriever, mode)
+    return live_retriever
 
-    # Markdown 문법 기준으로 텍스트 분할
-    markdown_splitter = MarkdownTextSplitter(chunk_size=300, chunk_overlap=50)
-    docs = markdown_splitter.split_documents(documents)
 
-    # Upstage 임베딩과 Chroma DB를 사용하여 retriever 생성
-    embeddings = UpstageEmbeddings(model="solar-embedding-1-large")
-    vectorstore = Chroma.from_documents(docs, embeddings)
+def _load_all():
+    with span("loader.warmup"):
+        return load_emotion_data(), load_markdown_retriever(), load_example_selector()
+
 
-    return vectorstore.as_retriever()
\ No newline at end of file
+@st.cache_resource
+def start_loader_warmup():
+    """
+    말뭉치, RAG Retriever, 예시 선택기 로딩을 백그라운드 스레드에서 시작하고 Future를 반환합니다. (프로세스당 한 번)
+    각 로더는 st.cache_resource로 캐시되므로, 결과는 future.result()로 받거나 로더를 직접 호출해도 됩니다.
+    """
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="loader-warmup")
+    future = executor.submit(_load_all)
+    executor.shutdown(wait=False)
+    return future
@@ -0,0 +1,93 @@
+"""
+감성대화 말뭉치를 필요한 컬럼만 담은 Arrow 파일로 변환하고, 메모리 매핑으로 읽어오는 모듈입니다.
+
+- 변환은 한 번만 수행합니다. (원본 JSON 전체를 읽는 것은 이때뿐입니다)
+- 행은 '감정_대분류' 순으로 정렬되어 저장되고, 분류별 [시작, 끝) 구간이 파일 메타데이터에 함께 기록됩니다.
+- 읽을 때는 파일을 메모리 매핑하므로 여러 워커 프로세스가 같은 페이지를 공유합니다.
+"""
+import os
+import json
+import random
+import pyarrow as pa
+
+EMOTION_JSON_PATH = "data/감성대화말뭉치_최종데이터_Training.json"
+EMOTION_CACHE_PATH = "data/index/emotion_corpus.arrow"
+EMOTION_COLUMNS = ['감정_대분류', '사람문장1', '시스템문장1', '사람문장2', '시스템문장2']
+CATEGORY_COLUMN = '감정_대분류'
+
+
+def convert_emotion_data(json_path=EMOTION_JSON_PATH, cache_path=EMOTION_CACHE_PATH):
+    """원본 JSON을 감정 대분류별로 정렬된 Arrow(IPC) 파일로 변환합니다."""
+    try:
+        with open(json_path, "r", encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"지정된 경로에 파일이 없습니다: {json_path}")
+
+    # 필요한 컬럼만 남기고, 같은 감정 분류끼리 연속되도록 정렬
+    data.sort(key=lambda row: row.get(CATEGORY_COLUMN) or "")
+    columns = {col: [row.get(col) for row in data] for col in EMOTION_COLUMNS}
+    del data
+
+    # 감정 대분류별 행 구간 인덱스
+    category_ranges = {}
+    for i, category in enumerate(columns[CATEGORY_COLUMN]):
+        start, _ = category_ranges.get(category, (i, i))
+        category_ranges[category] = (start, i + 1)
+
+    schema = pa.schema(
+        [(col, pa.string()) for col in EMOTION_COLUMNS],
+        metadata={"category_ranges": json.dumps(category_ranges, ensure_ascii=False)},
+    )
+    table = pa.table(columns, schema=schema)
+
+    # 압축 없이 저장해야 메모리 매핑으로 바로 읽을 수 있습니다.
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = cache_path + ".tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, cache_path)
+
+    print(f"감성대화 캐시 생성: {len(table)}행, 감정 분류 {len(category_ranges)}개 -> {cache_path}")
+    return cache_path
+
+
+class EmotionCorpus:
+    """메모리 매핑된 감성대화 말뭉치. 감정 대분류별 구간 인덱스로 스캔 없이 샘플링합니다."""
+
+    def __init__(self, table, category_ranges):
+        self.table = table
+        self.category_ranges = category_ranges
+
+    @classmethod
+    def open(cls, cache_path=EMOTION_CACHE_PATH):
+        source = pa.memory_map(cache_path, "r")
+        table = pa.ipc.open_file(source).read_all()
+        category_ranges = {
+            category: tuple(bounds)
+            for category, bounds in json.loads(table.schema.metadata[b"category_ranges"]).items()
+        }
+        return cls(table, category_ranges)
+
+    def __len__(self):
+        return self.table.num_rows
+
+    @property
+    def categories(self):
+        return list(self.category_ranges)
+
+    def rows(self, indices):
+        """지정한 행 번호의 대화들을 dict 목록으로 반환합니다."""
+        if not len(indices):
+            return []
+        return self.table.take(list(indices)).to_pylist()
+
+    def sample(self, n, category=None):
+        """무작위로 n개의 대화를 뽑습니다. category를 주면 해당 감정 분류 안에서만 뽑습니다."""
+        if category is not None and category in self.category_ranges:
+            start, end = self.category_ranges[category]
+        else:
+            start, end = 0, len(self)
+        n = min(n, end - start)
+        return self.rows(random.sample(range(start, end), n))
@@ -0,0 +1,84 @@
+"""
+공감 응답의 Few-shot 예시를 사용자 입력과 비슷한 대화로 골라주는 모듈입니다.
+
+- '사람문장1' 임베딩 행렬을 미리 계산해 .npy 파일로 저장하고, 읽을 때는 메모리 매핑합니다.
+- 검색은 정규화된 벡터의 내적(코사인 유사도)을 NumPy로 한 번에 계산합니다.
+- 벡터 파일이나 임베딩 모델이 없으면 무작위 샘플링으로 대체합니다.
+"""
+import os
+import numpy as np
+
+EMOTION_VECTORS_PATH = "data/index/emotion_vectors.npy"
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def build_emotion_vectors(corpus, embeddings, vectors_path=EMOTION_VECTORS_PATH, batch_size=100):
+    """말뭉치의 '사람문장1'을 배치로 임베딩하여 정규화된 float32 행렬로 저장합니다."""
+    texts = corpus.table.column('사람문장1').to_pylist()
+
+    os.makedirs(os.path.dirname(vectors_path), exist_ok=True)
+    tmp_path = vectors_path + ".tmp.npy"
+    matrix = None
+    for start in range(0, len(texts), batch_size):
+        batch = [text or "" for text in texts[start:start + batch_size]]
+        vectors = _normalize(np.asarray(embeddings.embed_documents(batch), dtype=np.float32))
+        if matrix is None:
+            # 전체 행렬을 메모리에 올리지 않고 디스크에 바로 기록
+            matrix = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(len(texts), vectors.shape[1]))
+        matrix[start:start + len(batch)] = vectors
+        print(f"감성대화 임베딩 진행: {min(start + batch_size, len(texts))}/{len(texts)}")
+
+    if matrix is None:
+        raise ValueError("임베딩할 문장이 없습니다.")
+    matrix.flush()
+    del matrix
+    os.replace(tmp_path, vectors_path)
+    return vectors_path
+
+
+class FewShotSelector:
+    """사용자 입력과 가장 비슷한 감성대화 예시를 찾아주는 선택기"""
+
+    def __init__(self, corpus, vectors=None, embeddings=None):
+        self.corpus = corpus
+        self.vectors = vectors
+        self.embeddings = embeddings
+
+    @classmethod
+    def load(cls, corpus, embeddings=None, vectors_path=EMOTION_VECTORS_PATH):
+        """저장된 벡터 파일을 메모리 매핑으로 엽니다. 파일이 없거나 말뭉치와 맞지 않으면 무작위 샘플링만 사용합니다."""
+        vectors = None
+        if os.path.exists(vectors_path):
+            vectors = np.load(vectors_path, mmap_mode="r")
+            if vectors.shape[0] != len(corpus):
+                print(f"감성대화 벡터 수({vectors.shape[0]})가 말뭉치 행 수({len(corpus)})와 달라 무작위 샘플링을 사용합니다.")
+                vectors = None
+        return cls(corpus, vectors, embeddings)
+
+    def top_k(self, query_vector, k=2):
+        """정규화된 쿼리 벡터와 코사인 유사도가 가장 높은 행 번호 k개를 반환합니다."""
+        scores = self.vectors @ query_vector
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top.tolist()
+
+    def select(self, text, k=2):
+        """사용자 입력과 비슷한 대화 k개를 dict 목록으로 반환합니다."""
+        if self.vectors is None or self.embeddings is None:
+            return self.corpus.sample(k)
+
+        try:
+            query_vector = _normalize(np.asarray(self.embeddings.embed_query(text), dtype=np.float32))
+        except Exception as e:
+            print(f"예시 검색용 임베딩 오류, 무작위 샘플링으로 대체합니다: {e}")
+            return self.corpus.sample(k)
+
+        return self.corpus.rows(self.top_k(query_vector, k))
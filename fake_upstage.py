@@ -0,0 +1,190 @@
+"""
+Upstage API(OpenAI 호환)를 흉내 내는 로컬 가짜 서버입니다. 지연/오류를 주입해 클라이언트 계층을 시험할 때 사용합니다.
+
+사용법:
+    python fake_upstage.py --port 8001 --latency 0.3 --pro-latency 2 --error-rate 0.1
+    python fake_upstage.py --pro-error-rate 1   # solar-pro만 항상 실패 (solar-mini 대체 확인)
+    UPSTAGE_API_BASE=http://127.0.0.1:8001/v1 UPSTAGE_API_KEY=fake streamlit run app.py
+
+- POST .../chat/completions : 채점 요청(temperature <= 0.2)에는 점수 JSON(묶음 채점이면 항목별 JSON 배열),
+                              solar-pro에는 결과서 형식의 보고서,
+                              그 외에는 공감 응답을 돌려줍니다. "stream": true면 SSE로 나누어 보냅니다.
+- POST .../embeddings       : 입력 텍스트로 정해지는 단위 벡터를 돌려줍니다.
+
+지연 시간은 --distribution(normal/lognormal/fixed)으로 분포를 고르고, --seed를 주면
+같은 요청에는 항상 같은 지연/오류가 나오도록 요청 본문으로 난수를 정합니다. (벤치마크 재현용)
+"""
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+SCORE_REASON = "가짜 서버의 채점 결과입니다."
+LATENCY_DISTRIBUTIONS = ("normal", "lognormal", "fixed")
+REPORT_REPLY = (
+    "## 지원 체계\n가까운 정신건강복지센터에서 상담을 받을 수 있습니다.\n\n"
+    "## 관리 방법\n규칙적인 수면과 가벼운 산책을 권합니다.\n\n"
+    "## 원인 및 치료법\n충분히 치료할 수 있습니다.\n\n"
+    "## 마음의 메시지\n여기까지 오신 것만으로도 큰 용기입니다.\n\n"
+    "[진단명(추정)]: 가짜 서버의 진단 소견입니다.\n"
+    "[조치결과(권장사항)]: 가짜 서버의 권장 사항입니다."
+)
+EMPATHY_REPLY = "그런 마음이 드셨군요. 이야기해주셔서 고맙습니다. 다음 질문으로 넘어가 볼게요."
+
+
+def _batch_item_ids(messages):
+    """score_batcher.py의 묶음 채점 요청이면(마지막 메시지가 {"id", ...} 객체의 JSON 배열) 항목 id 목록을 반환합니다."""
+    if not messages:
+        return []
+    try:
+        items = json.loads(messages[-1].get("content", ""))
+    except (TypeError, ValueError):
+        return []
+    if not isinstance(items, list):
+        return []
+    return [item["id"] for item in items if isinstance(item, dict) and "id" in item]
+
+
+class FakeUpstageHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    options = None  # argparse 결과 (서버 시작 시 설정)
+
+    def log_message(self, format, *args):
+        if self.options.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _latency(self, mean):
+        """설정한 분포에서 지연 시간(초)을 뽑습니다. (lognormal은 평균이 mean이 되도록 맞춤)"""
+        spread = mean * self.options.jitter
+        if self.options.distribution == "fixed" or mean <= 0 or spread <= 0:
+            return max(0.0, mean)
+        if self.options.distribution == "lognormal":
+            sigma = math.sqrt(math.log(1 + (spread / mean) ** 2))
+            return self.rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+        return max(0.0, self.rng.gauss(mean, spread))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        request = json.loads(raw or b"{}")
+        if self.options.seed is None:
+            self.rng = random
+        else:
+            self.rng = random.Random(f"{self.options.seed}:{hashlib.sha256(raw).hexdigest()}")
+
+        error_rate = self.options.error_rate
+        if request.get("model") == "solar-pro":
+            error_rate = max(error_rate, self.options.pro_error_rate)
+        if self.rng.random() < error_rate:
+            self._send_json(503, {"error": {"message": "일시적인 오류(가짜 서버)", "type": "server_error"}})
+            return
+
+        try:
+            if self.path.endswith("/chat/completions"):
+                self._chat(request)
+            elif self.path.endswith("/embeddings"):
+                self._embeddings(request)
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+        except (BrokenPipeError, ConnectionResetError):
+            # 헤지 요청이나 마감 시간 초과로 클라이언트가 먼저 연결을 끊은 경우
+            self.close_connection = True
+
+    def _chat(self, request):
+        model = request.get("model", "solar-mini")
+        latency = self.options.pro_latency if model == "solar-pro" else self.options.latency
+        time.sleep(self._latency(latency))
+
+        if request.get("temperature", 1.0) <= 0.2:
+            item_ids = _batch_item_ids(request.get("messages", []))
+            if item_ids:
+                content = json.dumps([{"id": item_id, "score": self.options.score, "reason": SCORE_REASON}
+                                      for item_id in item_ids], ensure_ascii=False)
+            else:
+                content = json.dumps({"score": self.options.score, "reason": SCORE_REASON}, ensure_ascii=False)
+        elif model == "solar-pro":
+            content = REPORT_REPLY
+        else:
+            content = EMPATHY_REPLY
+
+        base = {"id": f"chatcmpl-{self.rng.getrandbits(32):x}", "created": int(time.time()), "model": model}
+        if not request.get("stream"):
+            self._send_json(200, {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(content), "total_tokens": len(content)},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        pieces = [content[i:i + 8] for i in range(0, len(content), 8)]
+        for i, piece in enumerate(pieces):
+            chunk = {**base, "object": "chat.completion.chunk", "choices": [
+                {"index": 0, "delta": {"role": "assistant", "content": piece},
+                 "finish_reason": "stop" if i == len(pieces) - 1 else None}]}
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(self.options.token_interval)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+    def _embeddings(self, request):
+        texts = request.get("input", [])
+        if isinstance(texts, str):
+            texts = [texts]
+        time.sleep(self._latency(self.options.latency))
+        data = []
+        for i, text in enumerate(texts):
+            rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+            vector = [rng.gauss(0, 1) for _ in range(self.options.dim)]
+            norm = sum(v * v for v in vector) ** 0.5
+            data.append({"object": "embedding", "index": i, "embedding": [v / norm for v in vector]})
+        self._send_json(200, {"object": "list", "data": data, "model": request.get("model"),
+                              "usage": {"prompt_tokens": 0, "total_tokens": 0}})
+
+
+def make_server(host="127.0.0.1", port=8001, **options):
+    """테스트 코드에서 직접 띄울 수 있도록 서버 객체를 만들어 반환합니다. (serve_forever는 호출 측에서)"""
+    defaults = {"latency": 0.2, "pro_latency": 1.0, "jitter": 0.2, "distribution": "normal", "error_rate": 0.0,
+                "token_interval": 0.02, "dim": 256, "score": 1, "seed": None, "verbose": False,
+                "pro_error_rate": 0.0}
+    handler = type("Handler", (FakeUpstageHandler,), {"options": argparse.Namespace(**{**defaults, **options})})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upstage API 가짜 서버")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.2, help="solar-mini/임베딩 평균 지연(초)")
+    parser.add_argument("--pro-latency", type=float, default=1.0, help="solar-pro 평균 지연(초)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="지연 표준편차 (평균 대비 비율)")
+    parser.add_argument("--distribution", choices=LATENCY_DISTRIBUTIONS, default="normal", help="지연 시간 분포")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="503을 돌려줄 확률")
+    parser.add_argument("--pro-error-rate", type=float, default=0.0, help="solar-pro 요청에만 503을 돌려줄 확률 (모델 대체 시험용)")
+    parser.add_argument("--token-interval", type=float, default=0.02, help="스트리밍 청크 간격(초)")
+    parser.add_argument("--dim", type=int, default=256, help="임베딩 차원")
+    parser.add_argument("--score", type=int, default=1, help="채점 요청에 돌려줄 점수 (0-3)")
+    parser.add_argument("--seed", type=int, default=None, help="지정하면 요청별 지연/오류를 재현 가능하게 고정")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    options = {k: v for k, v in vars(args).items() if k not in ("host", "port")}
+    server = make_server(args.host, args.port, **options)
+    print(f"가짜 Upstage 서버 시작: http://{args.host}:{args.port}/v1")
+    server.serve_forever()
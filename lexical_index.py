@@ -0,0 +1,231 @@
+"""
+depression.md 청크를 위한 로컬 BM25 역색인과, 벡터 검색 결과와 합치는 하이브리드 Retriever입니다.
+
+- 한국어는 어절에 조사/어미가 붙으므로 한글은 음절 bigram으로, 영문/숫자는 단어 단위로 토큰화합니다.
+  ("우울증이" → 우울, 울증, 증이 / 질의 "우울증" → 우울, 울증)
+- 역색인은 JSON 파일로 디스크에 저장하여 Chroma 인덱스 옆에 둡니다.
+- 하이브리드 모드에서는 BM25와 벡터 검색 결과를 RRF(Reciprocal Rank Fusion)로 합치고,
+  임베딩 API가 실패하면 BM25 결과만으로 응답합니다.
+- 어휘 전용 모드는 네트워크 호출 없이 동작합니다.
+- 청크에는 헤더 경로(h2/h3/h4)와 대상(audience) 메타데이터가 있어, 사용자의 나이/성별에 맞지 않는
+  섹션(예: 30세 남성에게 노인우울증, 여성우울증)은 점수 계산 전에 후보에서 제외합니다.
+- 문서가 다시 색인되면 LiveRetriever가 새 HybridRetriever로 교체되어, 재시작 없이 반영됩니다.
+"""
+import os
+import re
+import json
+import math
+from collections import Counter, defaultdict
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from telemetry import traced
+
+INDEX_FORMAT = 1
+RETRIEVAL_MODES = ("hybrid", "lexical", "vector")
+DEFAULT_K = 4
+RRF_K = 60
+
+# depression.md의 H2 섹션별 대상. 목록에 없는 섹션은 모든 사용자 대상("일반")으로 봅니다.
+SECTION_AUDIENCES = {
+    "노인우울증": "노인",
+    "여성우울증": "여성",
+}
+GENERAL_AUDIENCE = "일반"
+ELDERLY_AGE = 60
+
+
+def section_audience(h2):
+    """H2 헤더 제목으로 섹션의 대상을 반환합니다."""
+    return SECTION_AUDIENCES.get((h2 or "").replace(" ", ""), GENERAL_AUDIENCE)
+
+
+def audiences_for(user_data):
+    """사용자 정보(나이, 성별)로 검색할 섹션 대상 목록을 만듭니다."""
+    audiences = [GENERAL_AUDIENCE]
+    try:
+        if int(user_data.get("나이") or 0) >= ELDERLY_AGE:
+            audiences.append("노인")
+    except (TypeError, ValueError):
+        pass
+    if user_data.get("성별") == "여성":
+        audiences.append("여성")
+    return tuple(audiences)
+
+_token_run = re.compile(r"[가-힣]+|[a-z0-9]+")
+
+
+def tokenize(text):
+    """한글은 음절 bigram(한 글자 어절은 그대로), 영문/숫자는 단어 단위로 나눈 토큰 목록을 반환합니다."""
+    tokens = []
+    for run in _token_run.findall(text.lower()):
+        if run[0] >= "가" and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, ids, documents, doc_lens, postings, k1=1.5, b=0.75):
+        self.ids = ids
+        self.documents = documents
+        self.doc_lens = doc_lens
+        self.postings = postings  # 토큰 → [[문서 번호, 빈도], ...]
+        self.k1 = k1
+        self.b = b
+        self.avg_len = sum(doc_lens) / len(doc_lens) if doc_lens else 0.0
+        # 대상별 문서 번호 (사전 필터링용)
+        self.audience_docs = defaultdict(set)
+        for doc_index, doc in enumerate(documents):
+            self.audience_docs[doc.metadata.get("audience", GENERAL_AUDIENCE)].add(doc_index)
+
+    @classmethod
+    def build(cls, ids, documents, k1=1.5, b=0.75):
+        """청크 ID와 Document 목록으로 역색인을 만듭니다."""
+        postings = defaultdict(list)
+        doc_lens = []
+        for doc_index, doc in enumerate(documents):
+            counts = Counter(tokenize(doc.page_content))
+            doc_lens.append(sum(counts.values()))
+            for token, tf in counts.items():
+                postings[token].append([doc_index, tf])
+        return cls(list(ids), list(documents), doc_lens, dict(postings), k1, b)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        data = {
+            "format": INDEX_FORMAT,
+            "k1": self.k1,
+            "b": self.b,
+            "ids": self.ids,
+            "documents": [{"page_content": d.page_content, "metadata": d.metadata} for d in self.documents],
+            "doc_lens": self.doc_lens,
+            "postings": self.postings,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """저장된 역색인을 불러옵니다. 파일이 없거나 형식이 다르면 None을 반환합니다."""
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("format") != INDEX_FORMAT:
+            return None
+        documents = [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in data["documents"]]
+        return cls(data["ids"], documents, data["doc_lens"], data["postings"], data["k1"], data["b"])
+
+    def __len__(self):
+        return len(self.documents)
+
+    def search(self, query, k=DEFAULT_K, audiences=None):
+        """BM25 점수가 높은 순으로 (점수, 문서 번호) 목록을 반환합니다. audiences를 주면 해당 대상 섹션만 검색합니다."""
+        n = len(self.documents)
+        if n == 0:
+            return []
+
+        allowed = None
+        if audiences is not None:
+            allowed = set().union(*(self.audience_docs.get(a, ()) for a in audiences))
+
+        scores = defaultdict(float)
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_index, tf in postings:
+                if allowed is not None and doc_index not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lens[doc_index] / self.avg_len)
+                scores[doc_index] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(score, doc_index) for doc_index, score in ranked]
+
+
+def reciprocal_rank_fusion(result_lists, k=RRF_K):
+    """여러 검색 결과 목록을 RRF 점수(Σ 1 / (k + 순위))로 합쳐 하나의 Document 목록으로 반환합니다."""
+    scores = defaultdict(float)
+    docs = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            # 같은 청크는 내용으로 식별 (Chroma와 BM25 모두 같은 분할 결과를 사용)
+            scores[doc.page_content] += 1.0 / (k + rank)
+            docs.setdefault(doc.page_content, doc)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [docs[key] for key in ranked]
+
+
+class HybridRetriever(BaseRetriever):
+    """BM25 역색인과 (선택적으로) 벡터 Retriever의 결과를 RRF로 합치는 Retriever"""
+
+    lexical_index: BM25Index
+    vector_retriever: BaseRetriever | None = None
+    mode: str = "hybrid"
+    k: int = DEFAULT_K
+    audiences: tuple | None = None  # None이면 모든 섹션 검색
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def with_audiences(self, audiences):
+        """지정한 대상 섹션만 검색하는 복사본을 반환합니다. (인덱스는 공유)"""
+        return self.model_copy(update={"audiences": tuple(audiences)})
+
+    def for_user(self, user_data):
+        return self.with_audiences(audiences_for(user_data))
+
+    @traced("retrieval.lexical")
+    def _lexical_search(self, query):
+        results = self.lexical_index.search(query, self.k, self.audiences)
+        return [self.lexical_index.documents[i] for _, i in results]
+
+    @traced("retrieval.vector")
+    def _vector_search(self, query):
+        if self.audiences is None:
+            return self.vector_retriever.invoke(query)
+        return self.vector_retriever.invoke(query, filter={"audience": {"$in": list(self.audiences)}})
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        if self.mode == "lexical" or self.vector_retriever is None:
+            return self._lexical_search(query)
+
+        try:
+            vector_docs = self._vector_search(query)
+        except Exception as e:
+            # 임베딩 API가 느리거나 실패해도 로컬 BM25 결과로 응답
+            print(f"벡터 검색 실패, BM25 결과만 사용합니다: {e}")
+            return self._lexical_search(query)
+
+        if self.mode == "vector":
+            return vector_docs
+        return reciprocal_rank_fusion([self._lexical_search(query), vector_docs])[:self.k]
+
+
+class LiveRetriever(BaseRetriever):
+    """
+    문서가 다시 색인되면 통째로 교체되는 Retriever의 얇은 래퍼입니다.
+    세션은 이 객체를 계속 들고 있고, 검색할 때마다 그 시점의 Retriever(current)를 사용합니다.
+    """
+
+    current: BaseRetriever
+    generation: int = 0
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def swap(self, retriever):
+        """새 Retriever로 교체합니다. (참조 하나를 바꾸므로 진행 중인 검색은 이전 Retriever로 끝남)"""
+        self.current = retriever
+        self.generation += 1
+
+    def for_user(self, user_data):
+        retriever = self.current
+        for_user = getattr(retriever, "for_user", None)
+        return for_user(user_data) if for_user is not None else retriever
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self.current.invoke(query)
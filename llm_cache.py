@@ -0,0 +1,275 @@
+"""
+LLM 응답과 임베딩을 위한 2단계 캐시입니다.
+
+- 1단계: 프로세스 내 LRU 캐시 (크기 제한 + TTL)
+- 2단계: Redis (여러 레플리카가 공유, TTL로 만료 / 크기 제한은 Redis의 maxmemory LRU 정책 사용)
+
+캐시 키는 (모델, 프롬프트 해시, 호출 파라미터)로 만듭니다.
+temperature가 높은 창의적 생성처럼 캐시하면 안 되는 호출은 cache=False로 호출별로 끌 수 있습니다.
+
+환경 변수
+- LLM_CACHE_REDIS_URL : Redis 주소 (예: redis://localhost:6379/0). "memory://"면 프로세스 내 대체 저장소를 사용합니다.
+- LLM_CACHE_TTL       : 캐시 유지 시간(초), 기본 86400
+- LLM_CACHE_LOCAL_SIZE: 프로세스 내 LRU 최대 항목 수, 기본 2048
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage
+
+from telemetry import count
+
+DEFAULT_TTL = 86400
+DEFAULT_LOCAL_SIZE = 2048
+# 조회 결과 → stats 키
+STAT_KEYS = {"local_hit": "local_hits", "redis_hit": "redis_hits", "miss": "misses"}
+
+
+class LRUCache:
+    """스레드 안전한 크기 제한 + TTL LRU 캐시"""
+
+    def __init__(self, maxsize=DEFAULT_LOCAL_SIZE, ttl=DEFAULT_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (ttl or self.ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class InMemoryRedis:
+    """테스트와 로컬 실행용 Redis 대체 저장소 (get / set(ex=, nx=) / delete만 지원)"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._get_unlocked(key)
+
+    def _get_unlocked(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def set(self, key, value, ex=None, nx=False):
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        with self._lock:
+            if nx and self._get_unlocked(key) is not None:
+                return None
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+
+class ResponseCache:
+    """프로세스 내 LRU 앞에 (선택적으로) Redis를 두는 2단계 캐시"""
+
+    def __init__(self, redis_client=None, local_size=DEFAULT_LOCAL_SIZE, ttl=DEFAULT_TTL, prefix="llmcache:"):
+        self.local = LRUCache(local_size, ttl)
+        self.redis = redis_client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.stats = {"local_hits": 0, "redis_hits": 0, "misses": 0}
+        self._stats_lock = threading.Lock()
+
+    def _record(self, result, value=None):
+        # 여러 스레드(채점/요약 스레드 풀, 이벤트 루프)에서 동시에 조회하므로 락 안에서 갱신
+        with self._stats_lock:
+            self.stats[STAT_KEYS[result]] += 1
+        count("llm_cache_requests_total", result=result)
+        return value
+
+    def _get_redis(self, key):
+        try:
+            raw = self.redis.get(self.prefix + key)
+        except Exception as e:
+            print(f"Redis 캐시 조회 오류: {e}")
+            return None
+        if raw is None:
+            return None
+        value = json.loads(raw)
+        self.local.set(key, value)
+        return value
+
+    def _set_redis(self, key, value):
+        try:
+            self.redis.set(self.prefix + key, json.dumps(value, ensure_ascii=False), ex=self.ttl)
+        except Exception as e:
+            print(f"Redis 캐시 저장 오류: {e}")
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            return self._record("local_hit", value)
+
+        if self.redis is not None:
+            value = self._get_redis(key)
+            if value is not None:
+                return self._record("redis_hit", value)
+
+        return self._record("miss")
+
+    async def aget(self, key):
+        """get의 비동기 버전 (Redis 조회는 이벤트 루프를 막지 않도록 스레드에서 실행)"""
+        value = self.local.get(key)
+        if value is not None:
+            return self._record("local_hit", value)
+
+        if self.redis is not None:
+            value = await asyncio.to_thread(self._get_redis, key)
+            if value is not None:
+                return self._record("redis_hit", value)
+
+        return self._record("miss")
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        if self.redis is not None:
+            self._set_redis(key, value)
+
+    async def aset(self, key, value):
+        """set의 비동기 버전"""
+        self.local.set(key, value)
+        if self.redis is not None:
+            await asyncio.to_thread(self._set_redis, key, value)
+
+
+def make_key(namespace, model, payload, params=None):
+    """모델, 프롬프트(또는 입력 텍스트), 파라미터로 캐시 키를 만듭니다."""
+    raw = json.dumps([namespace, model, payload, params or {}], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _serialize_messages(messages):
+    if isinstance(messages, str):
+        return messages
+    return [[message.type, message.content] for message in messages]
+
+
+class CachedChatModel:
+    """
+    ChatUpstage 앞에 캐시를 두는 래퍼. invoke/ainvoke에 cache=False를 주면 해당 호출은 캐시하지 않습니다.
+    스트리밍 호출은 캐시하지 않고 그대로 전달합니다.
+    """
+
+    def __init__(self, llm, cache):
+        self.llm = llm
+        self.cache = cache
+
+    def _key(self, messages, kwargs):
+        model = kwargs.get("model") or getattr(self.llm, "model_name", None)
+        params = {k: v for k, v in kwargs.items() if k != "model"}
+        return make_key("chat", model, _serialize_messages(messages), params)
+
+    def invoke(self, messages, cache=True, **kwargs):
+        if not cache:
+            return self.llm.invoke(messages, **kwargs)
+
+        key = self._key(messages, kwargs)
+        content = self.cache.get(key)
+        if content is not None:
+            return AIMessage(content=content)
+
+        response = self.llm.invoke(messages, **kwargs)
+        self.cache.set(key, response.content)
+        return response
+
+    async def ainvoke(self, messages, cache=True, **kwargs):
+        if not cache:
+            return await self.llm.ainvoke(messages, **kwargs)
+
+        key = self._key(messages, kwargs)
+        content = await self.cache.aget(key)
+        if content is not None:
+            return AIMessage(content=content)
+
+        response = await self.llm.ainvoke(messages, **kwargs)
+        await self.cache.aset(key, response.content)
+        return response
+
+    def stream(self, messages, **kwargs):
+        return self.llm.stream(messages, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+
+class CachedEmbeddings(Embeddings):
+    """UpstageEmbeddings 앞에 쿼리 임베딩 캐시를 두는 래퍼"""
+
+    def __init__(self, embeddings, cache, model):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model
+
+    def embed_query(self, text):
+        key = make_key("embed_query", self.model, text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.set(key, vector)
+        return vector
+
+    def embed_documents(self, texts):
+        # 문서 임베딩은 인덱스 빌드 때만 쓰이고 크기가 커서 캐시하지 않습니다.
+        return self.embeddings.embed_documents(texts)
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """환경 변수 설정에 따라 프로세스 전체에서 공유하는 캐시를 만들어 반환합니다."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            redis_url = os.environ.get("LLM_CACHE_REDIS_URL")
+            redis_client = None
+            if redis_url == "memory://":
+                redis_client = InMemoryRedis()
+            elif redis_url:
+                import redis
+                redis_client = redis.Redis.from_url(redis_url)
+            _shared_cache = ResponseCache(
+                redis_client,
+                local_size=int(os.environ.get("LLM_CACHE_LOCAL_SIZE", DEFAULT_LOCAL_SIZE)),
+                ttl=int(os.environ.get("LLM_CACHE_TTL", DEFAULT_TTL)),
+            )
+        return _shared_cache
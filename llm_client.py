@@ -0,0 +1,446 @@
+"""
+ChatUpstage 호출을 감싸 제공사 지연/장애가 꼬리 지연 시간과 점수 누락으로 번지지 않게 하는 클라이언트 계층입니다.
+
+- 토큰 버킷: 프로세스 전체의 초당 요청 수 제한
+- 적응형 동시성 제한(AIMD): 응답이 빠르면 동시 요청 수를 조금씩 늘리고, 429/5xx/타임아웃이면 절반으로 줄임
+- 재시도: 일시적 오류(타임아웃, 연결 오류, 408/409/429/5xx)만 지터가 있는 지수 백오프로 재시도
+- 호출별 마감 시간: 모델별 제한 시간을 넘기면 재시도를 멈추고 실패 처리
+- 헤지 요청: 짧은 채점 호출(solar-mini, 낮은 temperature)이 최근 p95 지연보다 늦어지면 같은 요청을 한 번 더 보내 먼저 온 응답을 사용
+- 모델 대체: solar-pro의 최근 p95 지연이 SLO를 넘거나 solar-pro 호출이 일시적 오류로 실패하면 solar-mini로 대체
+
+모델별 지연 시간, 토큰 수, 재시도/헤지/대체 횟수는 telemetry 모듈에 기록합니다.
+로컬 가짜 서버(fake_upstage.py)에 붙여 테스트할 수 있습니다. (UPSTAGE_API_BASE=http://127.0.0.1:8001/v1)
+
+환경 변수
+- LLM_RATE_LIMIT        : 초당 요청 수, 기본 0(제한 없음). 제공사 할당량에 맞춰야 할 때만 설정 (batch_score.py --rate-limit)
+- LLM_BURST             : 순간 허용 요청 수, 기본 20
+- LLM_MAX_CONCURRENCY   : 동시 요청 수 상한, 기본 32 (시작값은 상한의 절반)
+- LLM_MAX_RETRIES       : 재시도 횟수, 기본 3
+- LLM_DEADLINE_MINI     : solar-mini 호출 마감 시간(초), 기본 15
+- LLM_DEADLINE_PRO      : solar-pro 호출 마감 시간(초), 기본 90
+- LLM_PRO_SLO           : solar-pro p95 지연 SLO(초), 기본 30
+- LLM_HEDGE             : 채점 호출 헤지 여부 ("on"/"off"), 기본 on
+"""
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque, defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from telemetry import telemetry, record_usage
+
+PRIMARY_MODEL = "solar-pro"
+FALLBACK_MODEL = "solar-mini"
+TRANSIENT_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# solar-pro를 SLO 초과로 대체한 뒤 다시 시도하기까지의 시간(초)
+DEGRADE_COOLDOWN = 60
+LATENCY_WINDOW = 50
+MIN_LATENCY_SAMPLES = 10
+DEFAULT_HEDGE_DELAY = 2.0
+HEDGE_TEMPERATURE = 0.2
+
+
+class DeadlineExceeded(TimeoutError):
+    """호출 마감 시간 안에 응답을 받지 못했을 때 발생합니다."""
+
+
+def is_transient(error):
+    """재시도하면 성공할 수 있는 오류인지 판단합니다. (요청 내용 오류, 인증 오류 등은 재시도하지 않음)"""
+    if isinstance(error, DeadlineExceeded):
+        return False
+    # 오류가 났을 때만 필요하므로 여기서 불러옴 (이미 ChatUpstage가 불러온 뒤라 비용 없음)
+    import httpx
+    import openai
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError, httpx.TransportError,
+                          openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    return status in TRANSIENT_STATUS
+
+
+def _env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+class TokenBucket:
+    """초당 rate개, 최대 burst개까지 쌓이는 토큰 버킷. 토큰이 없으면 순서대로 기다립니다."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """토큰 하나를 예약하고 기다려야 하는 시간(초)을 반환합니다."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self):
+        delay = self._reserve()
+        if delay:
+            time.sleep(delay)
+
+    async def aacquire(self):
+        delay = self._reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class AdaptiveLimiter:
+    """AIMD 방식으로 동시 요청 수 상한을 조절합니다. (스레드와 이벤트 루프 양쪽에서 사용)"""
+
+    def __init__(self, maximum, minimum=1, initial=None, latency_target=10.0):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(initial or max(minimum, maximum // 2))
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._async_waiters = []  # 이벤트 루프에서 기다리는 쪽의 (loop, future)
+
+    def acquire(self, timeout):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.in_flight < int(self.limit), timeout):
+                raise DeadlineExceeded("동시 요청 한도를 기다리다 마감 시간을 넘겼습니다.")
+            self.in_flight += 1
+
+    async def aacquire(self, timeout):
+        """acquire의 비동기 버전. 자리가 날 때까지 release의 알림을 기다립니다. (주기적으로 확인하지 않음)"""
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._cond:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                waiter = (loop, loop.create_future())
+                self._async_waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter[1], max(deadline - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded("동시 요청 한도를 기다리다 마감 시간을 넘겼습니다.") from None
+            finally:
+                with self._cond:
+                    if waiter in self._async_waiters:
+                        self._async_waiters.remove(waiter)
+
+    def release(self, latency, overloaded):
+        with self._cond:
+            self.in_flight -= 1
+            if overloaded:
+                self.limit = max(self.minimum, self.limit / 2)
+            elif latency <= self.latency_target:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        # release는 다른 스레드에서 불릴 수 있으므로 각 이벤트 루프에 깨우기를 맡김
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class LatencyTracker:
+    """모델별 최근 지연 시간 기록"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, model, latency):
+        with self._lock:
+            self._samples[model].append(latency)
+
+    def p95(self, model):
+        with self._lock:
+            samples = sorted(self._samples[model])
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+class ResilientChatModel:
+    """
+    ChatUpstage 앞에 두는 복원력 계층. invoke/ainvoke/stream/astream 인터페이스는 그대로입니다.
+    (CachedChatModel 아래에 두어 캐시 적중 시에는 이 계층을 거치지 않습니다)
+    """
+
+    def __init__(self, llm, rate=None, burst=None, max_concurrency=None, max_retries=None, hedge=None):
+        self.llm = llm
+        self.bucket = TokenBucket(
+            rate if rate is not None else _env_float("LLM_RATE_LIMIT", 0),
+            burst if burst is not None else int(os.environ.get("LLM_BURST", 20)),
+        )
+        self.limiter = AdaptiveLimiter(max_concurrency or int(os.environ.get("LLM_MAX_CONCURRENCY", 32)))
+        self.max_retries = max_retries if max_retries is not None else int(os.environ.get("LLM_MAX_RETRIES", 3))
+        self.hedge = hedge if hedge is not None else os.environ.get("LLM_HEDGE", "on") == "on"
+        self.deadlines = {
+            FALLBACK_MODEL: _env_float("LLM_DEADLINE_MINI", 15),
+            PRIMARY_MODEL: _env_float("LLM_DEADLINE_PRO", 90),
+        }
+        self.pro_slo = _env_float("LLM_PRO_SLO", 30)
+        self.latencies = LatencyTracker()
+        self.stats = defaultdict(int)
+        self._degraded_until = 0.0
+        self._hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-hedge")
+
+    # --- 정책 ---
+    def _model(self, kwargs):
+        return kwargs.get("model") or getattr(self.llm, "model_name", FALLBACK_MODEL)
+
+    def _route(self, kwargs):
+        """solar-pro가 SLO를 넘겨 대체 중이면 solar-mini로 보냅니다."""
+        kwargs = dict(kwargs)
+        if self._model(kwargs) == PRIMARY_MODEL and time.monotonic() < self._degraded_until:
+            kwargs["model"] = FALLBACK_MODEL
+            self._event("fallback")
+        return kwargs
+
+    def _deadline(self, kwargs):
+        return time.monotonic() + self.deadlines.get(self._model(kwargs), self.deadlines[FALLBACK_MODEL])
+
+    def _event(self, name):
+        """재시도/헤지/대체 횟수 (stats와 Prometheus 카운터에 함께 기록)"""
+        self.stats[name] += 1
+        telemetry.count("llm_events_total", event=name)
+
+    def _record(self, model, latency, overloaded=False):
+        telemetry.observe(f"llm.{model}", latency, overloaded)
+        self.latencies.record(model, latency)
+        if model != PRIMARY_MODEL:
+            return
+        p95 = self.latencies.p95(model)
+        if p95 is not None and p95 > self.pro_slo and time.monotonic() >= self._degraded_until:
+            print(f"{PRIMARY_MODEL} p95 지연 {p95:.1f}초가 SLO({self.pro_slo}초)를 넘어 {DEGRADE_COOLDOWN}초 동안 {FALLBACK_MODEL}로 대체합니다.")
+            self._degraded_until = time.monotonic() + DEGRADE_COOLDOWN
+
+    def _should_hedge(self, kwargs):
+        return (self.hedge and self._model(kwargs) == FALLBACK_MODEL
+                and kwargs.get("temperature", 1.0) <= HEDGE_TEMPERATURE)
+
+    def _hedge_delay(self, kwargs):
+        return self.latencies.p95(self._model(kwargs)) or DEFAULT_HEDGE_DELAY
+
+    @staticmethod
+    def _backoff(attempt):
+        # full jitter: 0 ~ min(8, 0.5 * 2^attempt)초
+        return random.uniform(0, min(8.0, 0.5 * 2 ** attempt))
+
+    def _can_fall_back(self, kwargs, error):
+        return self._model(kwargs) == PRIMARY_MODEL and (is_transient(error) or isinstance(error, DeadlineExceeded))
+
+    # --- 동기 호출 ---
+    def invoke(self, messages, **kwargs):
+        kwargs = self._route(kwargs)
+        try:
+            return self._invoke_with_retry(messages, kwargs)
+        except Exception as e:
+            if not self._can_fall_back(kwargs, e):
+                raise
+            print(f"{PRIMARY_MODEL} 호출 실패, {FALLBACK_MODEL}로 다시 시도합니다: {e}")
+            self._event("fallback")
+            return self._invoke_with_retry(messages, {**kwargs, "model": FALLBACK_MODEL})
+
+    def _invoke_with_retry(self, messages, kwargs):
+        deadline = self._deadline(kwargs)
+        attempt_fn = self._hedged_attempt if self._should_hedge(kwargs) else self._attempt
+        for attempt in range(self.max_retries + 1):
+            try:
+                return attempt_fn(messages, kwargs, deadline)
+            except Exception as e:
+                delay = self._backoff(attempt)
+                if not is_transient(e) or attempt == self.max_retries or time.monotonic() + delay >= deadline:
+                    raise
+                self._event("retry")
+                print(f"LLM 호출 일시적 오류, {delay:.1f}초 후 재시도합니다 ({attempt + 1}/{self.max_retries}): {e}")
+                time.sleep(delay)
+
+    def _attempt(self, messages, kwargs, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("LLM 호출 마감 시간을 넘겼습니다.")
+        self.bucket.acquire()
+        self.limiter.acquire(remaining)
+        started = time.monotonic()
+        overloaded = False
+        try:
+            response = self.llm.invoke(messages, timeout=max(deadline - started, 0.1), **kwargs)
+            record_usage(self._model(kwargs), response)
+            return response
+        except Exception as e:
+            overloaded = is_transient(e)
+            raise
+        finally:
+            latency = time.monotonic() - started
+            self.limiter.release(latency, overloaded)
+            self._record(self._model(kwargs), latency, overloaded)
+
+    def _hedged_attempt(self, messages, kwargs, deadline):
+        primary = self._hedge_executor.submit(self._attempt, messages, kwargs, deadline)
+        done, _ = wait([primary], timeout=self._hedge_delay(kwargs))
+        if done:
+            return primary.result()
+
+        self._event("hedge")
+        futures = [primary, self._hedge_executor.submit(self._attempt, messages, kwargs, deadline)]
+        error = None
+        while futures:
+            done, pending = wait(futures, timeout=max(deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded("LLM 호출 마감 시간을 넘겼습니다.")
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+                error = future.exception()
+            futures = list(pending)
+        raise error
+
+    def stream(self, messages, **kwargs):
+        """첫 토큰을 받기 전까지만 재시도합니다. (이미 화면에 나간 토큰은 되돌릴 수 없음)"""
+        kwargs = self._route(kwargs)
+        deadline = self._deadline(kwargs)
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded("LLM 호출 마감 시간을 넘겼습니다.")
+            self.bucket.acquire()
+            self.limiter.acquire(remaining)
+            started = time.monotonic()
+            overloaded = False
+            yielded = False
+            try:
+                for chunk in self.llm.stream(messages, timeout=max(deadline - started, 0.1), **kwargs):
+                    yielded = True
+                    record_usage(self._model(kwargs), chunk)
+                    yield chunk
+                return
+            except Exception as e:
+                overloaded = is_transient(e)
+                delay = self._backoff(attempt)
+                if yielded or not overloaded or attempt == self.max_retries or time.monotonic() + delay >= deadline:
+                    raise
+            finally:
+                latency = time.monotonic() - started
+                self.limiter.release(latency, overloaded)
+                self._record(self._model(kwargs), latency, overloaded)
+            self._event("retry")
+            time.sleep(delay)
+
+    # --- 비동기 호출 ---
+    async def ainvoke(self, messages, **kwargs):
+        kwargs = self._route(kwargs)
+        try:
+            return await self._ainvoke_with_retry(messages, kwargs)
+        except Exception as e:
+            if not self._can_fall_back(kwargs, e):
+                raise
+            print(f"{PRIMARY_MODEL} 호출 실패, {FALLBACK_MODEL}로 다시 시도합니다: {e}")
+            self._event("fallback")
+            return await self._ainvoke_with_retry(messages, {**kwargs, "model": FALLBACK_MODEL})
+
+    async def _ainvoke_with_retry(self, messages, kwargs):
+        deadline = self._deadline(kwargs)
+        attempt_fn = self._ahedged_attempt if self._should_hedge(kwargs) else self._aattempt
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await attempt_fn(messages, kwargs, deadline)
+            except Exception as e:
+                delay = self._backoff(attempt)
+                if not is_transient(e) or attempt == self.max_retries or time.monotonic() + delay >= deadline:
+                    raise
+                self._event("retry")
+                print(f"LLM 호출 일시적 오류, {delay:.1f}초 후 재시도합니다 ({attempt + 1}/{self.max_retries}): {e}")
+                await asyncio.sleep(delay)
+
+    async def _aattempt(self, messages, kwargs, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("LLM 호출 마감 시간을 넘겼습니다.")
+        await self.bucket.aacquire()
+        await self.limiter.aacquire(remaining)
+        started = time.monotonic()
+        overloaded = False
+        try:
+            remaining = max(deadline - started, 0.1)
+            response = await asyncio.wait_for(self.llm.ainvoke(messages, timeout=remaining, **kwargs), remaining)
+            record_usage(self._model(kwargs), response)
+            return response
+        except asyncio.TimeoutError:
+            overloaded = True
+            raise DeadlineExceeded("LLM 호출 마감 시간을 넘겼습니다.")
+        except Exception as e:
+            overloaded = is_transient(e)
+            raise
+        finally:
+            latency = time.monotonic() - started
+            self.limiter.release(latency, overloaded)
+            self._record(self._model(kwargs), latency, overloaded)
+
+    async def _ahedged_attempt(self, messages, kwargs, deadline):
+        primary = asyncio.ensure_future(self._aattempt(messages, kwargs, deadline))
+        done, _ = await asyncio.wait([primary], timeout=self._hedge_delay(kwargs))
+        if done:
+            return primary.result()
+
+        self._event("hedge")
+        tasks = {primary, asyncio.ensure_future(self._aattempt(messages, kwargs, deadline))}
+        error = None
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def astream(self, messages, **kwargs):
+        kwargs = self._route(kwargs)
+        deadline = self._deadline(kwargs)
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded("LLM 호출 마감 시간을 넘겼습니다.")
+            await self.bucket.aacquire()
+            await self.limiter.aacquire(remaining)
+            started = time.monotonic()
+            overloaded = False
+            yielded = False
+            try:
+                async for chunk in self.llm.astream(messages, timeout=max(deadline - started, 0.1), **kwargs):
+                    yielded = True
+                    record_usage(self._model(kwargs), chunk)
+                    yield chunk
+                return
+            except Exception as e:
+                overloaded = is_transient(e)
+                delay = self._backoff(attempt)
+                if yielded or not overloaded or attempt == self.max_retries or time.monotonic() + delay >= deadline:
+                    raise
+            finally:
+                latency = time.monotonic() - started
+                self.limiter.release(latency, overloaded)
+                self._record(self._model(kwargs), latency, overloaded)
+            self._event("retry")
+            await asyncio.sleep(delay)
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
@@ -1,69 +1,325 @@
+import re
 import random
-import os
+import asyncio
 import json
+import functools
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_upstage import UpstageEmbeddings, ChatUpstage
-from langchain.chains import create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_core.prompts import ChatPromptTemplate
-from datetime import datetime
-
-# PDF 생성을 위한 라이브러리 추가
-# 설치가 필요합니다: pip install reportlab
-from reportlab.pdfgen import canvas
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfbase import pdfmetrics
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import Paragraph
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_LEFT
-from reportlab.lib.colors import black
+from concurrent.futures import ThreadPoolExecutor
+from example_selector import FewShotSelector
+from risk_prescorer import default_prescorer
+from llm_cache import CachedChatModel, get_response_cache
+from llm_client import ResilientChatModel
+from score_batcher import ScoreBatcher
+from session_state import SessionState
+from context_packer import pack_documents, pack_narrative
+from conversation_memory import split_history, fold_summary, render_memory
+from telemetry import traced, count
+
+# 스트리밍 응답과 동시에 실행할 LLM 호출용 스레드 풀 (프로세스당 하나)
+_llm_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm")
+
+# PHQ-9(Patient Health Questionnaire-9) 우울증 자가 진단 도구
+ALL_QUESTIONS = [
+    "일상적인 활동에 대한 흥미나 즐거움이 많이 줄어들었나요?",
+    "기분이 가라앉거나 우울하고 절망적인 느낌이 들었나요?",
+    "잠들기 어렵거나 자주 깨는 등 수면에 문제가 있었나요?",
+    "평소보다 피곤하고 기운이 없는 느낌을 자주 받았나요?",
+    "식욕이 크게 줄거나 반대로 너무 많이 먹지는 않았나요?",
+    "스스로를 실패자라고 느끼거나 가족을 실망시켰다는 죄책감이 들었나요?",
+    "신문이나 TV를 보는 것과 같은 일상적인 일에 집중하기 어려웠나요?",
+    "다른 사람이 알아챌 정도로 행동이 굼떠지거나, 혹은 너무 안절부절못하지는 않았나요?",
+    "차라리 죽는 게 낫겠다거나 스스로를 해치고 싶다는 생각을 한 적이 있나요?"
+]
+SCREENING_QUESTION_COUNT = 5
+
+
+@functools.lru_cache(maxsize=None)
+def get_shared_llm():
+    """모든 세션이 함께 쓰는 ChatUpstage 클라이언트 (프로세스당 하나)"""
+    # langchain_upstage(openai SDK 포함)는 불러오는 데 오래 걸리므로 첫 LLM 호출 직전에 불러옴
+    from langchain_upstage import ChatUpstage
+    # 재시도/동시성 제한/마감 시간/모델 대체는 ResilientChatModel이 담당하므로 SDK 자체 재시도는 끔
+    client = ResilientChatModel(ChatUpstage(model="solar-mini", max_retries=0))
+    # 같은 프롬프트의 반복 호출은 캐시에서 응답 (창의적 생성은 호출 시 cache=False)
+    return CachedChatModel(client, get_response_cache())
+
+
+@functools.lru_cache(maxsize=None)
+def get_score_batcher():
+    """여러 세션의 채점 요청을 모아 한 번에 보내는 디스패처 (프로세스당 하나)"""
+    return ScoreBatcher(get_shared_llm())
+
+
+def new_session_state():
+    """질문 5개를 무작위로 고른 새 세션 상태를 만듭니다."""
+    return SessionState(screening_questions=random.sample(ALL_QUESTIONS, SCREENING_QUESTION_COUNT))
+
+
+REPORT_DIAGNOSIS_MARKER = "[진단명(추정)]:"
+REPORT_RECOMMENDATION_MARKER = "[조치결과(권장사항)]:"
+REPORT_FIELD_FAILED = "내용을 생성하지 못했습니다."
+
+
+def _report_marker_pattern(label):
+    """
+    결과서 항목 마커를 느슨하게 찾는 정규식. 대소문자, 공백, 대괄호 유무, 마크다운 강조(**, __),
+    줄 앞의 제목/목록 기호("### ", "- ", "1. ")와 전각 콜론을 허용합니다.
+    """
+    return re.compile(
+        r"(?:^[ \t#>*\-]*(?:\d+\.[ \t]*)?)?(?:\*\*|__)?[ \t]*\[?[ \t]*" + label
+        + r"[ \t]*\]?[ \t]*(?:\*\*|__)?[ \t]*[:：][ \t]*(?:\*\*|__)?",
+        re.IGNORECASE | re.MULTILINE,
+    )
+
+
+_DIAGNOSIS_MARKER_RE = _report_marker_pattern(r"진단명[ \t]*(?:\([ \t]*추정[ \t]*\))?")
+_RECOMMENDATION_MARKER_RE = _report_marker_pattern(r"조치[ \t]*결과[ \t]*(?:\([ \t]*권장[ \t]*사항[ \t]*\))?")
+# 스트리밍 중 마커가 토큰 경계에 걸쳐 있을 수 있으므로 끝에서 이만큼은 보류 (마크다운을 포함한 마커 길이보다 길게)
+REPORT_MARKER_HOLDBACK = 32
+
+
+def _find_report_marker(content, pattern=None, start=0):
+    """content[start:]에서 처음 나오는 결과서 항목 마커(pattern이 없으면 두 마커 중 먼저 나오는 것)를 찾습니다."""
+    patterns = [pattern] if pattern is not None else [_DIAGNOSIS_MARKER_RE, _RECOMMENDATION_MARKER_RE]
+    matches = [m for m in (p.search(content, start) for p in patterns) if m is not None]
+    return min(matches, key=lambda m: m.start(), default=None)
+
+
+def _clean_report_field(text):
+    """항목 내용 앞뒤에 남은 공백과 마크다운 강조 기호를 정리합니다."""
+    return text.strip().strip("*_").strip()
+
+
+def analysis_diagnosis(score):
+    """화면에 표시하는 최종 분석의 진단명"""
+    if score >= 13:
+        return "중증 우울증"
+    elif 9 <= score <= 12:
+        return "초기 우울증"
+    elif 5 <= score <= 8:
+        return "가벼운 우울 증상"
+    else:
+        return "우울감 없음"
+
+
+def report_diagnosis_title(score):
+    """PDF 결과서의 점수 기반 진단명"""
+    if score >= 14:
+        return "중증 우울증"
+    elif 10 <= score <= 13:
+        return "중등도 우울증"
+    elif 6 <= score <= 9:
+        return "경도 우울 증상"
+    else: 
+        return "우울감 없음"
+
+
+def report_queries(user_data):
+    """
+    보고서용 RAG 검색 질의 목록. 증상과 나이로 만든 질의에, 서술형 답변이 있으면 서술형 답변 질의를 더합니다.
+    (선별 질문이 끝났을 때 미리 검색한 첫 질의의 결과를 서술형 답변 뒤에도 그대로 쓰기 위해 질의를 나눔)
+    """
+    age = user_data.get('나이')
+    queries = [f"{user_data.get('주요 증상')} 증상을 겪는 {age}세 사용자를 위한 우울증 관리 방법, 원인, 치료법, 지원 체계를 알려줘."]
+    narrative = user_data.get('서술형 답변')
+    if narrative:
+        queries.append(f"{narrative} 내용을 겪는 {age}세 사용자를 위한 우울증 관리 방법, 원인, 치료법, 지원 체계를 알려줘.")
+    return queries
+
+
+def _merge_results(result_lists):
+    """여러 질의의 검색 결과를 순위별로 번갈아 합치고, 같은 내용의 문서는 한 번만 남깁니다."""
+    merged, seen = [], set()
+    for rank in range(max((len(docs) for docs in result_lists), default=0)):
+        for docs in result_lists:
+            if rank < len(docs) and docs[rank].page_content not in seen:
+                seen.add(docs[rank].page_content)
+                merged.append(docs[rank])
+    return merged
+
+
+class _ReportBodyFilter:
+    """스트리밍 중 결과서 항목 마커 이전의 본문만 내보내는 필터"""
+
+    def __init__(self):
+        self.content = ""
+        self._emitted = 0
+        self._body_done = False
+
+    def feed(self, token):
+        """토큰을 받아 지금 화면에 내보내도 되는 본문 부분을 반환합니다."""
+        self.content += token
+        if self._body_done:
+            return ""
+
+        marker = _find_report_marker(self.content)
+        if marker is not None:
+            self._body_done = True
+            safe_end = marker.start()
+        else:
+            # 마커가 토큰 경계에 걸쳐 있을 수 있으므로 끝부분은 보류
+            safe_end = len(self.content) - REPORT_MARKER_HOLDBACK
+        if safe_end <= self._emitted:
+            return ""
+        text = self.content[self._emitted:safe_end]
+        self._emitted = safe_end
+        return text
+
+    def flush(self):
+        """스트림이 끝났을 때 보류해 둔 나머지 본문을 반환합니다."""
+        if self._body_done or self._emitted >= len(self.content):
+            return ""
+        text = self.content[self._emitted:]
+        self._emitted = len(self.content)
+        return text
+
+
+def _report_key(user_data, score):
+    """보고서 캐시가 같은 세션 정보로 만들어졌는지 확인하기 위한 키"""
+    return json.dumps([user_data, score], ensure_ascii=False, sort_keys=True, default=str)
+
 
 class EmotionBasedPsychotherapy:
     # --- __init__ (생성자) 수정 ---
-    def __init__(self, emotion_df, md_retriever):
-        self.emotion_df = emotion_df  # 감성대화 데이터 추가
+    def __init__(self, emotion_corpus, md_retriever, example_selector=None, prescorer=None, state=None):
+        self.emotion_corpus = emotion_corpus  # 감성대화 데이터 (EmotionCorpus)
+        # 사용자 입력과 비슷한 예시를 고르는 선택기 (없으면 무작위 샘플링)
+        self.example_selector = example_selector or FewShotSelector(emotion_corpus)
         self.md_retriever = md_retriever  # Markdown Retriever 추가
-        self.score = 0
-        self.question_index = 0
-        self.chat_history = [] # 대화 기록을 저장할 리스트
-
-            # --- 모든 LLM 호출을 담당할 ChatUpstage 객체 생성 ---
-        self.llm = ChatUpstage(model="solar-mini")
-    # PHQ-9(Patient Health Questionnaire-9) 우울증 자가 진단 도구
-        self.all_questions = [
-            "일상적인 활동에 대한 흥미나 즐거움이 많이 줄어들었나요?",
-            "기분이 가라앉거나 우울하고 절망적인 느낌이 들었나요?",
-            "잠들기 어렵거나 자주 깨는 등 수면에 문제가 있었나요?",
-            "평소보다 피곤하고 기운이 없는 느낌을 자주 받았나요?",
-            "식욕이 크게 줄거나 반대로 너무 많이 먹지는 않았나요?",
-            "스스로를 실패자라고 느끼거나 가족을 실망시켰다는 죄책감이 들었나요?",
-            "신문이나 TV를 보는 것과 같은 일상적인 일에 집중하기 어려웠나요?",
-            "다른 사람이 알아챌 정도로 행동이 굼떠지거나, 혹은 너무 안절부절못하지는 않았나요?",
-            "차라리 죽는 게 낫겠다거나 스스로를 해치고 싶다는 생각을 한 적이 있나요?"
-        ]
-        self.screening_questions = random.sample(self.all_questions, 5)
-        self.total_questions = len(self.screening_questions)
+        # 명확한 답변을 LLM 없이 채점하는 사전 채점기 (프로세스 공유)
+        self.prescorer = prescorer or default_prescorer
+        # 점수, 질문 순서, 대화 기록 등 세션마다 다른 값은 직렬화 가능한 SessionState에 보관
+        self.state = state or new_session_state()
+        self._pending_score = None # 스트리밍 중 백그라운드에서 진행 중인 점수 분석
+        self._prefetch = None # 서술형 입력 중 미리 실행한 보고서용 검색
+        self._pending_summary = None # 백그라운드에서 진행 중인 이전 대화 요약
+
+        # 모든 LLM 호출을 담당할 ChatUpstage 객체 (세션마다 만들지 않고 프로세스에서 공유)
+        self.llm = get_shared_llm()
+        # 채점(solar-mini) 호출 (SCORE_BATCH_WINDOW_MS를 켜면 다른 세션의 요청과 묶어서 보냄)
+        self.score_batcher = get_score_batcher()
+        self.all_questions = ALL_QUESTIONS
+
+    # --- 세션 상태 접근자 (SessionState에 위임) ---
+    @property
+    def score(self):
+        return self.state.score
+
+    @score.setter
+    def score(self, value):
+        self.state.score = value
+
+    @property
+    def question_index(self):
+        return self.state.question_index
+
+    @question_index.setter
+    def question_index(self, value):
+        self.state.question_index = value
+
+    @property
+    def screening_questions(self):
+        return self.state.screening_questions
+
+    @screening_questions.setter
+    def screening_questions(self, questions):
+        self.state.screening_questions = list(questions)
+
+    @property
+    def total_questions(self):
+        return len(self.state.screening_questions)
+
+    @property
+    def chat_history(self):
+        return self.state.chat_history
+
+    @property
+    def report_cache(self):
+        return self.state.report_cache
+
+    @report_cache.setter
+    def report_cache(self, value):
+        self.state.report_cache = value
+
+    # --- 대화 기억 (최근 턴은 그대로, 오래된 턴은 요약으로) ---
+    def _remember_turn(self, user_input, bot_response):
+        """한 턴을 대화 기록에 저장하고, 최근 턴을 넘는 오래된 기록은 백그라운드에서 요약에 합칩니다."""
+        self.chat_history.append({"role": "user", "content": user_input})
+        self.chat_history.append({"role": "assistant", "content": bot_response})
+        # 앞선 요약이 아직 진행 중이면 기다리지 않고, 끝난 뒤의 다음 턴에서 이어서 요약
+        if not self.settle_memory():
+            return
+        evicted, _ = split_history(self.chat_history)
+        if not evicted:
+            return
+        # 요약이 끝나기 전까지 오래된 메시지는 대화 기록에 그대로 남겨 둠 (그 사이 저장해도 빠지지 않도록)
+        future = _llm_executor.submit(fold_summary, self.llm, self.state.history_summary, evicted)
+        self._pending_summary = (future, self.state, len(evicted))
+
+    def restore_state(self, state):
+        """처리에 실패한 요청을 되돌릴 때 이전 상태로 바꾸고, 그 요청에서 시작한 백그라운드 작업 결과는 버립니다."""
+        self.state = state
+        self._pending_score = None
+        self._pending_summary = None
+
+    def settle_memory(self):
+        """
+        백그라운드 대화 요약이 끝났으면 세션 상태에 반영하고, 요약한 메시지를 대화 기록에서 뺍니다.
+        기다리지 않으며, 아직 진행 중이면 False를 반환합니다. (그동안은 이전 요약 + 요약 전 대화 기록을 그대로 사용)
+        """
+        if self._pending_summary is None:
+            return True
+        future, state, folded = self._pending_summary
+        if not future.done():
+            return False
+        self._pending_summary = None
+        if state is not self.state:
+            # 요약을 시작한 뒤 세션 상태가 바뀜 (다른 곳에서 저장한 스냅샷을 다시 불러온 경우 등)
+            return True
+        try:
+            state.history_summary = future.result()
+        except Exception as e:
+            # fold_summary는 자체적으로 실패를 처리하므로 여기에 오는 경우는 드묾. 다음 턴에 다시 요약
+            print(f"대화 요약 반영 실패: {e}")
+            return True
+        del state.chat_history[:folded]
+        return True
+
+    def memory_context(self):
+        """프롬프트에 넣을 대화 기억 (이전 대화 요약 + 토큰 예산 안의 최근 대화)"""
+        self.settle_memory()
+        return render_memory(self.state.history_summary, self.chat_history)
+
+    @traced("model.generate_final_analysis")
+    def generate_final_analysis(self, user_data):
+        report_header, messages = self._prepare_report(user_data, self.score)
+        response = self.llm.invoke(messages, model="solar-pro", temperature=0.7, cache=False)
+        report_body = self._finish_report(user_data, self.score, report_header, response.content)
 
-        qa_system_prompt = """당신은 우울증 전문가입니다. 검색된 컨텍스트 정보를 사용하여 질문에 답변하세요. 답변은 한국어로, 세 문장 이내로 간결하게 유지하세요.
-        {context}"""
-        qa_prompt = ChatPromptTemplate.from_messages([("system", qa_system_prompt), ("human", "{input}")])
-        Youtube_chain = create_stuff_documents_chain(self.llm, qa_prompt)
-        self.rag_chain = create_retrieval_chain(self.md_retriever, Youtube_chain)
+        # --- 헤더와 생성된 답변을 합쳐서 최종 결과 반환 ---
+        return (report_header, report_body)
 
-    def generate_final_analysis(self, user_data):
-        # --- 1. 점수 기반으로 진단명 결정 (수정된 부분) ---
-        score = self.score
-        if score >= 13:
-            diagnosis_title = "중증 우울증"
-        elif 9 <= score <= 12:
-            diagnosis_title = "초기 우울증"
-        elif 5 <= score <= 8:
-            diagnosis_title = "가벼운 우울 증상"
-        else:
-            diagnosis_title = "우울감 없음"
+    @traced("model.stream_final_analysis")
+    def stream_final_analysis(self, user_data):
+        """
+        generate_final_analysis의 스트리밍 버전입니다.
+        검색과 프롬프트 준비를 마친 뒤 (헤더, 본문 토큰 제너레이터)를 반환합니다.
+        """
+        report_header, messages = self._prepare_report(user_data, self.score)
+        body_stream = self._stream_report_body(user_data, self.score, report_header, messages)
+        return (report_header, body_stream)
+
+    @traced("model.prepare_report")
+    def _prepare_report(self, user_data, score):
+        """
+        세션 종료 시 한 번만 실행하는 보고서 파이프라인의 준비 단계입니다.
+        검색은 한 번만 하고, 화면용 최종 분석과 PDF 결과서 항목을 한 번의 생성으로 함께 요청합니다.
+        """
+        # --- 1. 점수 기반으로 진단명 결정 ---
+        diagnosis_title = analysis_diagnosis(score)
+        report_diagnosis = report_diagnosis_title(score)
         
-        # --- 2. 진단명을 중앙에 표시하는 헤더 생성 (수정된 부분) ---
+        # --- 2. 진단명을 중앙에 표시하는 헤더 생성 ---
         report_header = f"""
         <div style="text-align: center; margin-bottom: 20px;">
             <h2>진단 결과</h2>
@@ -80,21 +336,26 @@ class EmotionBasedPsychotherapy:
         - 주요 증상: {user_data.get('주요 증상')}
         - 5가지 질문 평가 점수: {user_data.get('질문 총점')} 점
         - 서술형 답변 점수: {user_data.get('서술형 점수')} 점
-        - 최종 총점: {self.score} 점
-        - 사용자의 서술: {user_data.get('서술형 답변')}
+        - 최종 총점: {score} 점
+        - 사용자의 서술: {pack_narrative(user_data.get('서술형 답변'))}
         """
+        conversation = self.memory_context()
+        if conversation:
+            user_summary += f"\n### 상담 대화 기록\n{conversation}\n"
 
-        # 4. RAG를 위한 핵심 질문 생성
-        main_query = f"{user_data.get('주요 증상')}과 {user_data.get('서술형 답변')} 내용을 겪는 {user_data.get('나이')}세 사용자를 위한 우울증 관리 방법, 원인, 치료법, 지원 체계를 알려줘."
-
-        # 5. RAG로 depression.md에서 관련 정보 검색
-        rag_context = self.rag_chain.invoke({"input": main_query})
-        retrieved_info = "\n".join([doc.page_content for doc in rag_context['context']])
+        # 4~5. RAG로 depression.md에서 관련 정보 검색 (보고서 전체에서 한 번만, 미리 받아둔 결과가 있으면 재사용)
+        try:
+            retrieved_docs = self._retrieve_for_report(user_data)
+            # 겹치는 청크를 정리하고 토큰 예산 안에서 관련도 순으로 채움
+            retrieved_info = pack_documents(retrieved_docs)
+        except Exception as e:
+            print(f"RAG 검색 오류: {e}")
+            retrieved_info = "관련 정보를 찾는 데 실패했습니다."
 
-        # 6. 최종 답변 생성을 위한 프롬프트
+        # 6. 최종 답변과 결과서 항목을 함께 생성하기 위한 프롬프트
         final_prompt = f"""
-        당신은 매우 공감 능력이 뛰어난 심리 상담 전문가입니다.
-        아래 사용자 정보와 전문가의 분석 노트를 바탕으로, 사용자에게 전달할 최종 답변을 아래 지시사항에 따라 작성해주세요.
+        당신은 매우 공감 능력이 뛰어난 심리 상담 전문가이자 정신건강의학과 전문의입니다.
+        아래 사용자 정보와 전문가의 분석 노트를 바탕으로, (1) 사용자에게 전달할 최종 답변과 (2) '우울증 자가 진단 결과서' 항목을 차례대로 작성해주세요.
         사용자의 진단명은 '{diagnosis_title}'입니다. 이 점을 고려하여 답변해주세요.
 
         ### 사용자 정보
@@ -103,36 +364,236 @@ class EmotionBasedPsychotherapy:
         ### 전문가 분석 노트 (검색된 정보)
         {retrieved_info}
 
-        ### 지시사항
+        ### 지시사항 (1) 최종 답변
         1. **(지원 체계)**: 분석 노트를 참고하여, 사용자에게 도움이 될 만한 기관이나 지원 프로그램을 구체적으로 제시해주세요.
         2. **(관리 방법)**: 사용자가 일상에서 시도해볼 수 있는 현실적인 스트레스 및 우울감 관리 방법을 2-3가지 제안해주세요.
         3. **(원인 및 치료법)**: 사용자의 증상과 관련된 원인을 간단히 언급하고, 일반적인 치료 방법에 대해 희망적으로 설명해주세요.
         4. **(마음의 메시지)**: 모든 내용을 종합하여, 사용자의 노력을 인정하고 희망을 주는 매우 따뜻하고 진심 어린 응원 메시지로 마무리해주세요.
 
         위 4가지 항목을 각각 소제목으로 구분하여 자연스러운 문단으로 작성해주세요. 진단명은 이미 맨 위에 표시되므로 본문에서는 언급하지 않아도 됩니다.
+
+        ### 지시사항 (2) 결과서 항목
+        최종 답변을 모두 작성한 뒤, 맨 마지막에 아래 두 항목을 덧붙여주세요.
+        1. **[진단명(추정)]**: 먼저 결과서의 점수 기반 진단인 '{report_diagnosis}'을 언급해주세요. 그 다음, 환자의 증상과 의학 정보를 종합하여 전문적인 소견을 1~2 문장으로 구체화해주세요. (예: "초기 우울증 수준으로, 특히 대인관계 스트레스와 관련된 불안 및 무기력감이 두드러집니다.")
+        2. **[조치결과(권장사항)]**: 실제 의사가 환자에게 말하듯, 현실적이고 구체적인 조치 방안을 제안해주세요. 정신건강의학과 방문 권유, 상담치료, 생활 습관 개선 등 도움이 될 만한 정보를 따뜻하고 신뢰감 있는 어조로 작성해주세요.
+
+        결과서 항목은 아래 형식을 그대로 지켜 작성하고, 그 뒤에는 다른 말을 덧붙이지 마세요.
+        {REPORT_DIAGNOSIS_MARKER} <내용>
+        {REPORT_RECOMMENDATION_MARKER} <내용>
         """
+        return report_header, [HumanMessage(content=final_prompt)]
 
-        response = self.llm.invoke([HumanMessage(content=final_prompt)], model="solar-pro", temperature=0.7)
+    def start_report_prefetch(self, user_data):
+        """
+        보고서용 RAG 검색을 백그라운드에서 미리 실행합니다. (질의별로 한 번씩)
+        선별 질문이 끝났을 때 증상/나이 질의를 검색해 두고, 서술형 답변을 받은 뒤 다시 호출하면
+        앞서 받아 둔 결과는 그대로 두고 서술형 답변 질의만 추가로 검색합니다.
+        """
+        retriever = self._retriever_for(user_data)
+        previous = {entry["query"]: entry for entry in self._prefetch or []}
+        self._prefetch = [
+            previous.pop(query, None) or {"query": query, "future": _llm_executor.submit(retriever.invoke, query)}
+            for query in report_queries(user_data)
+        ]
+        # 사용자 정보가 바뀌어 더 이상 쓰지 않는 질의는 취소
+        for entry in previous.values():
+            entry["future"].cancel()
+
+    def cancel_report_prefetch(self):
+        """진행 중인 사전 검색을 취소합니다. (이미 실행 중이면 결과만 버립니다)"""
+        prefetch, self._prefetch = self._prefetch, None
+        for entry in prefetch or []:
+            entry["future"].cancel()
+
+    def _retriever_for(self, user_data):
+        """사용자의 나이/성별에 맞는 섹션만 검색하는 Retriever (필터를 지원하지 않으면 그대로 사용)"""
+        for_user = getattr(self.md_retriever, "for_user", None)
+        return for_user(user_data) if for_user is not None else self.md_retriever
+
+    @traced("model.retrieve_for_report")
+    def _retrieve_for_report(self, user_data):
+        """질의별로 미리 받아 둔 검색 결과를 쓰고(없거나 실패한 질의만 새로 검색), 결과를 하나로 합칩니다."""
+        prefetch, self._prefetch = self._prefetch, None
+        prefetched = {entry["query"]: entry["future"] for entry in prefetch or []}
+        retriever = self._retriever_for(user_data)
+
+        result_lists = []
+        for query in report_queries(user_data):
+            future = prefetched.pop(query, None)
+            if future is not None:
+                try:
+                    result_lists.append(future.result())
+                    continue
+                except Exception as e:
+                    print(f"사전 검색 결과를 사용할 수 없어 다시 검색합니다: {e}")
+            result_lists.append(retriever.invoke(query))
+        for future in prefetched.values():
+            future.cancel()
+        return _merge_results(result_lists)
+
+    @traced("model.stream_report_body")
+    def _stream_report_body(self, user_data, score, report_header, messages):
+        """최종 분석 본문만 스트리밍하고, 결과서 항목 부분은 화면에 내보내지 않고 캐시에 저장합니다."""
+        body_filter = _ReportBodyFilter()
+        for token in self._stream_text(messages, model="solar-pro", temperature=0.7):
+            text = body_filter.feed(token)
+            if text:
+                yield text
+
+        text = body_filter.flush()
+        if text:
+            yield text
+        self._finish_report(user_data, score, report_header, body_filter.content)
+
+    @traced("model.astream_final_analysis")
+    async def astream_final_analysis(self, user_data):
+        """stream_final_analysis의 비동기 버전. (헤더, 본문 토큰 비동기 제너레이터)를 반환합니다."""
+        report_header, messages = await asyncio.to_thread(self._prepare_report, user_data, self.score)
+        return report_header, self._astream_report_body(user_data, self.score, report_header, messages)
+
+    @traced("model.astream_report_body")
+    async def _astream_report_body(self, user_data, score, report_header, messages):
+        body_filter = _ReportBodyFilter()
+        async for token in self._astream_text(messages, model="solar-pro", temperature=0.7):
+            text = body_filter.feed(token)
+            if text:
+                yield text
+
+        text = body_filter.flush()
+        if text:
+            yield text
+        # 항목이 빠져 따로 요약해야 할 수 있으므로(LLM 호출) 이벤트 루프 밖에서 실행
+        await asyncio.to_thread(self._finish_report, user_data, score, report_header, body_filter.content)
+
+    @traced("model.finish_report")
+    def _finish_report(self, user_data, score, report_header, report_content):
+        """
+        생성 결과를 화면용 본문과 결과서 항목으로 나누어 세션에 캐시하고, 본문을 반환합니다.
+        결과서 항목 마커가 없거나 내용이 비어 있으면 본문으로 항목만 따로 요약합니다.
+        """
+        first_marker = _find_report_marker(report_content)
+        report_body = report_content[:first_marker.start()].strip() if first_marker else report_content.strip()
+
+        diag = _find_report_marker(report_content, _DIAGNOSIS_MARKER_RE)
+        reco = _find_report_marker(report_content, _RECOMMENDATION_MARKER_RE, diag.end()) if diag else None
+        report_fields = {}
+        if diag is not None and reco is not None:
+            report_fields['진단명(추정)'] = _clean_report_field(report_content[diag.end():reco.start()])
+            report_fields['조치결과(권장사항)'] = _clean_report_field(report_content[reco.end():])
+        if not report_fields or not all(report_fields.values()):
+            print("결과서 항목을 찾지 못해 따로 요약합니다.")
+            count("llm_parse_failures_total", kind="report")
+            report_fields = self._summarize_report_fields(user_data, score, report_body)
+
+        self.report_cache = {
+            "key": _report_key(user_data, score),
+            "header": report_header,
+            "body": report_body,
+            "fields": report_fields,
+        }
+        return report_body
+
+    def _summarize_report_fields(self, user_data, score, report_body):
+        """최종 분석 응답에 결과서 항목이 없을 때, 본문을 바탕으로 항목만 따로 생성합니다."""
+        system_prompt = f"""
+        당신은 정신건강의학과 전문의입니다. 사용자 정보와 이미 작성된 최종 분석을 바탕으로 '우울증 자가 진단 결과서'의 두 항목을 작성해주세요.
+        - 진단명(추정): 결과서의 점수 기반 진단인 '{report_diagnosis_title(score)}'을 먼저 언급하고, 증상을 종합한 소견을 1~2 문장으로 덧붙여주세요.
+        - 조치결과(권장사항): 실제 의사가 환자에게 말하듯, 현실적이고 구체적인 조치 방안을 따뜻하고 신뢰감 있는 어조로 작성해주세요.
 
-        # --- 7. 헤더와 생성된 답변을 합쳐서 최종 결과 반환 (수정된 부분) ---
-        return (report_header, response.content)
+        반드시 아래와 같은 JSON 형식으로만 응답해야 합니다. 다른 설명은 절대 추가하지 마세요.
+        {{
+        "진단명(추정)": "<내용>",
+        "조치결과(권장사항)": "<내용>"
+        }}
+        """
+        human_prompt = f"""
+        ### 사용자 정보
+        - 사용자: {user_data.get('나이')}세 {user_data.get('성별')}
+        - 주요 증상: {user_data.get('주요 증상')}
+        - 최종 총점: {score} 점
 
+        ### 최종 분석
+        {report_body}
+        """
+        messages = [SystemMessage(content=system_prompt), HumanMessage(content=human_prompt)]
+        fields = {}
+        try:
+            response = self.llm.invoke(messages, model="solar-mini", temperature=0.3)
+            fields = json.loads(response.content)
+        except Exception as e:
+            print(f"결과서 항목 요약 실패: {e}")
+        if not isinstance(fields, dict):
+            fields = {}
+        return {
+            key: str(fields.get(key) or "").strip() or REPORT_FIELD_FAILED
+            for key in ('진단명(추정)', '조치결과(권장사항)')
+        }
+
+    def _stream_text(self, messages, **kwargs):
+        """LLM 응답을 토큰(청크) 단위 문자열로 내보내는 제너레이터"""
+        for chunk in self.llm.stream(messages, **kwargs):
+            if chunk.content:
+                yield chunk.content
+
+    async def _astream_text(self, messages, **kwargs):
+        """_stream_text의 비동기 버전"""
+        async for chunk in self.llm.astream(messages, **kwargs):
+            if chunk.content:
+                yield chunk.content
 
     # --- generate_empathetic_response_and_ask_question 수정 ---
+    @traced("model.generate_empathetic_response_and_ask_question")
     def generate_empathetic_response_and_ask_question(self, user_input):
         if self.is_test_finished():
             return None
 
-        # 대화 기록 저장
-        self.chat_history.append({"role": "user", "content": user_input})
-
         next_question = self.screening_questions[self.question_index]
+        samples = self.example_selector.select(user_input, k=2)
+        messages = self._build_empathetic_messages(user_input, next_question, samples, self.memory_context())
+
+        response = self.llm.invoke(messages, temperature=0.7, cache=False)
+        bot_response = response.content
+
+        # 사용자 답변과 챗봇의 답변을 대화 기록에 저장
+        self._remember_turn(user_input, bot_response)
+
+        return bot_response
+
+    @traced("model.stream_empathetic_reply")
+    def _stream_empathetic_reply(self, user_input, next_question):
+        samples = self.example_selector.select(user_input, k=2)
+        messages = self._build_empathetic_messages(user_input, next_question, samples, self.memory_context())
+
+        tokens = []
+        for token in self._stream_text(messages, temperature=0.7):
+            tokens.append(token)
+            yield token
+
+        # 스트리밍이 끝나면 전체 답변을 대화 기록에 저장
+        self._remember_turn(user_input, "".join(tokens))
+
+    @traced("model.astream_empathetic_reply")
+    async def _astream_empathetic_reply(self, user_input, next_question):
+        """_stream_empathetic_reply의 비동기 버전"""
+        samples = await asyncio.to_thread(self.example_selector.select, user_input, 2)
+        messages = self._build_empathetic_messages(user_input, next_question, samples, self.memory_context())
 
-        # 감성대화 말뭉치에서 예시 추출 (Few-shot Prompting)
-        samples = self.emotion_df.sample(n=2)
+        tokens = []
+        async for token in self._astream_text(messages, temperature=0.7):
+            tokens.append(token)
+            yield token
+
+        self._remember_turn(user_input, "".join(tokens))
+
+    def _build_empathetic_messages(self, user_input, next_question, samples, memory=""):
+        """공감 응답 + 다음 질문을 위한 프롬프트 메시지를 만듭니다. (memory: memory_context()의 대화 기억)"""
+        # 감성대화 말뭉치에서 사용자 답변과 비슷한 예시 추출 (Few-shot Prompting)
         few_shot_examples = ""
-        for index, row in samples.iterrows():
-            few_shot_examples += f"\n#대화 예시 {index+1}\n- 사용자: {row['사람문장1']}\n- 상담사: {row['시스템문장1']}"
+        for index, row in enumerate(samples, start=1):
+            few_shot_examples += f"\n#대화 예시 {index}\n- 사용자: {row['사람문장1']}\n- 상담사: {row['시스템문장1']}"
+        # 지금까지의 대화 (요약 + 최근 턴, 토큰 예산 안에서)
+        if memory:
+            few_shot_examples += f"\n\n#지금까지의 대화 (공감할 때 참고만 하세요)\n{memory}"
 
         system_prompt = f"""
             당신은 따뜻하고 공감능력이 뛰어난 심리 상담사입니다. 사용자의 이전 답변에 대해 한두 문장으로 짧게 공감해주세요.
@@ -145,25 +606,80 @@ class EmotionBasedPsychotherapy:
 
             다음 질문을 자연스럽게 이어서 해주세요: {next_question}
             """
-        messages = [
+        return [
             SystemMessage(content=system_prompt), 
             HumanMessage(content=user_input)
         ]
 
-        response = self.llm.invoke(messages, temperature=0.7)
-        bot_response = response.content
-
-        # 챗봇의 답변도 대화 기록에 저장
-        self.chat_history.append({"role": "assistant", "content": bot_response})
-
-        return bot_response
-
+    @traced("model.process_and_score_answer")
     def process_and_score_answer(self, answer):
         """LLM을 사용해 사용자의 답변을 분석하고 점수를 매기는 새로운 함수"""
         
         # 현재 어떤 질문에 대한 답변인지 명시
         current_question = self.screening_questions[self.question_index]
-        
+        try:
+            points, reason = self._score_answer(current_question, answer)
+        except Exception as e:
+            print(f"점수 분석 중 오류 발생: {e}")
+            return self._apply_answer_score(None, None)
+
+        return self._apply_answer_score(points, reason)
+
+    @traced("model.start_screening_answer")
+    def start_screening_answer(self, answer):
+        """
+        한 번의 답변에 대해 점수 분석과 공감 응답(다음 질문)을 동시에 실행합니다.
+        점수 분석은 백그라운드 스레드에서 시작하고, 다음 질문이 남아 있으면 공감 응답 토큰 제너레이터를 반환합니다.
+        (마지막 질문이면 None) 제너레이터를 모두 소비한 뒤 finish_screening_answer로 점수를 반영하세요.
+        """
+        index = self.question_index
+        self._pending_score = _llm_executor.submit(self._score_answer, self.screening_questions[index], answer)
+
+        if index + 1 >= self.total_questions:
+            return None
+        return self._stream_empathetic_reply(answer, self.screening_questions[index + 1])
+
+    @traced("model.astream_screening_step")
+    async def astream_screening_step(self, answer, reply=True, strict=False):
+        """
+        start_screening_answer/finish_screening_answer의 비동기 버전입니다. (세션 엔진, 일괄 채점에서 사용)
+        점수 분석을 먼저 시작하고, reply가 True이고 다음 질문이 남아 있으면 공감 응답을 {"type": "token", "text": ...}로 내보냅니다.
+        마지막으로 점수를 총점과 질문 인덱스에 반영하고 {"type": "score", "points", "reason", "analysis"}를 내보냅니다.
+        점수 분석이 실패하면 0점 처리하며(points는 None), strict=True면 상태를 바꾸지 않고 예외를 그대로 올립니다.
+        공감 응답이 실패해도 상태를 바꾸기 전에 예외가 올라가므로 같은 답변으로 다시 시도할 수 있습니다.
+        """
+        index = self.question_index
+        score_task = asyncio.create_task(self._ascore_answer(self.screening_questions[index], answer))
+        try:
+            if reply and index + 1 < self.total_questions:
+                async for token in self._astream_empathetic_reply(answer, self.screening_questions[index + 1]):
+                    yield {"type": "token", "text": token}
+            try:
+                points, reason = await score_task
+            except Exception as e:
+                if strict:
+                    raise
+                print(f"점수 분석 중 오류 발생: {e}")
+                points, reason = None, None
+        finally:
+            score_task.cancel()
+
+        analysis = self._apply_answer_score(points, reason)
+        yield {"type": "score", "points": points, "reason": reason, "analysis": analysis}
+
+    @traced("model.finish_screening_answer")
+    def finish_screening_answer(self):
+        """start_screening_answer에서 시작한 점수 분석을 기다려 총점과 질문 인덱스에 반영합니다."""
+        future, self._pending_score = self._pending_score, None
+        try:
+            points, reason = future.result()
+        except Exception as e:
+            print(f"점수 분석 중 오류 발생: {e}")
+            return self._apply_answer_score(None, None)
+
+        return self._apply_answer_score(points, reason)
+
+    def _build_score_messages(self, current_question, answer):
         system_prompt = f"""
         당신은 숙련된 심리 분석가입니다. 사용자의 답변을 주어진 질문의 맥락에서 분석하고, 우울감의 심각도를 0점에서 3점 사이로 평가해주세요.
         - 0점: 우울감이나 부정적 정서가 전혀 드러나지 않음.
@@ -182,31 +698,113 @@ class EmotionBasedPsychotherapy:
         ---
         """
         
-        messages = [
+        return [
             SystemMessage(content=system_prompt),
             HumanMessage(content=f"사용자 답변: \"{answer}\"")
         ]
 
+    @traced("model.score_answer")
+    def _score_answer(self, current_question, answer):
+        # 명확한 답변은 사전 채점으로 LLM 호출 없이 처리
+        shortcut = self.prescorer.shortcut(answer)
+        if shortcut is not None:
+            return shortcut
+
+        messages = self._build_score_messages(current_question, answer)
         try:
-            response = self.llm.invoke(messages, model="solar-mini", temperature=0.1)
-            # LLM의 응답이 JSON 형식이므로, 이를 파싱합니다.
-            result = json.loads(response.content)
-            points = result.get("score", 0)
-            reason = result.get("reason", "분석 실패")
-            
-            self.score += points
-            self.question_index += 1
-            
-            return f"분석 결과: {reason} ({points}점 추가, 현재 총점: {self.score}점)"
+            content = self.score_batcher.score(messages, answer, current_question)
+            points, reason = self._parse_score(content)
+        except Exception as e:
+            return self._prescore_fallback(answer, e)
+
+        self.prescorer.compare(answer, points)
+        return points, reason
 
+    @traced("model.ascore_answer")
+    async def _ascore_answer(self, current_question, answer):
+        shortcut = self.prescorer.shortcut(answer)
+        if shortcut is not None:
+            return shortcut
+
+        messages = self._build_score_messages(current_question, answer)
+        try:
+            content = await self.score_batcher.ascore(messages, answer, current_question)
+            points, reason = self._parse_score(content)
         except Exception as e:
-            print(f"점수 분석 중 오류 발생: {e}")
-            self.question_index += 1
+            return self._prescore_fallback(answer, e)
+
+        self.prescorer.compare(answer, points)
+        return points, reason
+
+    def _prescore_fallback(self, answer, error):
+        """LLM 채점이 실패하면 사전 점수라도 사용하고, 그것도 없으면 원래 예외를 다시 발생시킵니다."""
+        fallback = self.prescorer.fallback(answer)
+        if fallback is None:
+            raise error
+        print("LLM 점수 분석 실패, 사전 채점 결과를 사용합니다.")
+        return fallback
+
+    @staticmethod
+    def _parse_score(content):
+        # LLM의 응답이 JSON 형식이므로, 이를 파싱합니다.
+        try:
+            result = json.loads(content)
+        except json.JSONDecodeError:
+            count("llm_parse_failures_total", kind="score")
+            raise
+        return result.get("score", 0), result.get("reason", "분석 실패")
+
+    def _apply_answer_score(self, points, reason):
+        """분석된 점수를 총점에 더하고 다음 질문으로 넘어갑니다. points가 None이면 0점 처리합니다."""
+        self.question_index += 1
+        if points is None:
             return f"점수 분석 중 오류가 발생했습니다. (0점 처리, 현재 총점: {self.score}점)"
+
+        self.score += points
+        return f"분석 결과: {reason} ({points}점 추가, 현재 총점: {self.score}점)"
         
+    @traced("model.score_narrative_answer")
     def score_narrative_answer(self, narrative_text):
         """서술형 답변을 분석하고 점수를 매기는 함수"""
-        
+
+        # 명확한 답변은 사전 채점으로 LLM 호출 없이 처리
+        shortcut = self.prescorer.shortcut(narrative_text)
+        if shortcut is not None:
+            points, reason = shortcut
+            return {"points": points, "reason": reason}
+
+        messages = self._build_narrative_messages(narrative_text)
+
+        try:
+            content = self.score_batcher.score(messages, narrative_text)
+            points, reason = self._parse_score(content)
+            self.prescorer.compare(narrative_text, points)
+            
+            # 사용자 데이터에 점수와 총점을 기록하기 위해 딕셔너리로 반환
+            return {"points": points, "reason": reason}
+
+        except Exception as e:
+            print(f"서술형 답변 점수 분석 중 오류 발생: {e}")
+            fallback = self.prescorer.fallback(narrative_text)
+            if fallback is not None:
+                points, reason = fallback
+                return {"points": points, "reason": reason}
+            return {"points": 0, "reason": "점수 분석 중 오류가 발생했습니다."}
+
+    @traced("model.ascore_narrative")
+    async def ascore_narrative(self, narrative_text):
+        """서술형 답변 점수 분석의 비동기 버전. (점수, 이유)를 반환하며, 실패 시 예외를 그대로 올립니다."""
+        shortcut = self.prescorer.shortcut(narrative_text)
+        if shortcut is not None:
+            return shortcut
+
+        messages = self._build_narrative_messages(narrative_text)
+        content = await self.score_batcher.ascore(messages, narrative_text)
+        points, reason = self._parse_score(content)
+        self.prescorer.compare(narrative_text, points)
+        return points, reason
+
+    def _build_narrative_messages(self, narrative_text):
         system_prompt = f"""
         당신은 숙련된 심리 분석가입니다. 사용자의 자유 서술형 답변을 분석하고, 우울감 및 위험도의 심각성을 0점에서 3점 사이로 평가해주세요.
         - 0점: 우울감이나 부정적 정서가 거의 드러나지 않음.
@@ -221,154 +819,45 @@ class EmotionBasedPsychotherapy:
         }}
         """
         
-        messages = [
+        return [
             SystemMessage(content=system_prompt),
             HumanMessage(content=f"사용자 답변: \"{narrative_text}\"")
         ]
 
-        try:
-            response = self.llm.invoke(messages, model="solar-mini", temperature=0.1)
-            result = json.loads(response.content)
-            points = result.get("score", 0)
-            reason = result.get("reason", "분석 실패")
-            
-            # 사용자 데이터에 점수와 총점을 기록하기 위해 딕셔너리로 반환
-            return {"points": points, "reason": reason}
-
-        except Exception as e:
-            print(f"서술형 답변 점수 분석 중 오류 발생: {e}")
-            return {"points": 0, "reason": "점수 분석 중 오류가 발생했습니다."}
-
     def is_test_finished(self):
         return self.question_index >= self.total_questions
     
 
+    @traced("model.summarize_for_report")
     def summarize_for_report(self, user_data, final_score):
-        """점수 기반 진단 로직과 RAG를 활용하여 전문적인 PDF 보고서 내용을 생성하는 함수"""
-
-        # 1. 점수 기준으로 기본 진단명 결정
-        if final_score >= 14:
-            diagnosis_title = "중증 우울증"
-        elif 10 <= final_score <= 13:
-            diagnosis_title = "중등도 우울증"
-        elif 6 <= final_score <= 9:
-            diagnosis_title = "경도 우울 증상"
-        else: 
-            diagnosis_title = "우울감 없음"
-
-        # 2. RAG를 통해 사용자의 증상과 관련된 전문 정보 검색
-        symptoms = user_data.get('주요 증상', '')
-        narrative = user_data.get('서술형 답변', '')
-        main_query = f"'{diagnosis_title}' 상태로 진단되었고, 주요 증상이 '{symptoms}'이며 '{narrative}'와 같은 어려움을 겪는 환자에 대한 정보"
-        
-        try:
-            retrieved_docs = self.md_retriever.invoke(main_query)
-            retrieved_info = "\n".join([doc.page_content for doc in retrieved_docs])
-        except Exception as e:
-            print(f"RAG 검색 오류: {e}")
-            retrieved_info = "관련 정보를 찾는 데 실패했습니다."
-
-        # 3. 검색된 정보와 사용자 데이터를 바탕으로 최종 보고서 생성
-        final_prompt = f"""
-        당신은 정신건강의학과 전문의입니다. 아래 정보를 바탕으로 '우울증 자가 진단 결과서'의 [진단명(추정)]과 [조치결과(권장사항)] 항목을 작성해주세요.
-
-        ### 환자 정보 ###
-        - 이름: {user_data.get('이름')}
-        - 나이/성별: {user_data.get('나이')}세 / {user_data.get('성별')}
-        - 총점: {final_score} 점
-        - 점수 기반 진단: {diagnosis_title}
-        - 주요 증상(사용자 입력): {symptoms}
-        - 서술 내용(사용자 입력): {narrative}
-        
-        ### 관련 의학 정보 (depression.md) ###
-        {retrieved_info}
-
-        ### 작성 지침 ###
-        1. **[진단명(추정)]**: 먼저 위 '점수 기반 진단'인 '{diagnosis_title}'을 언급해주세요. 그 다음, 환자의 증상과 의학 정보를 종합하여 전문적인 소견을 1~2 문장으로 구체화해주세요. (예: "초기 우울증 수준으로, 특히 대인관계 스트레스와 관련된 불안 및 무기력감이 두드러집니다.")
-        2. **[조치결과(권장사항)]**: 실제 의사가 환자에게 말하듯, 현실적이고 구체적인 조치 방안을 제안해주세요. 정신건강의학과 방문 권유, 상담치료, 생활 습관 개선 등 도움이 될 만한 정보를 따뜻하고 신뢰감 있는 어조로 작성해주세요.
-        
-        결과는 아래와 같이 각 항목의 내용만 작성하고, 다른 말은 덧붙이지 마세요.
-        [진단명(추정)]: <내용>
-        [조치결과(권장사항)]: <내용>
         """
-        
-        messages = [HumanMessage(content=final_prompt)]
-        response = self.llm.invoke(messages, model="solar-mini", temperature=0.5)
-        report_content = response.content
-        report_data = {}
-        try:
-            diag_part = report_content.split("[진단명(추정)]:")[1].split("[조치결과(권장사항)]:")[0].strip()
-            reco_part = report_content.split("[조치결과(권장사항)]:")[1].strip()
-            report_data['진단명(추정)'] = diag_part
-            report_data['조치결과(권장사항)'] = reco_part
-        except IndexError:
-            print("보고서 내용 파싱 실패")
-            report_data['진단명(추정)'] = "내용을 생성하지 못했습니다."
-            report_data['조치결과(권장사항)'] = "내용을 생성하지 못했습니다."
-
+        PDF 보고서 내용을 반환하는 함수.
+        최종 분석 때 함께 생성해 세션에 캐시한 결과서 항목을 사용하므로, 캐시가 있으면 네트워크 호출이 없습니다.
+        """
+        cached = self.report_cache
+        if cached is None or cached["key"] != _report_key(user_data, final_score):
+            # 최종 분석 없이 바로 보고서를 요청한 경우에만 파이프라인을 한 번 실행
+            report_header, messages = self._prepare_report(user_data, final_score)
+            response = self.llm.invoke(messages, model="solar-pro", temperature=0.7, cache=False)
+            self._finish_report(user_data, final_score, report_header, response.content)
+            cached = self.report_cache
+
+        report_data = dict(cached["fields"])
         report_data['환자 정보'] = f"{user_data.get('이름')} ({user_data.get('나이')}세, {user_data.get('성별')})"
         report_data['주된 증상'] = user_data.get('주요 증상')
         return report_data
 
 
-    def create_report_pdf(self, report_data, output_path):
-        """분석된 데이터를 바탕으로 자동 줄바꿈이 적용된 PDF 보고서를 생성하는 함수"""
-        try:
-            font_path = "font/NanumGothic.ttf"
-            if not os.path.exists(font_path):
-                raise FileNotFoundError("폰트 파일이 없습니다.")
-            pdfmetrics.registerFont(TTFont('NanumGothic', font_path))
-            font_name = 'NanumGothic'
-        except Exception as e:
-            print(f"나눔고딕 폰트를 찾을 수 없어 기본 폰트로 생성합니다: {e}")
-            font_name = 'Helvetica'
-
-        c = canvas.Canvas(output_path, pagesize=letter)
-        width, height = letter
-
-        # --- 자동 줄바꿈을 위한 스타일 정의 ---
-        styles = getSampleStyleSheet()
-        # 기본 Paragraph 스타일을 우리 폰트에 맞게 새로 정의합니다.
-        body_style = ParagraphStyle(
-            name='Body',
-            parent=styles['Normal'],
-            fontName=font_name,
-            fontSize=12,
-            leading=18,  # 줄 간격
-            alignment=TA_LEFT,
-            textColor=black,
-        )
-
-        # 제목
-        c.setFont(font_name, 18)
-        c.drawCentredString(width / 2.0, height - 60, "우울증 자가 진단 결과서")
-
-        # --- 내용을 Paragraph 객체로 그려주기 ---
-        text_y = height - 100
-        
-        # 보고서에 표시될 정보와 순서
-        report_data['진단일자'] = datetime.now().strftime("%Y-%m-%d")
-        report_data['총점'] = f"{self.score} 점"
-        display_order = ['진단일자', '환자 정보', '총점', '주된 증상', '진단명(추정)', '조치결과(권장사항)']
-
-        for key in display_order:
-            value = report_data.get(key, "내용 없음")
-            
-            # key 부분은 굵게(<b>) 처리하고, value와 합쳐서 하나의 문단으로 만듭니다.
-            text = f"<b>■ {key}:</b> {value}"
-            
-            # Paragraph 객체 생성
-            p = Paragraph(text, style=body_style)
-            
-            # 문단이 그려질 폭과 높이를 계산합니다. (좌우 여백 100씩 총 200)
-            p_width, p_height = p.wrapOn(c, width - 200, height)
-            
-            # 계산된 높이만큼 y 위치를 조정한 후 문단을 그립니다.
-            text_y -= p_height
-            p.drawOn(c, 100, text_y)
-            
-            # 항목 간의 간격을 줍니다.
-            text_y -= 15
-
-        c.save()
-        return True
\ No newline at end of file
+    @traced("model.create_report_pdf")
+    def create_report_pdf(self, report_data, output_path=None):
+        """
+        분석된 데이터를 바탕으로 PDF 보고서를 메모리에서 생성하여 bytes로 반환하는 함수.
+        output_path를 주면 같은 내용을 파일로도 저장합니다. (일괄 처리용)
+        """
+        # PDF 생성 (설치가 필요합니다: pip install reportlab) - 결과서를 만들 때만 불러옴
+        from report_pdf import render_report_pdf
+        pdf_bytes = render_report_pdf(report_data, self.score)
+        if output_path:
+            with open(output_path, "wb") as f:
+                f.write(pdf_bytes)
+        return pdf_bytes
@@ -0,0 +1,140 @@
+"""
+PDF 보고서 렌더링을 별도 프로세스 풀에서 처리하는 서비스입니다.
+
+ReportLab 레이아웃 계산은 CPU를 많이 쓰고 GIL을 잡고 있으므로, Streamlit 스크립트 스레드 대신
+크기가 제한된 프로세스 풀에서 실행합니다. 대기 중인 작업 수도 제한하여, 내보내기 요청이 몰려도
+같은 노드의 대화 응답이 밀리지 않게 합니다.
+
+사용법:
+    service = get_pdf_service()
+    job_id = service.submit(report_data, score)   # 가득 차 있으면 PdfServiceBusy
+    status = service.poll(job_id)                  # {"status": "pending" | "running" | "done" | "failed", ...}
+
+제한 시간(PDF_TIMEOUT초) 안에 끝나지 않은 작업은 poll에서 "failed"로 보고하고 목록에서 제거합니다.
+"""
+import os
+import sys
+import time
+import uuid
+import threading
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from telemetry import telemetry
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_PENDING = 8
+DEFAULT_TIMEOUT = 60
+
+_spawn_lock = threading.Lock()
+
+
+class PdfServiceBusy(Exception):
+    """대기 중인 PDF 작업이 너무 많아 새 작업을 받을 수 없을 때 발생합니다."""
+
+
+@contextlib.contextmanager
+def _worker_main():
+    """
+    워커 프로세스를 띄우는 동안 __main__을 이 모듈로 바꿔 둡니다.
+    Streamlit은 실행 중인 스크립트(app.py)를 __main__으로 등록하므로, 그대로 두면 forkserver 워커가
+    시작할 때 app.py 전체를 다시 실행합니다. 이 모듈은 가져와도 부작용이 없습니다.
+    """
+    with _spawn_lock:
+        main = sys.modules["__main__"]
+        sys.modules["__main__"] = sys.modules[__name__]
+        try:
+            yield
+        finally:
+            # 그 사이 Streamlit이 다음 실행을 위해 __main__을 바꿨다면 그대로 둠
+            if sys.modules["__main__"] is sys.modules[__name__]:
+                sys.modules["__main__"] = main
+
+
+class PdfRenderService:
+    def __init__(self, max_workers=DEFAULT_WORKERS, max_pending=DEFAULT_MAX_PENDING, timeout=DEFAULT_TIMEOUT):
+        # 스레드가 여럿 도는 프로세스에서 fork하면 다른 스레드가 잡고 있던 락이 워커에 그대로 복사되므로,
+        # 워커는 forkserver에서 띄웁니다. (ReportLab은 forkserver에서 한 번만 불러옴)
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__, "report_pdf"])
+        self._pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._timeout = timeout
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, report_data, score):
+        """렌더링 작업을 등록하고 작업 ID를 반환합니다."""
+        if not self._slots.acquire(blocking=False):
+            raise PdfServiceBusy("PDF 생성 요청이 많습니다. 잠시 후 다시 시도해주세요.")
+        # ReportLab은 첫 PDF 요청 때 불러옴
+        from report_pdf import render_report_pdf
+
+        try:
+            # 워커 프로세스는 submit 안에서 필요할 때 시작됨
+            with _worker_main():
+                future = self._pool.submit(render_report_pdf, dict(report_data), score)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        submitted = time.perf_counter()
+        # 대기 시간을 포함한 등록~완료 시간을 기록
+        future.add_done_callback(lambda f: telemetry.observe(
+            "pdf.render", time.perf_counter() - submitted, f.cancelled() or f.exception() is not None))
+
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = (future, time.monotonic() + self._timeout)
+        return job_id
+
+    def poll(self, job_id):
+        """
+        작업 상태를 반환합니다. 끝난 작업은 결과(bytes)나 오류와 함께 반환하고 목록에서 제거합니다.
+        제한 시간이 지난 작업은 취소하고 "failed"로 반환합니다.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return {"status": "unknown"}
+        future, deadline = job
+        if not future.done():
+            if time.monotonic() < deadline:
+                return {"status": "running" if future.running() else "pending"}
+            # 이미 실행 중인 작업은 멈출 수 없지만, 끝날 때까지 기다리지 않고 실패로 알림
+            self.cancel(job_id)
+            print(f"PDF 작업 시간 초과: {job_id}")
+            return {"status": "failed", "error": f"{self._timeout:g}초 안에 PDF를 만들지 못했습니다. 잠시 후 다시 시도해주세요."}
+
+        with self._lock:
+            self._jobs.pop(job_id, None)
+        error = future.exception()
+        if error is not None:
+            return {"status": "failed", "error": str(error)}
+        return {"status": "done", "result": future.result()}
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None:
+            job[0].cancel()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_shared_service = None
+_shared_service_lock = threading.Lock()
+
+
+def get_pdf_service():
+    """프로세스 전체에서 공유하는 PDF 렌더링 서비스를 반환합니다. (PDF_WORKERS, PDF_MAX_PENDING, PDF_TIMEOUT 환경 변수로 조정)"""
+    global _shared_service
+    with _shared_service_lock:
+        if _shared_service is None:
+            _shared_service = PdfRenderService(
+                max_workers=int(os.environ.get("PDF_WORKERS", DEFAULT_WORKERS)),
+                max_pending=int(os.environ.get("PDF_MAX_PENDING", DEFAULT_MAX_PENDING)),
+                timeout=float(os.environ.get("PDF_TIMEOUT", DEFAULT_TIMEOUT)),
+            )
+        return _shared_service
@@ -0,0 +1,147 @@
+"""
+app.py의 시작 비용(모듈 import 시간, 첫 화면까지 걸린 시간, 백그라운드 로딩 완료 시간)을 재는 스크립트입니다.
+측정마다 새 파이썬 프로세스를 띄우므로, 이미 불러온 모듈이나 캐시의 영향 없이 콜드 스타트를 잽니다.
+
+사용법:
+    python profile_startup.py                     # import 시간 + 첫 화면 시간 (3회 중앙값)
+    python profile_startup.py --runs 5 --fake-upstage --output startup.json
+
+- import 시간: python -X importtime으로 app.py가 불러오는 모듈을 불러오고, 오래 걸린 모듈 순으로 보여줍니다.
+- 첫 화면 시간: Streamlit AppTest로 app.py를 한 번 실행해 입력 폼이 그려질 때까지의 시간입니다.
+- 로딩 완료 시간: 첫 화면 이후 백그라운드 로더(start_loader_warmup)가 끝날 때까지의 시간입니다.
+  --fake-upstage를 주면 임베딩 호출을 로컬 가짜 서버(fake_upstage.py)로 보냅니다.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import threading
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+# app.py가 시작할 때 불러오는 모듈 (app.py의 import 문과 맞춰 둡니다)
+APP_IMPORTS = ["streamlit", "model", "data_loader", "pdf_worker", "session_engine", "session_state", "telemetry"]
+
+
+def profile_imports(top):
+    """-X importtime 출력을 파싱해 (전체 시간, app 모듈별 누적 시간, 오래 걸린 모듈 목록)을 초 단위로 반환합니다."""
+    code = "; ".join(f"import {name}" for name in APP_IMPORTS)
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=REPO_DIR,
+                            capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"모듈을 불러오지 못했습니다:\n{result.stderr[-2000:]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        # "import time: <self> | <cumulative> | <들여쓰기><모듈>" (들여쓰기 2칸이 한 단계)
+        _, cumulative_us, name = line.split("|", 2)
+        entries.append((name[1:].rstrip(), int(cumulative_us)))
+
+    # 다른 모듈이 먼저 불러온 모듈은 목록에 없음 (비용이 먼저 불러온 쪽에 포함됨)
+    app_modules = {name: cumulative / 1e6 for name, cumulative in entries if name in APP_IMPORTS}
+    # 바로 아래 단계(들여쓰기 2칸)의 무거운 의존 패키지
+    heaviest = sorted(((name.strip(), cumulative / 1e6) for name, cumulative in entries
+                       if name.startswith("  ") and not name.startswith("   ")),
+                      key=lambda item: item[1], reverse=True)[:top]
+    return {"wall_seconds": wall, "app_modules": app_modules, "heaviest": heaviest}
+
+
+def _child_render(fake_upstage):
+    """(자식 프로세스) AppTest로 첫 화면과 백그라운드 로딩 완료 시간을 재서 JSON으로 출력합니다."""
+    process_started = time.perf_counter()
+    sys.path.insert(0, REPO_DIR)
+    os.chdir(REPO_DIR)
+    if fake_upstage:
+        from fake_upstage import make_server
+        server = make_server("127.0.0.1", 0, latency=0.0, jitter=0.0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        os.environ["UPSTAGE_API_BASE"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file("app.py", default_timeout=120)
+    at.secrets["UPSTAGE_API_KEY"] = os.environ.get("UPSTAGE_API_KEY", "fake")
+    render_started = time.perf_counter()
+    at.run()
+    first_render = time.perf_counter() - render_started
+    result = {
+        "first_render_seconds": first_render,
+        "process_to_first_render_seconds": time.perf_counter() - process_started,
+        "form_rendered": len(at.text_input) > 0,
+        "exceptions": [e.value for e in at.exception],
+    }
+
+    # app.py가 시작한 백그라운드 로딩을 같은 캐시에서 꺼내 완료를 기다림
+    import data_loader
+    try:
+        data_loader.start_loader_warmup().result()
+        result["loaders_ready_seconds"] = time.perf_counter() - render_started
+    except Exception as e:
+        result["loaders_ready_seconds"] = None
+        result["loader_error"] = f"{type(e).__name__}: {e}"
+    print("RESULT " + json.dumps(result, ensure_ascii=False))
+
+
+def profile_render(runs, fake_upstage):
+    samples = []
+    for _ in range(runs):
+        command = [sys.executable, os.path.abspath(__file__), "--child-render"]
+        if fake_upstage:
+            command.append("--fake-upstage")
+        result = subprocess.run(command, cwd=REPO_DIR, capture_output=True, text=True)
+        lines = [line for line in result.stdout.splitlines() if line.startswith("RESULT ")]
+        if not lines:
+            raise RuntimeError(f"첫 화면 측정에 실패했습니다:\n{result.stderr[-2000:]}")
+        samples.append(json.loads(lines[-1][len("RESULT "):]))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="app.py 시작 비용을 측정합니다.")
+    parser.add_argument("--runs", type=int, default=3, help="첫 화면 측정 반복 횟수 (중앙값 사용)")
+    parser.add_argument("--top", type=int, default=15, help="표시할 무거운 의존 모듈 수")
+    parser.add_argument("--fake-upstage", action="store_true", help="임베딩 호출을 로컬 가짜 서버로 보냄")
+    parser.add_argument("--output", help="결과 JSON 저장 경로")
+    parser.add_argument("--child-render", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_render:
+        _child_render(args.fake_upstage)
+        return
+
+    imports = profile_imports(args.top)
+    print(f"import 시간 (app.py 의존 모듈 전체): {imports['wall_seconds']:.2f}초")
+    for name, seconds in imports["app_modules"].items():
+        print(f"  {name:<40}{seconds * 1000:>10.0f}ms")
+    print("오래 걸린 의존 패키지:")
+    for name, seconds in imports["heaviest"]:
+        print(f"  {name:<40}{seconds * 1000:>10.0f}ms")
+
+    samples = profile_render(args.runs, args.fake_upstage)
+    first_render = statistics.median(s["first_render_seconds"] for s in samples)
+    process_total = statistics.median(s["process_to_first_render_seconds"] for s in samples)
+    ready = [s["loaders_ready_seconds"] for s in samples if s["loaders_ready_seconds"] is not None]
+    print(f"\n첫 화면까지 (app.py 실행): {first_render:.2f}초, 프로세스 시작부터: {process_total:.2f}초 ({args.runs}회 중앙값)")
+    if ready:
+        print(f"백그라운드 로딩 완료까지: {statistics.median(ready):.2f}초")
+    for sample in samples:
+        if not sample["form_rendered"] or sample["exceptions"]:
+            print(f"경고: 입력 폼이 그려지지 않았습니다: {sample['exceptions']}")
+        if sample.get("loader_error"):
+            print(f"경고: 백그라운드 로딩 실패: {sample['loader_error']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"imports": imports, "render": samples, "first_render_seconds": first_render,
+                       "loaders_ready_seconds": statistics.median(ready) if ready else None},
+                      f, ensure_ascii=False, indent=2)
+        print(f"결과 저장: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+우울증 자가 진단 결과서 PDF를 메모리 안에서 생성하는 모듈입니다.
+
+- 결과는 파일이 아니라 bytes로 반환하므로 세션끼리 임시 파일을 공유하지 않습니다.
+- 나눔고딕 폰트는 프로세스당 한 번만 등록합니다. (ReportLab은 TTF 폰트를 사용된 글자만 서브셋으로 임베딩합니다)
+- 내용이 길면 자동으로 다음 페이지로 넘어갑니다.
+"""
+import io
+import os
+import functools
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfbase import pdfmetrics
+from reportlab.lib.fonts import addMapping
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.enums import TA_LEFT, TA_CENTER
+from reportlab.lib.colors import black
+
+FONT_PATH = "font/NanumGothic.ttf"
+REPORT_TITLE = "우울증 자가 진단 결과서"
+# 보고서에 표시될 정보와 순서
+DISPLAY_ORDER = ['진단일자', '환자 정보', '총점', '주된 증상', '진단명(추정)', '조치결과(권장사항)']
+
+
+@functools.lru_cache(maxsize=None)
+def register_report_font(font_path=FONT_PATH):
+    """나눔고딕 폰트를 한 번만 등록하고 폰트 이름을 반환합니다. 없으면 기본 폰트를 사용합니다."""
+    try:
+        if not os.path.exists(font_path):
+            raise FileNotFoundError("폰트 파일이 없습니다.")
+        pdfmetrics.registerFont(TTFont('NanumGothic', font_path))
+        # 굵은 글씨(<b>)도 같은 폰트로 표시되도록 매핑
+        for bold in (0, 1):
+            for italic in (0, 1):
+                addMapping('NanumGothic', bold, italic, 'NanumGothic')
+        return 'NanumGothic'
+    except Exception as e:
+        print(f"나눔고딕 폰트를 찾을 수 없어 기본 폰트로 생성합니다: {e}")
+        return 'Helvetica'
+
+
+def _paragraph_text(value):
+    """사용자/LLM이 만든 텍스트를 Paragraph 마크업에 안전하게 넣을 수 있도록 변환합니다."""
+    return escape(str(value)).replace("\n", "<br/>")
+
+
+def render_report_pdf(report_data, score):
+    """분석된 데이터를 바탕으로 자동 줄바꿈/페이지 넘김이 적용된 PDF를 만들어 bytes로 반환합니다."""
+    font_name = register_report_font()
+
+    # --- 자동 줄바꿈을 위한 스타일 정의 ---
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        name='Title',
+        parent=styles['Normal'],
+        fontName=font_name,
+        fontSize=18,
+        leading=24,
+        alignment=TA_CENTER,
+        textColor=black,
+    )
+    body_style = ParagraphStyle(
+        name='Body',
+        parent=styles['Normal'],
+        fontName=font_name,
+        fontSize=12,
+        leading=18,  # 줄 간격
+        alignment=TA_LEFT,
+        textColor=black,
+    )
+
+    data = dict(report_data)
+    data['진단일자'] = datetime.now().strftime("%Y-%m-%d")
+    data['총점'] = f"{score} 점"
+
+    story = [Paragraph(REPORT_TITLE, style=title_style), Spacer(1, 20)]
+    for key in DISPLAY_ORDER:
+        value = data.get(key, "내용 없음")
+        # key 부분은 굵게(<b>) 처리하고, value와 합쳐서 하나의 문단으로 만듭니다.
+        story.append(Paragraph(f"<b>■ {key}:</b> {_paragraph_text(value)}", style=body_style))
+        # 항목 간의 간격을 줍니다.
+        story.append(Spacer(1, 15))
+
+    buffer = io.BytesIO()
+    # 좌우 여백 100씩
+    doc = SimpleDocTemplate(buffer, pagesize=letter, leftMargin=100, rightMargin=100, topMargin=45, bottomMargin=60,
+                            title=REPORT_TITLE)
+    doc.build(story)
+    return buffer.getvalue()
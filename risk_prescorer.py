@@ -0,0 +1,128 @@
+"""
+LLM 점수 분석 앞단에서 명확한 답변만 빠르게 처리하는 한국어 어휘/정규식 기반 사전 채점기입니다.
+
+- 자해/자살 등 위험 표현이 부정 없이 드러나면 3점
+- "아니요, 괜찮아요"처럼 부정적 정서가 없는 짧은 답변이면 0점
+- 그 외(애매한 답변)는 None을 반환하여 LLM이 채점하도록 넘깁니다.
+
+동작 모드 (환경 변수 RISK_PRESCORE_MODE)
+- "on"    : 확신도가 임계값 이상이면 LLM 호출 없이 사전 점수를 사용 (기본값)
+- "shadow": 항상 LLM으로 채점하고, 사전 점수와의 일치 여부만 기록 (튜닝용)
+- "off"   : 사용하지 않음
+
+LLM 채점이 실패했을 때는 확신도가 RISK_PRESCORE_FALLBACK_THRESHOLD(기본 0.7) 이상인 사전 점수만 대신 사용합니다.
+"""
+import os
+import re
+import threading
+
+PRESCORE_MODES = ("on", "shadow", "off")
+DEFAULT_THRESHOLD = 0.85
+DEFAULT_FALLBACK_THRESHOLD = 0.7
+
+# 채점 프롬프트의 3점 기준에 나오는 위험 표현들
+RISK_PATTERNS = [
+    r"자살", r"자해", r"죽고\s*싶", r"죽는\s*게\s*(더\s*)?낫", r"죽어\s*버리", r"죽어야",
+    r"끝내고\s*싶", r"사라지고\s*싶", r"살고\s*싶지\s*않", r"살\s*이유가\s*없",
+    r"목숨을?\s*끊", r"손목을?\s*긋", r"뛰어\s*내리", r"스스로를?\s*해치",
+]
+# 답변 어디에든 부정이 있으면("죽고 싶다는 생각은 없어요", "자살이요? 전혀요") 확신할 수 없으므로 LLM에 넘깁니다.
+# "끊임없이", "끝없이", "없애다"처럼 부정이 아닌 '없'은 제외합니다.
+NEGATION_PATTERN = re.compile(r"(없(?![이애])|않|아니|아뇨|전혀|한\s*번도|안\s*해|안\s*했|안\s*들|못\s*해\s*봤)")
+
+# 부정적 정서가 없는 짧은 답변을 이루는 표현들
+CALM_PHRASES = [
+    r"아니[요오]?", r"아뇨", r"아니에요", r"아닙니다", r"전혀(요)?", r"전혀\s*(없어요|없습니다|아니에요|안\s*그래요)",
+    r"없어요", r"없습니다", r"없었어요", r"괜찮아요", r"괜찮습니다", r"괜찮았어요", r"별로(요)?",
+    r"딱히(요)?", r"딱히\s*없어요", r"그렇지\s*않아요", r"그런\s*적\s*없어요", r"문제\s*없어요",
+    r"잘\s*지내요", r"잘\s*자요", r"잘\s*먹어요", r"평소와\s*같아요", r"네\s*괜찮아요",
+]
+# 짧은 답변이라도 이런 표현이 섞이면 0점으로 확신하지 않습니다.
+DISTRESS_PATTERN = re.compile(r"(힘들|우울|불안|피곤|지치|짜증|슬프|외롭|무기력|못\s*자|안\s*와|걱정|죄책)")
+
+_risk_regex = re.compile("|".join(f"(?:{p})" for p in RISK_PATTERNS))
+_calm_regex = re.compile(r"^(?:(?:" + "|".join(CALM_PHRASES) + r")[\s,.!~…ㅎㅠ]*)+$")
+
+
+def prescore(text):
+    """
+    답변을 사전 채점합니다.
+    반환값: {"score": 0~3, "confidence": 0~1, "reason": 설명} 또는 판단할 수 없으면 None
+    """
+    text = (text or "").strip()
+    if not text:
+        return None
+
+    risk = _risk_regex.search(text)
+    if risk:
+        # 위험 표현의 앞뒤 어디에든 부정이 있으면 확신도를 낮춤
+        # ("살 이유가 없", "살고 싶지 않"처럼 위험 표현 자체에 든 부정은 빼고 확인)
+        rest = _risk_regex.sub(" ", text)
+        confidence = 0.5 if NEGATION_PATTERN.search(rest) else 0.95
+        return {"score": 3, "confidence": confidence, "reason": f"위험 표현('{risk.group(0)}')이 포함되어 있습니다."}
+
+    if len(text) <= 40 and _calm_regex.match(text) and not DISTRESS_PATTERN.search(text):
+        return {"score": 0, "confidence": 0.9, "reason": "부정적 정서가 드러나지 않는 짧은 답변입니다."}
+
+    return None
+
+
+class RiskPrescorer:
+    """사전 채점 모드/임계값과 LLM과의 일치 통계를 관리합니다. (프로세스 전체에서 공유)"""
+
+    def __init__(self, mode=None, threshold=None, fallback_threshold=None):
+        self.mode = mode or os.environ.get("RISK_PRESCORE_MODE", "on")
+        if self.mode not in PRESCORE_MODES:
+            raise ValueError(f"알 수 없는 사전 채점 모드입니다: {self.mode}")
+        self.threshold = threshold if threshold is not None else float(os.environ.get("RISK_PRESCORE_THRESHOLD", DEFAULT_THRESHOLD))
+        if fallback_threshold is None:
+            fallback_threshold = float(os.environ.get("RISK_PRESCORE_FALLBACK_THRESHOLD", DEFAULT_FALLBACK_THRESHOLD))
+        self.fallback_threshold = fallback_threshold
+        self.stats = {"shortcut": 0, "compared": 0, "agreed": 0}
+        self._lock = threading.Lock()
+
+    def shortcut(self, text):
+        """'on' 모드에서 확신도가 임계값 이상이면 (점수, 이유)를 반환합니다. 아니면 None."""
+        if self.mode != "on":
+            return None
+        result = prescore(text)
+        if result is None or result["confidence"] < self.threshold:
+            return None
+        with self._lock:
+            self.stats["shortcut"] += 1
+        return result["score"], result["reason"]
+
+    def compare(self, text, llm_points):
+        """'shadow' 모드에서 사전 점수와 LLM 점수의 일치 여부를 기록합니다."""
+        if self.mode != "shadow":
+            return
+        result = prescore(text)
+        if result is None:
+            return
+        agreed = result["score"] == llm_points
+        with self._lock:
+            self.stats["compared"] += 1
+            self.stats["agreed"] += int(agreed)
+        if not agreed:
+            print(f"사전 채점 불일치: 사전 {result['score']}점(확신도 {result['confidence']}) / LLM {llm_points}점 - {text[:50]}")
+
+    def fallback(self, text):
+        """
+        LLM 채점이 실패했을 때 쓸 수 있는 사전 점수. 없으면 None.
+        shortcut보다 낮은 fallback_threshold를 쓰지만, 부정이 붙은 위험 표현처럼 확신도가 낮은 결과는 사용하지 않습니다.
+        """
+        if self.mode == "off":
+            return None
+        result = prescore(text)
+        if result is None or result["confidence"] < self.fallback_threshold:
+            return None
+        return result["score"], result["reason"]
+
+    def agreement_rate(self):
+        with self._lock:
+            compared = self.stats["compared"]
+            return self.stats["agreed"] / compared if compared else None
+
+
+# 프로세스 전체에서 공유하는 기본 사전 채점기
+default_prescorer = RiskPrescorer()
@@ -0,0 +1,266 @@
+"""
+Streamlit 없이 상담 세션을 제공하는 WebSocket/HTTP 서버입니다.
+
+Streamlit 앱(app.py)은 그대로 두고, 같은 모델/데이터를 session_engine.SessionEngine으로 감싸
+WebSocket으로 응답 토큰을 바로 흘려보냅니다. 이벤트 루프는 uvloop을 사용합니다.
+세션 상태는 session_state 저장소(SESSION_REDIS_URL)에 두므로, Redis를 쓰면 어느 레플리카로 다시 연결해도 이어서 진행됩니다.
+
+실행: python server.py [--host 0.0.0.0] [--port 8765]
+UPSTAGE_API_KEY는 .env 파일 또는 환경 변수에서 읽습니다. (Streamlit secrets는 사용하지 않음)
+
+세션 토큰
+    세션을 만들면 서명된 세션 토큰을 한 번 돌려줍니다. 이어서 연결하거나 세션 정보를 조회할 때는
+    이 토큰을 "Authorization: Bearer <토큰>" 헤더나 세션 쿠키(session_state.SESSION_COOKIE)로 보내야 합니다.
+    (상담 내용이 로그나 Referer로 새지 않도록 토큰과 세션 ID를 URL 쿼리로는 받지 않습니다)
+
+WebSocket (ws://host:port/ws, 핸드셰이크에 토큰이 있으면 그 세션을 이어서 진행)
+    → {"type": "resume", "token": "<토큰>"}  헤더를 보낼 수 없는 클라이언트(브라우저)가 기존 세션으로 전환할 때
+    → {"type": "start", "user_data": {"이름": ..., "성별": ..., "나이": ..., "주요 증상": ..., "과거 병력": ...}}
+    → {"type": "message", "text": "답변"}
+    ← {"type": "session", "session_id": ..., "token": ..., "state": {...}}  연결 직후와 resume 뒤 (token은 만료 시간을 늘린 새 토큰)
+    ← session_engine의 이벤트들, 요청 하나가 끝날 때마다 {"type": "done", "state": {...}}
+    ← 오류 시 {"type": "error", "message": ...}
+
+HTTP (/sessions/... 는 해당 세션의 토큰 필요, 없거나 맞지 않으면 401)
+    GET /health                    상태 확인
+    GET /metrics                   단계별 지연 시간/토큰/캐시 지표 (Prometheus 텍스트 형식)
+    GET /sessions/<id>             세션 상태(JSON)
+    GET /sessions/<id>/report.pdf  상담이 끝난 세션의 결과서 PDF
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+from http import HTTPStatus
+from http.cookies import SimpleCookie
+from urllib.parse import urlsplit
+
+import uvloop
+from websockets.asyncio.server import serve
+from websockets.datastructures import Headers
+from websockets.exceptions import ConnectionClosed
+from websockets.http11 import Response
+
+from dotenv import load_dotenv
+from data_loader import load_emotion_data, load_example_selector, load_markdown_retriever
+from model import EmotionBasedPsychotherapy, new_session_state
+from pdf_worker import get_pdf_service, PdfServiceBusy
+from session_engine import SessionEngine, SessionError
+from session_state import SessionConflict, get_session_store, SESSION_COOKIE, session_token, verify_session_token
+from telemetry import telemetry
+
+DEFAULT_HOST = "0.0.0.0"
+DEFAULT_PORT = 8765
+# 이 시간(초) 동안 요청이 없던 세션은 프로세스 메모리에서만 내립니다. (상태는 세션 저장소에 남아 있음)
+ENGINE_IDLE_SECONDS = 600
+
+
+class SessionRegistry:
+    """
+    세션 상태는 공유 저장소에서 불러오고, 이 프로세스에서 처리 중인 세션의 엔진만 메모리에 둡니다.
+    데이터와 검색기, LLM 클라이언트는 모든 세션이 공유합니다.
+    """
+
+    def __init__(self, emotion_corpus, md_retriever, example_selector, store):
+        self.emotion_corpus = emotion_corpus
+        self.md_retriever = md_retriever
+        self.example_selector = example_selector
+        self.store = store
+        self._engines = {}
+
+    def _engine(self, state):
+        bot = EmotionBasedPsychotherapy(self.emotion_corpus, self.md_retriever, self.example_selector, state=state)
+        engine = SessionEngine(bot, self.store)
+        self._engines[state.session_id] = [engine, time.monotonic()]
+        return engine
+
+    async def create(self):
+        engine = self._engine(new_session_state())
+        await engine.save()
+        return engine
+
+    async def get(self, session_id):
+        """세션 엔진을 반환합니다. 다른 레플리카에서 상태가 바뀌었으면 최신 스냅샷으로 다시 만듭니다."""
+        state = await asyncio.to_thread(self.store.load, session_id)
+        if state is None:
+            self._engines.pop(session_id, None)
+            return None
+
+        entry = self._engines.get(session_id)
+        if entry is None or entry[0].state.version != state.version:
+            if entry is not None and entry[0].lock.locked():
+                return entry[0]  # 이 프로세스에서 처리 중이면 그대로 사용
+            return self._engine(state)
+        entry[1] = time.monotonic()
+        return entry[0]
+
+    def expire(self):
+        deadline = time.monotonic() - ENGINE_IDLE_SECONDS
+        for session_id, (engine, last_active) in list(self._engines.items()):
+            if last_active < deadline and not engine.lock.locked():
+                engine.bot.cancel_report_prefetch()
+                del self._engines[session_id]
+
+
+def _json_response(status, payload):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    headers = Headers([("Content-Type", "application/json; charset=utf-8"), ("Content-Length", str(len(body)))])
+    return Response(status.value, status.phrase, headers, body)
+
+
+def _request_session_id(headers):
+    """Authorization: Bearer 헤더나 세션 쿠키의 토큰을 검증해 session_id를 반환합니다. (없거나 틀리면 None)"""
+    authorization = headers.get("Authorization", "")
+    if authorization.startswith("Bearer "):
+        return verify_session_token(authorization[len("Bearer "):].strip())
+    cookie = SimpleCookie()
+    try:
+        cookie.load(headers.get("Cookie", ""))
+    except Exception:
+        return None
+    morsel = cookie.get(SESSION_COOKIE)
+    return verify_session_token(morsel.value) if morsel else None
+
+
+def _pdf_response(pdf_bytes):
+    headers = Headers([
+        ("Content-Type", "application/pdf"),
+        ("Content-Length", str(len(pdf_bytes))),
+        ("Content-Disposition", 'attachment; filename="depression_report.pdf"'),
+    ])
+    return Response(HTTPStatus.OK.value, HTTPStatus.OK.phrase, headers, pdf_bytes)
+
+
+def make_http_handler(registry):
+    """WebSocket 핸드셰이크 전에 일반 HTTP 요청(/health, /metrics, /sessions/...)을 처리합니다."""
+
+    async def process_request(connection, request):
+        path = urlsplit(request.path).path
+        if path == "/ws":
+            return None  # WebSocket 연결은 그대로 진행
+        if path == "/health":
+            return _json_response(HTTPStatus.OK, {"status": "ok"})
+        if path == "/metrics":
+            body = telemetry.render_prometheus().encode("utf-8")
+            headers = Headers([("Content-Type", "text/plain; version=0.0.4; charset=utf-8"),
+                               ("Content-Length", str(len(body)))])
+            return Response(HTTPStatus.OK.value, HTTPStatus.OK.phrase, headers, body)
+
+        parts = path.strip("/").split("/")
+        if len(parts) < 2 or parts[0] != "sessions":
+            return _json_response(HTTPStatus.NOT_FOUND, {"error": "not found"})
+
+        # 세션 ID를 아는 것만으로는 조회할 수 없도록 같은 세션의 토큰을 요구
+        if _request_session_id(request.headers) != parts[1]:
+            return _json_response(HTTPStatus.UNAUTHORIZED, {"error": "세션 토큰이 필요합니다."})
+        engine = await registry.get(parts[1])
+        if engine is None:
+            return _json_response(HTTPStatus.NOT_FOUND, {"error": "세션을 찾을 수 없습니다."})
+        if len(parts) == 2:
+            return _json_response(HTTPStatus.OK, engine.snapshot())
+        if parts[2:] != ["report.pdf"]:
+            return _json_response(HTTPStatus.NOT_FOUND, {"error": "not found"})
+
+        async with engine.lock:
+            try:
+                pdf_bytes = await engine.report_pdf(get_pdf_service())
+            except SessionError as e:
+                return _json_response(HTTPStatus.CONFLICT, {"error": str(e)})
+            except PdfServiceBusy as e:
+                return _json_response(HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(e)})
+            except Exception as e:
+                print(f"PDF 생성 중 오류 발생: {e}")
+                return _json_response(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "PDF 생성 중 오류가 발생했습니다."})
+        return _pdf_response(pdf_bytes)
+
+    return process_request
+
+
+def make_ws_handler(registry):
+    async def send_session(websocket, engine):
+        # 이미 토큰을 제시한 연결이거나 새로 만든 세션이므로, 만료 시간을 늘린 새 토큰을 알려줌
+        event = {"type": "session", "session_id": engine.state.session_id, "token": session_token(engine.state.session_id),
+                 "state": engine.snapshot()}
+        await websocket.send(json.dumps(event, ensure_ascii=False))
+
+    async def handler(websocket):
+        session_id = _request_session_id(websocket.request.headers)
+        engine = await registry.get(session_id) if session_id else None
+        if engine is None:
+            engine = await registry.create()
+        session_id = engine.state.session_id
+
+        await send_session(websocket, engine)
+
+        try:
+            async for raw in websocket:
+                try:
+                    # 다른 레플리카에서 진행된 내용이 있으면 최신 상태로 처리
+                    engine = await registry.get(session_id) or engine
+                    request = json.loads(raw)
+                    if not isinstance(request, dict):
+                        raise SessionError("요청은 JSON 객체여야 합니다.")
+                    if request.get("type") == "resume":
+                        resumed_id = verify_session_token(str(request.get("token", "")))
+                        resumed = await registry.get(resumed_id) if resumed_id else None
+                        if resumed is None:
+                            raise SessionError("세션 토큰이 올바르지 않거나 세션이 만료되었습니다.")
+                        engine, session_id = resumed, resumed_id
+                        await send_session(websocket, engine)
+                        continue
+                    if request.get("type") == "start":
+                        events = engine.submit_user_info(request.get("user_data") or {})
+                    elif request.get("type") == "message":
+                        events = engine.handle_message(str(request.get("text", "")))
+                    else:
+                        raise SessionError(f"알 수 없는 요청입니다: {request.get('type')}")
+
+                    async with engine.lock:
+                        async for event in events:
+                            await websocket.send(json.dumps(event, ensure_ascii=False))
+                    await websocket.send(json.dumps({"type": "done", "state": engine.snapshot()}, ensure_ascii=False))
+                except (SessionError, SessionConflict, ValueError) as e:
+                    await websocket.send(json.dumps({"type": "error", "message": str(e)}, ensure_ascii=False))
+                except ConnectionClosed:
+                    raise
+                except Exception as e:
+                    # LLM 호출 실패 등: 엔진이 상태를 요청 전으로 되돌렸으므로 같은 요청을 다시 보내면 됨
+                    print(f"요청 처리 중 오류 발생: {type(e).__name__}: {e}")
+                    message = "요청을 처리하는 중 오류가 발생했습니다. 잠시 후 다시 시도해주세요."
+                    await websocket.send(json.dumps({"type": "error", "message": message}, ensure_ascii=False))
+        except ConnectionClosed:
+            # 세션은 남겨두므로 같은 session_id로 다시 연결해 이어서 진행할 수 있습니다.
+            pass
+
+    return handler
+
+
+async def _expire_sessions(registry, interval=60):
+    while True:
+        await asyncio.sleep(interval)
+        registry.expire()
+
+
+async def main(host, port):
+    load_dotenv()
+    if not os.environ.get("UPSTAGE_API_KEY"):
+        raise SystemExit("UPSTAGE_API_KEY가 설정되지 않았습니다. (.env 파일 또는 환경 변수)")
+    # 데이터와 인덱스는 프로세스 시작 시 한 번만 로드합니다.
+    registry = SessionRegistry(load_emotion_data(), load_markdown_retriever(), load_example_selector(), get_session_store())
+    cleanup = asyncio.create_task(_expire_sessions(registry))
+
+    async with serve(make_ws_handler(registry), host, port, process_request=make_http_handler(registry)) as server:
+        print(f"세션 서버 시작: ws://{host}:{port}/ws")
+        try:
+            await server.serve_forever()
+        finally:
+            cleanup.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="우울증 자가 진단 상담 WebSocket 서버")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    uvloop.run(main(args.host, args.port))
@@ -0,0 +1,189 @@
+"""
+app.py의 5단계 상담 흐름을 UI와 분리한 비동기 세션 엔진입니다.
+
+user_info_gathering → screening_questions → narrative_input → final_analysis → finished
+
+각 단계 처리 메서드는 이벤트(dict)를 내보내는 비동기 제너레이터이므로,
+WebSocket 서버처럼 Streamlit이 아닌 클라이언트에도 응답을 토큰 단위로 전달할 수 있습니다.
+
+이벤트 종류
+- {"type": "message", "role": "assistant", "content": ...}  완성된 메시지
+- {"type": "token", "text": ...}                             스트리밍 중인 응답 조각
+- {"type": "message_end", "content": ...}                    스트리밍이 끝난 메시지 전체
+- {"type": "analysis", "content": ...}                       답변 분석 결과
+- {"type": "report_header", "content": ...}                  최종 분석 헤더(HTML)
+- {"type": "phase", "phase": ...}                            단계 전환
+
+세션 값은 모두 bot.state(SessionState)에 있으므로, store를 주면 요청 하나를 처리할 때마다 스냅샷을 저장합니다.
+요청 처리 중 예외가 나거나 연결이 끊기면 세션 상태를 요청 전으로 되돌리므로, 같은 요청을 그대로 다시 보낼 수 있습니다.
+"""
+import asyncio
+
+from session_state import SessionState
+
+PHASES = ("user_info_gathering", "screening_questions", "narrative_input", "final_analysis", "finished")
+NARRATIVE_PROMPT = "마지막으로, 현재 심정에 대해 일기를 쓰듯 자유롭게 이야기해주세요. 어떤 내용이든 괜찮습니다."
+USER_INFO_FIELDS = ("이름", "성별", "나이", "주요 증상", "과거 병력")
+
+
+class SessionError(Exception):
+    """현재 단계에서 처리할 수 없는 요청일 때 발생합니다."""
+
+
+class SessionEngine:
+    def __init__(self, bot, store=None):
+        self.bot = bot
+        self.store = store
+        # 같은 세션의 요청은 순서대로 처리
+        self.lock = asyncio.Lock()
+
+    @property
+    def state(self):
+        return self.bot.state
+
+    @property
+    def phase(self):
+        return self.state.phase
+
+    @property
+    def user_data(self):
+        return self.state.user_data
+
+    @property
+    def messages(self):
+        return self.state.messages
+
+    def snapshot(self):
+        """클라이언트에 보낼 JSON 직렬화 가능한 세션 상태"""
+        return {
+            "session_id": self.state.session_id,
+            "version": self.state.version,
+            "phase": self.phase,
+            "user_data": self.user_data,
+            "score": self.bot.score,
+            "question_index": self.bot.question_index,
+            "total_questions": self.bot.total_questions,
+            "messages": self.messages,
+        }
+
+    def _add_message(self, role, content):
+        self.messages.append({"role": role, "content": content})
+        return {"type": "message", "role": role, "content": content}
+
+    def _set_phase(self, phase):
+        self.state.phase = phase
+        return {"type": "phase", "phase": phase}
+
+    async def save(self):
+        """세션 스냅샷을 저장합니다. (다른 곳에서 먼저 저장했다면 SessionConflict)"""
+        # 이미 끝난 대화 요약만 반영 (진행 중이면 요약 전 대화 기록이 그대로 저장됨)
+        self.bot.settle_memory()
+        if self.store is not None:
+            await asyncio.to_thread(self.store.save, self.state)
+
+    async def _atomic(self, events):
+        """단계 처리가 끝까지 성공했을 때만 상태 변경을 남기고, 중간에 실패하면 단계 시작 전 상태로 되돌립니다."""
+        backup = self.state.to_json()
+        try:
+            async for event in events:
+                yield event
+        except BaseException:
+            # 저장은 단계 끝에서만 하므로 저장소에는 반쯤 처리된 상태가 남지 않음
+            self.bot.restore_state(SessionState.from_json(backup))
+            raise
+
+    async def submit_user_info(self, user_data):
+        """1단계: 사용자 정보를 받고 첫 질문을 보냅니다."""
+        async for event in self._atomic(self._submit_user_info(user_data)):
+            yield event
+
+    async def handle_message(self, text):
+        """사용자 메시지를 현재 단계에 맞게 처리합니다."""
+        async for event in self._atomic(self._handle_message(text)):
+            yield event
+
+    async def _submit_user_info(self, user_data):
+        if self.phase != "user_info_gathering":
+            raise SessionError(f"현재 단계({self.phase})에서는 사용자 정보를 받을 수 없습니다.")
+
+        self.state.user_data = {key: user_data.get(key) for key in USER_INFO_FIELDS}
+        yield self._set_phase("screening_questions")
+        yield self._add_message("assistant", self.bot.screening_questions[0])
+        await self.save()
+
+    async def _handle_message(self, text):
+        if self.phase == "screening_questions":
+            async for event in self._handle_screening_answer(text):
+                yield event
+        elif self.phase == "narrative_input":
+            async for event in self._handle_narrative(text):
+                yield event
+        else:
+            raise SessionError(f"현재 단계({self.phase})에서는 메시지를 받을 수 없습니다.")
+        await self.save()
+
+    async def _handle_screening_answer(self, text):
+        """2단계: 점수 분석과 공감 응답 스트리밍을 동시에 진행합니다."""
+        bot = self.bot
+        self._add_message("user", text)
+
+        tokens = []
+        async for event in bot.astream_screening_step(text):
+            if event["type"] == "token":
+                tokens.append(event["text"])
+                yield event
+                continue
+            # 점수 반영 전에 공감 응답(있으면)을 먼저 마무리
+            if tokens:
+                response = "".join(tokens)
+                self.messages.append({"role": "assistant", "content": response})
+                yield {"type": "message_end", "content": response}
+            yield {"type": "analysis", "content": event["analysis"]}
+
+        if bot.is_test_finished():
+            yield self._set_phase("narrative_input")
+            # 서술형 답변을 쓰는 동안 보고서용 검색을 미리 실행
+            bot.start_report_prefetch(self.user_data)
+            yield self._add_message("assistant", NARRATIVE_PROMPT)
+
+    async def _handle_narrative(self, text):
+        """3~4단계: 서술형 답변을 채점하고 최종 분석을 스트리밍합니다."""
+        bot = self.bot
+        self.user_data["서술형 답변"] = text
+        self._add_message("user", text)
+        bot.start_report_prefetch(self.user_data)
+
+        self.user_data["질문 총점"] = bot.score
+        result = await asyncio.to_thread(bot.score_narrative_answer, text)
+        narrative_points = result.get("points", 0)
+        self.user_data["서술형 점수"] = narrative_points
+        bot.score += narrative_points
+        yield {"type": "analysis", "content": f"분석 결과: {result.get('reason', '')} ({narrative_points}점 추가, 현재 총점: {bot.score}점)"}
+
+        yield self._set_phase("final_analysis")
+        report_header, body_stream = await bot.astream_final_analysis(self.user_data)
+        yield {"type": "report_header", "content": report_header}
+        tokens = []
+        async for token in body_stream:
+            tokens.append(token)
+            yield {"type": "token", "text": token}
+        report_body = "".join(tokens)
+        self.messages.append({"role": "assistant", "content": report_header + report_body})
+        yield {"type": "message_end", "content": report_body}
+
+        yield self._set_phase("finished")
+
+    async def report_pdf(self, pdf_service):
+        """5단계: 캐시된 보고서 항목으로 PDF를 렌더링하여 bytes로 반환합니다."""
+        if self.phase != "finished":
+            raise SessionError("상담이 끝난 뒤에만 보고서를 만들 수 있습니다.")
+
+        report_data = await asyncio.to_thread(self.bot.summarize_for_report, self.user_data, self.bot.score)
+        job_id = pdf_service.submit(report_data, self.bot.score)
+        while True:
+            status = pdf_service.poll(job_id)
+            if status["status"] == "done":
+                return status["result"]
+            if status["status"] in ("failed", "unknown"):
+                raise RuntimeError(status.get("error", "PDF 작업을 찾을 수 없습니다."))
+            await asyncio.sleep(0.1)
@@ -0,0 +1,171 @@
+"""
+상담 세션 상태를 직렬화 가능한 작은 레코드로 분리하여 Redis(또는 프로세스 내 대체 저장소)에 보관합니다.
+
+LLM 클라이언트, 검색기, 감성대화 데이터처럼 무거운 객체는 프로세스에서 공유하고,
+세션마다 다른 값(점수, 질문 순서, 대화 기록, 사용자 정보, 보고서 캐시)만 SessionState에 담습니다.
+덕분에 파드가 재시작되거나 다른 레플리카로 요청이 넘어가도 같은 session_id로 상담을 이어갈 수 있습니다.
+
+저장 방식 (최신 스냅샷 하나 + 버전 비교 후 저장)
+- {prefix}{session_id}                : 최신 스냅샷 (세션마다 하나만 보관)
+- {prefix}{session_id}:claim:{version}: 그 버전을 쓸 권리 (SET NX, SAVE_CLAIM_TTL초 뒤 만료되는 빈 표시)
+저장할 때는 최신 스냅샷의 버전이 내 버전과 같은지 확인하고, 다음 버전의 claim을 SET NX로 얻은 쪽만 씁니다.
+두 레플리카가 같은 버전에서 동시에 저장하면 나중 쪽은 SessionConflict가 발생하므로, 다시 불러와서 처리하면 됩니다.
+
+세션 재개 토큰
+- 세션을 이어서 진행하려면 session_token()으로 만든 서명된 토큰("<session_id>.<만료 시각>.<HMAC>")이 필요합니다.
+  토큰은 SESSION_TTL초 뒤 만료되므로, 세션을 이어갈 때마다 새 토큰을 발급합니다.
+  토큰은 URL에 넣지 않고 쿠키(SESSION_COOKIE)나 Authorization 헤더로만 주고받습니다.
+  (공유된 링크, 브라우저 기록, 로그, Referer로 상담 내용이 노출되지 않도록)
+
+환경 변수
+- SESSION_REDIS_URL: Redis 주소. 없거나 "memory://"면 프로세스 내 대체 저장소를 사용합니다. (단일 프로세스용)
+- SESSION_TTL      : 마지막 저장 이후 세션을 보관할 시간(초), 기본 86400
+- SESSION_SECRET   : 세션 토큰 서명 키. 레플리카끼리 같은 값을 써야 하며,
+                     없으면 프로세스마다 임의로 만들어 재시작 후에는 이전 세션을 이어갈 수 없습니다.
+"""
+import os
+import hmac
+import json
+import time
+import uuid
+import hashlib
+import secrets
+import functools
+import threading
+from dataclasses import dataclass, field, asdict
+
+from llm_cache import InMemoryRedis
+
+# 스냅샷 형식 버전 (필드 구성이 바뀌면 올립니다)
+SNAPSHOT_FORMAT = 2
+# 새 필드에 기본값만 추가된 이전 형식은 그대로 불러올 수 있음 (1: history_summary 없음)
+READABLE_FORMATS = (1, SNAPSHOT_FORMAT)
+DEFAULT_SESSION_TTL = 86400
+# 버전 확인과 저장 사이의 경쟁만 막으면 되므로 claim은 짧게 유지
+SAVE_CLAIM_TTL = 60
+# 세션 재개 토큰을 담는 쿠키 이름 (app.py, server.py 공용)
+SESSION_COOKIE = "depression_bot_session"
+
+
+class SessionConflict(Exception):
+    """다른 프로세스가 같은 세션을 먼저 저장하여 현재 상태가 오래된 경우 발생합니다."""
+
+
+@functools.lru_cache(maxsize=1)
+def _session_secret():
+    secret = os.environ.get("SESSION_SECRET")
+    if secret:
+        return secret.encode("utf-8")
+    print("SESSION_SECRET이 없어 임의의 서명 키를 사용합니다. (재시작하거나 다른 레플리카로 연결되면 세션을 이어갈 수 없음)")
+    return secrets.token_bytes(32)
+
+
+def _sign(payload):
+    return hmac.new(_session_secret(), payload.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def session_token(session_id, ttl=None):
+    """세션을 이어서 진행할 때 제시해야 하는 서명된 토큰을 만듭니다. (ttl초 뒤 만료, 기본 SESSION_TTL)"""
+    if ttl is None:
+        ttl = int(os.environ.get("SESSION_TTL", DEFAULT_SESSION_TTL))
+    payload = f"{session_id}.{int(time.time() + ttl)}"
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify_session_token(token):
+    """토큰의 서명이 맞고 만료되지 않았으면 session_id를, 아니면 None을 반환합니다."""
+    parts = (token or "").split(".")
+    if len(parts) != 3:
+        return None
+    session_id, expires_at, signature = parts
+    if not hmac.compare_digest(signature, _sign(f"{session_id}.{expires_at}")):
+        return None
+    if not expires_at.isdigit() or int(expires_at) < time.time():
+        return None
+    return session_id
+
+
+@dataclass(slots=True)
+class SessionState:
+    session_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    phase: str = "user_info_gathering"
+    score: int = 0
+    question_index: int = 0
+    screening_questions: list = field(default_factory=list)
+    user_data: dict = field(default_factory=dict)
+    messages: list = field(default_factory=list)  # 화면에 표시하는 대화 기록
+    chat_history: list = field(default_factory=list)  # 최근 대화 기록 (오래된 턴은 history_summary로 요약)
+    history_summary: str = ""  # 최근 대화 이전 내용의 요약 (conversation_memory)
+    report_cache: dict = None  # 최종 분석과 함께 생성한 결과서 항목
+    version: int = 0  # 마지막으로 저장된 버전
+
+    def to_json(self):
+        data = asdict(self)
+        data["format"] = SNAPSHOT_FORMAT
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, raw):
+        data = json.loads(raw)
+        snapshot_format = data.pop("format", None)
+        if snapshot_format not in READABLE_FORMATS:
+            raise ValueError(f"지원하지 않는 세션 스냅샷 형식입니다: {snapshot_format}")
+        return cls(**data)
+
+
+class SessionStateStore:
+    """SessionState의 최신 스냅샷을 버전 확인 후 저장/조회합니다."""
+
+    def __init__(self, redis_client, ttl=DEFAULT_SESSION_TTL, prefix="session:"):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def load(self, session_id):
+        """최신 스냅샷을 불러옵니다. 없으면 None을 반환합니다."""
+        raw = self.redis.get(self.prefix + session_id)
+        if raw is None:
+            return None
+        return SessionState.from_json(raw)
+
+    def save(self, state):
+        """
+        저장된 최신 버전이 state.version과 같을 때만 다음 버전으로 덮어쓰고 state.version을 올립니다.
+        (같은 버전에서 동시에 저장하면 claim을 먼저 얻은 한 쪽만 성공)
+        """
+        conflict = SessionConflict(f"세션 {state.session_id}이(가) 다른 곳에서 먼저 변경되었습니다.")
+        latest = self.load(state.session_id)
+        if (latest.version if latest is not None else 0) != state.version:
+            raise conflict
+
+        next_version = state.version + 1
+        if not self.redis.set(f"{self.prefix}{state.session_id}:claim:{next_version}", b"1", ex=SAVE_CLAIM_TTL, nx=True):
+            raise conflict
+        state.version = next_version
+        self.redis.set(self.prefix + state.session_id, state.to_json(), ex=self.ttl)
+        return next_version
+
+    def delete(self, session_id):
+        self.redis.delete(self.prefix + session_id)
+
+
+_shared_store = None
+_shared_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """환경 변수 설정에 따라 프로세스 전체에서 공유하는 세션 저장소를 만들어 반환합니다."""
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            redis_url = os.environ.get("SESSION_REDIS_URL")
+            if not redis_url or redis_url == "memory://":
+                redis_client = InMemoryRedis()
+            else:
+                import redis
+                redis_client = redis.Redis.from_url(redis_url)
+            _shared_store = SessionStateStore(
+                redis_client,
+                ttl=int(os.environ.get("SESSION_TTL", DEFAULT_SESSION_TTL)),
+            )
+        return _shared_store
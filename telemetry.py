@@ -0,0 +1,235 @@
+"""
+단계별 지연 시간/토큰/캐시/파싱 실패를 기록하는 가벼운 계측 모듈입니다. (프로세스 단위)
+
+- span(stage): 구간 시간을 재어 단계별 히스토그램에 기록하고, 설정 시 JSONL 트레이스로 남깁니다.
+  중첩된 span은 같은 trace_id와 parent_id로 이어집니다.
+- traced(stage): 함수/코루틴/제너레이터/비동기 제너레이터에 span을 씌우는 데코레이터
+  (제너레이터는 마지막 토큰을 내보낼 때까지를 한 구간으로 봅니다)
+- count(name, **labels): 카운터 증가 (캐시 적중, 파싱 실패, 토큰 수 등)
+- render_prometheus(): Prometheus 텍스트 형식으로 내보내기
+- summary(): 관리자 페이지용 단계별 p50/p95/p99
+
+환경 변수
+- TELEMETRY_TRACE_PATH  : JSONL 트레이스 파일 경로 (없으면 트레이스를 쓰지 않음)
+- TELEMETRY_METRICS_PORT: 지정하면 이 포트에서 /metrics를 제공하는 스레드를 띄움 (start_metrics_server)
+"""
+import os
+import json
+import time
+import uuid
+import inspect
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import deque, defaultdict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SAMPLE_WINDOW = 1000
+METRIC_PREFIX = "depression_bot_"
+
+_current_span = contextvars.ContextVar("telemetry_span", default=None)
+
+
+class StageStats:
+    """한 단계의 누적 히스토그램(Prometheus용)과 최근 샘플(백분위수용)"""
+
+    def __init__(self):
+        self.bucket_counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.samples = deque(maxlen=SAMPLE_WINDOW)
+
+    def observe(self, seconds, error):
+        self.count += 1
+        self.total += seconds
+        self.errors += int(error)
+        self.samples.append(seconds)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+
+
+class Telemetry:
+    def __init__(self, trace_path=None):
+        self.trace_path = trace_path
+        self.stages = defaultdict(StageStats)
+        self.counters = defaultdict(float)
+        self._lock = threading.Lock()
+        self._trace_lock = threading.Lock()
+
+    def observe(self, stage, seconds, error=False):
+        with self._lock:
+            self.stages[stage].observe(seconds, error)
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] += value
+
+    def reset(self):
+        """누적된 단계/카운터를 비웁니다. (벤치마크에서 구간별로 따로 잴 때 사용)"""
+        with self._lock:
+            self.stages.clear()
+            self.counters.clear()
+
+    def write_trace(self, record):
+        if not self.trace_path:
+            return
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._trace_lock:
+            with open(self.trace_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    @contextmanager
+    def span(self, stage, **attributes):
+        parent = _current_span.get()
+        record = {
+            "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex,
+            "span_id": uuid.uuid4().hex[:16],
+            "parent_id": parent["span_id"] if parent else None,
+            "stage": stage,
+            "attributes": attributes,
+        }
+        token = _current_span.set(record)
+        started_at = time.time()
+        started = time.perf_counter()
+        error = None
+        try:
+            yield record
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # 제너레이터가 다른 컨텍스트에서 마무리된 경우
+                pass
+            # 클라이언트가 스트림을 중간에 닫은 것(GeneratorExit)은 오류로 보지 않음
+            failed = error is not None and not isinstance(error, GeneratorExit)
+            self.observe(stage, duration, failed)
+            record.update(start=started_at, duration=duration,
+                          error=f"{type(error).__name__}: {error}" if failed else None)
+            self.write_trace(record)
+
+    def summary(self):
+        """단계별 호출 수, 오류 수, p50/p95/p99(초)"""
+        with self._lock:
+            stages = {name: (s.count, s.errors, sorted(s.samples)) for name, s in self.stages.items()}
+        rows = []
+        for name, (count, errors, samples) in sorted(stages.items()):
+            def pick(q):
+                return samples[min(len(samples) - 1, int(len(samples) * q))] if samples else None
+            rows.append({"stage": name, "count": count, "errors": errors,
+                         "p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99)})
+        return rows
+
+    def counter_values(self):
+        with self._lock:
+            return {(name, labels): value for (name, labels), value in self.counters.items()}
+
+    def render_prometheus(self):
+        lines = [f"# TYPE {METRIC_PREFIX}stage_duration_seconds histogram"]
+        with self._lock:
+            for stage, stats in sorted(self.stages.items()):
+                label = f'stage="{stage}"'
+                for bound, bucket in zip(LATENCY_BUCKETS, stats.bucket_counts):
+                    lines.append(f'{METRIC_PREFIX}stage_duration_seconds_bucket{{{label},le="{bound}"}} {bucket}')
+                lines.append(f'{METRIC_PREFIX}stage_duration_seconds_bucket{{{label},le="+Inf"}} {stats.count}')
+                lines.append(f"{METRIC_PREFIX}stage_duration_seconds_sum{{{label}}} {stats.total}")
+                lines.append(f"{METRIC_PREFIX}stage_duration_seconds_count{{{label}}} {stats.count}")
+            lines.append(f"# TYPE {METRIC_PREFIX}stage_errors_total counter")
+            for stage, stats in sorted(self.stages.items()):
+                lines.append(f'{METRIC_PREFIX}stage_errors_total{{stage="{stage}"}} {stats.errors}')
+
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {METRIC_PREFIX}{name} counter")
+                    typed.add(name)
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f"{METRIC_PREFIX}{name}{{{label_text}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# 프로세스 전체에서 공유하는 기본 계측기
+telemetry = Telemetry(os.environ.get("TELEMETRY_TRACE_PATH"))
+span = telemetry.span
+count = telemetry.count
+
+
+def traced(stage):
+    """함수 실행 전체를 stage 구간으로 기록하는 데코레이터"""
+    def decorator(fn):
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def async_gen_wrapper(*args, **kwargs):
+                with span(stage):
+                    async for item in fn(*args, **kwargs):
+                        yield item
+            return async_gen_wrapper
+
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def gen_wrapper(*args, **kwargs):
+                with span(stage):
+                    yield from fn(*args, **kwargs)
+            return gen_wrapper
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_usage(model, message):
+    """LLM 응답(AIMessage/청크)의 usage_metadata가 있으면 모델별 토큰 수를 기록합니다."""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return
+    count("llm_tokens_total", usage.get("input_tokens", 0), model=model, kind="input")
+    count("llm_tokens_total", usage.get("output_tokens", 0), model=model, kind="output")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = telemetry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@functools.lru_cache(maxsize=None)
+def start_metrics_server(port=None):
+    """TELEMETRY_METRICS_PORT(또는 port)가 있으면 /metrics 서버를 백그라운드 스레드로 한 번만 띄웁니다."""
+    port = port or os.environ.get("TELEMETRY_METRICS_PORT")
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+    except OSError as e:
+        print(f"메트릭 서버를 시작할 수 없습니다: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+import data_loader
+from data_loader import ingest_documents, scan_documents
+
+
+@pytest.fixture
+def docs(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "depression.md").write_text("## 우울증\n\n우울증은 치료할 수 있는 질환입니다.\n", encoding="utf-8")
+    (data_dir / "진료기록지.docx").write_bytes(b"")
+    monkeypatch.delenv("RAG_EXCLUDE_DOCUMENTS", raising=False)
+    monkeypatch.setattr(data_loader, "INDEX_DIR", str(data_dir / "index"))
+    index_dir = data_dir / "index"
+    return str(data_dir), str(index_dir / "bm25.json"), str(index_dir / "manifest.json")
+
+
+def ingest(docs):
+    data_dir, index_path, manifest_path = docs
+    return ingest_documents(data_dir, index_path=index_path, manifest_path=manifest_path, vectors=False)
+
+
+def test_template_documents_are_not_indexed(docs):
+    paths = scan_documents(docs[0])
+    assert [os.path.basename(path) for path in paths] == ["depression.md"]
+
+
+def test_exclude_list_can_be_overridden(docs, monkeypatch):
+    monkeypatch.setenv("RAG_EXCLUDE_DOCUMENTS", "depression.md")
+    paths = scan_documents(docs[0])
+    assert [os.path.basename(path) for path in paths] == ["진료기록지.docx"]
+
+
+def test_manifest_is_not_rewritten_when_nothing_changed(docs):
+    _, _, manifest_path = docs
+    index, _ = ingest(docs)
+    assert len(index) > 0
+    written = os.stat(manifest_path).st_mtime_ns
+
+    os.utime(manifest_path, ns=(written - 10**9, written - 10**9))
+    ingest(docs)
+    assert os.stat(manifest_path).st_mtime_ns == written - 10**9
+
+
+def test_manifest_is_rewritten_when_a_document_changes(docs):
+    data_dir, _, manifest_path = docs
+    ingest(docs)
+    before = open(manifest_path, encoding="utf-8").read()
+
+    with open(os.path.join(data_dir, "depression.md"), "a", encoding="utf-8") as f:
+        f.write("\n## 치료\n\n상담과 약물 치료가 있습니다.\n")
+    ingest(docs)
+    assert open(manifest_path, encoding="utf-8").read() != before
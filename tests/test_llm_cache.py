@@ -0,0 +1,167 @@
+import asyncio
+import threading
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+import llm_cache
+from llm_cache import CachedChatModel, InMemoryRedis, ResponseCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_cache.time, "monotonic", clock)
+    return clock
+
+
+class FailingRedis:
+    def get(self, key):
+        raise ConnectionError("redis down")
+
+    def set(self, key, value, ex=None, nx=False):
+        raise ConnectionError("redis down")
+
+
+class FakeChat:
+    """호출 횟수를 세는 가짜 채팅 모델"""
+
+    model_name = "solar-mini"
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, messages, **kwargs):
+        self.calls += 1
+        return AIMessage(content=f"응답 {self.calls}")
+
+    async def ainvoke(self, messages, **kwargs):
+        return self.invoke(messages, **kwargs)
+
+
+# --- InMemoryRedis ---
+def test_in_memory_redis_get_set_delete():
+    redis = InMemoryRedis()
+    assert redis.get("a") is None
+    assert redis.set("a", "값") is True
+    assert redis.get("a") == "값".encode("utf-8")  # redis-py처럼 bytes로 반환
+    assert redis.delete("a", "missing") == 1
+    assert redis.get("a") is None
+
+
+def test_in_memory_redis_nx():
+    redis = InMemoryRedis()
+    assert redis.set("a", "1", nx=True) is True
+    assert redis.set("a", "2", nx=True) is None
+    assert redis.get("a") == b"1"
+
+
+def test_in_memory_redis_expiry(clock):
+    redis = InMemoryRedis()
+    redis.set("a", "1", ex=10)
+    redis.set("b", "1")
+    clock.now += 11
+    assert redis.get("a") is None
+    assert redis.get("b") == b"1"
+    # 만료된 키에는 nx로 다시 쓸 수 있음
+    assert redis.set("a", "2", ex=10, nx=True) is True
+
+
+# --- ResponseCache ---
+def test_response_cache_local_and_redis_hits():
+    redis = InMemoryRedis()
+    writer = ResponseCache(redis)
+    writer.set("k", {"score": 1})
+    assert writer.get("k") == {"score": 1}
+    assert writer.stats["local_hits"] == 1
+
+    # 다른 레플리카는 Redis에서 읽은 뒤 로컬 캐시에 채움
+    reader = ResponseCache(redis)
+    assert reader.get("k") == {"score": 1}
+    assert reader.get("k") == {"score": 1}
+    assert reader.get("missing") is None
+    assert reader.stats == {"local_hits": 1, "redis_hits": 1, "misses": 1}
+
+
+def test_response_cache_ttl(clock):
+    cache = ResponseCache(InMemoryRedis(), ttl=5)
+    cache.set("k", "v")
+    clock.now += 6
+    assert cache.get("k") is None
+
+
+def test_response_cache_ignores_redis_errors():
+    cache = ResponseCache(FailingRedis())
+    cache.set("k", "v")  # Redis 오류는 기록만 하고 로컬 캐시는 그대로 사용
+    assert cache.get("k") == "v"
+    assert cache.get("missing") is None
+    assert cache.stats["misses"] == 1
+
+
+def test_response_cache_stats_are_thread_safe():
+    cache = ResponseCache()
+    cache.set("k", "v")
+
+    def worker():
+        for _ in range(2000):
+            cache.get("k")
+            cache.get("missing")
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.stats["local_hits"] == 16000
+    assert cache.stats["misses"] == 16000
+
+
+def test_response_cache_async_access():
+    redis = InMemoryRedis()
+
+    async def run():
+        await ResponseCache(redis).aset("k", [0.1, 0.2])
+        reader = ResponseCache(redis)
+        return await reader.aget("k"), await reader.aget("k"), await reader.aget("missing"), reader.stats
+
+    first, second, missing, stats = asyncio.run(run())
+    assert first == second == [0.1, 0.2]
+    assert missing is None
+    assert stats == {"local_hits": 1, "redis_hits": 1, "misses": 1}
+
+
+# --- CachedChatModel ---
+def test_cached_chat_model_sync_and_async_share_entries():
+    llm = FakeChat()
+    model = CachedChatModel(llm, ResponseCache(InMemoryRedis()))
+    messages = [HumanMessage(content="안녕하세요")]
+
+    assert model.invoke(messages, temperature=0.1).content == "응답 1"
+    assert asyncio.run(model.ainvoke(messages, temperature=0.1)).content == "응답 1"
+    # 파라미터가 다르면 다른 키
+    assert asyncio.run(model.ainvoke(messages, temperature=0.7)).content == "응답 2"
+    # cache=False면 항상 호출
+    assert model.invoke(messages, temperature=0.1, cache=False).content == "응답 3"
+    assert llm.calls == 3
+
+
+def test_cached_chat_model_async_uses_thread_for_redis(monkeypatch):
+    calls = []
+    original = asyncio.to_thread
+
+    async def tracking_to_thread(func, *args, **kwargs):
+        calls.append(func.__name__)
+        return await original(func, *args, **kwargs)
+
+    monkeypatch.setattr(llm_cache.asyncio, "to_thread", tracking_to_thread)
+    model = CachedChatModel(FakeChat(), ResponseCache(InMemoryRedis()))
+    asyncio.run(model.ainvoke([HumanMessage(content="질문")]))
+    assert calls == ["_get_redis", "_set_redis"]
@@ -0,0 +1,168 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import openai
+import pytest
+from langchain_core.messages import HumanMessage
+
+import llm_client
+from fake_upstage import EMPATHY_REPLY, make_server
+from llm_client import AdaptiveLimiter, DeadlineExceeded, ResilientChatModel, TokenBucket, is_transient
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+# --- 토큰 버킷 ---
+def test_token_bucket_burst_then_rate(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_client.time, "monotonic", clock)
+    bucket = TokenBucket(rate=10, burst=2)
+    assert [bucket._reserve() for _ in range(2)] == [0.0, 0.0]
+    # 버스트를 다 쓰면 순서대로 1/rate초씩 기다림
+    assert bucket._reserve() == pytest.approx(0.1)
+    assert bucket._reserve() == pytest.approx(0.2)
+    clock.now += 10
+    assert bucket._reserve() == 0.0
+
+
+def test_token_bucket_without_limit():
+    bucket = TokenBucket(rate=0, burst=1)
+    assert all(bucket._reserve() == 0.0 for _ in range(100))
+
+
+# --- AIMD 동시성 제한 ---
+def test_limiter_backs_off_and_recovers():
+    limiter = AdaptiveLimiter(maximum=16, initial=8, latency_target=1.0)
+    for _ in range(2):
+        limiter.acquire(1)
+        limiter.release(0.1, overloaded=True)
+    assert limiter.limit == 2
+    limiter.acquire(1)
+    limiter.release(0.1, overloaded=False)
+    assert limiter.limit == pytest.approx(2.5)
+    # 느린 응답은 상한을 늘리지 않음
+    limiter.acquire(1)
+    limiter.release(5.0, overloaded=False)
+    assert limiter.limit == pytest.approx(2.5)
+
+
+def test_limiter_respects_minimum_and_maximum():
+    limiter = AdaptiveLimiter(maximum=2, minimum=1, initial=2)
+    for _ in range(5):
+        limiter.acquire(1)
+        limiter.release(0.1, overloaded=True)
+    assert limiter.limit == 1
+    for _ in range(10):
+        limiter.acquire(1)
+        limiter.release(0.1, overloaded=False)
+    assert limiter.limit == 2
+
+
+def test_limiter_async_wakes_on_release_from_thread():
+    limiter = AdaptiveLimiter(maximum=1, initial=1)
+
+    async def run():
+        await limiter.aacquire(1)
+        threading.Timer(0.05, limiter.release, args=(0.05, False)).start()
+        started = time.monotonic()
+        await limiter.aacquire(2)
+        return time.monotonic() - started
+
+    waited = asyncio.run(run())
+    assert 0.03 < waited < 1
+    assert limiter.in_flight == 1
+
+
+def test_limiter_async_timeout():
+    limiter = AdaptiveLimiter(maximum=1, initial=1)
+
+    async def run():
+        await limiter.aacquire(1)
+        await limiter.aacquire(0.05)
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(run())
+    assert limiter._async_waiters == []
+
+
+# --- 재시도 대상 분류 ---
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(status_code)
+        self.status_code = status_code
+
+
+@pytest.mark.parametrize("error, transient", [
+    (TimeoutError(), True),
+    (asyncio.TimeoutError(), True),
+    (ConnectionError(), True),
+    (httpx.ConnectError("refused"), True),
+    (openai.APIConnectionError(request=httpx.Request("POST", "http://test")), True),
+    (StatusError(429), True),
+    (StatusError(503), True),
+    (StatusError(400), False),
+    (StatusError(401), False),
+    (DeadlineExceeded(), False),
+    (ValueError("bad json"), False),
+])
+def test_is_transient(error, transient):
+    assert is_transient(error) == transient
+
+
+# --- 가짜 Upstage 서버에 붙여서 ---
+@pytest.fixture
+def fake_server(monkeypatch):
+    servers = []
+
+    def start(**options):
+        server = make_server(port=0, latency=0.01, pro_latency=0.01, jitter=0, **options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        monkeypatch.setenv("UPSTAGE_API_BASE", f"http://127.0.0.1:{server.server_address[1]}/v1")
+        monkeypatch.setenv("UPSTAGE_API_KEY", "fake")
+        from langchain_upstage import ChatUpstage
+        return ResilientChatModel(ChatUpstage(model="solar-mini", max_retries=0), rate=0, max_retries=1, hedge=False)
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+MESSAGES = [HumanMessage(content="요즘 잠을 잘 못 자요")]
+
+
+def test_invoke_against_fake_server(fake_server):
+    client = fake_server()
+    assert client.invoke(MESSAGES, temperature=0.7).content == EMPATHY_REPLY
+    assert asyncio.run(client.ainvoke(MESSAGES, temperature=0.7)).content == EMPATHY_REPLY
+    assert dict(client.stats) == {}
+
+
+def test_transient_errors_are_retried_then_raised(fake_server):
+    client = fake_server(error_rate=1.0)
+    with pytest.raises(Exception) as excinfo:
+        client.invoke(MESSAGES, temperature=0.7)
+    assert getattr(excinfo.value, "status_code", None) == 503
+    assert client.stats["retry"] == 1
+    # 과부하 응답이었으므로 동시성 상한을 줄임
+    assert client.limiter.limit < client.limiter.maximum // 2
+
+
+def test_solar_pro_falls_back_to_solar_mini(fake_server):
+    client = fake_server(pro_error_rate=1.0)
+    response = client.invoke(MESSAGES, model="solar-pro", temperature=0.7)
+    assert response.content == EMPATHY_REPLY  # solar-mini의 응답
+    assert client.stats["fallback"] == 1
+
+    response = asyncio.run(client.ainvoke(MESSAGES, model="solar-pro", temperature=0.7))
+    assert response.content == EMPATHY_REPLY
+    assert client.stats["fallback"] == 2
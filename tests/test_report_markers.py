@@ -0,0 +1,89 @@
+import json
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from model import REPORT_FIELD_FAILED, EmotionBasedPsychotherapy, _ReportBodyFilter
+from session_state import SessionState
+
+BODY = "### 지원 체계\n가까운 정신건강복지센터에서 도움을 받을 수 있어요.\n\n### 마음의 메시지\n응원합니다."
+DIAGNOSIS = "초기 우울증 수준으로 무기력감이 두드러집니다."
+RECOMMENDATION = "정신건강의학과 상담을 권합니다."
+
+MARKER_VARIANTS = [
+    f"[진단명(추정)]: {DIAGNOSIS}\n[조치결과(권장사항)]: {RECOMMENDATION}",
+    f"**[진단명(추정)]**: {DIAGNOSIS}\n**[조치결과(권장사항)]**: {RECOMMENDATION}",
+    f"1. **[진단명(추정)]**: {DIAGNOSIS}\n2. **[조치결과(권장사항)]**: {RECOMMENDATION}",
+    f"### 진단명 (추정):\n{DIAGNOSIS}\n\n### 조치 결과(권장 사항):\n{RECOMMENDATION}",
+    f"**진단명(추정):** {DIAGNOSIS}\n- **조치결과(권장사항)**： {RECOMMENDATION}",
+    f"[진단명(추정)] : {DIAGNOSIS} [조치결과(권장사항)] : {RECOMMENDATION}",
+]
+
+
+class FakeChat:
+    """항목 요약 호출에 정해 둔 응답을 돌려주는 가짜 채팅 모델"""
+
+    def __init__(self, content):
+        self.content = content
+        self.calls = 0
+
+    def invoke(self, messages, **kwargs):
+        self.calls += 1
+        return AIMessage(content=self.content)
+
+
+def make_bot(summary_content="{}"):
+    bot = EmotionBasedPsychotherapy.__new__(EmotionBasedPsychotherapy)
+    bot.state = SessionState()
+    bot.llm = FakeChat(summary_content)
+    return bot
+
+
+def stream_through_filter(content, chunk_size):
+    body_filter = _ReportBodyFilter()
+    shown = "".join(body_filter.feed(content[i:i + chunk_size]) for i in range(0, len(content), chunk_size))
+    return shown + body_filter.flush(), body_filter.content
+
+
+@pytest.mark.parametrize("fields", MARKER_VARIANTS)
+def test_marker_variants_are_parsed(fields):
+    bot = make_bot()
+    body = bot._finish_report({}, 10, "header", f"{BODY}\n\n{fields}")
+    assert body == BODY
+    assert bot.report_cache["fields"] == {"진단명(추정)": DIAGNOSIS, "조치결과(권장사항)": RECOMMENDATION}
+    assert bot.llm.calls == 0
+
+
+@pytest.mark.parametrize("fields", MARKER_VARIANTS)
+@pytest.mark.parametrize("chunk_size", [1, 3, 7])
+def test_stream_filter_hides_markers_split_across_chunks(fields, chunk_size):
+    shown, content = stream_through_filter(f"{BODY}\n\n{fields}", chunk_size)
+    assert shown.strip() == BODY
+    assert DIAGNOSIS not in shown
+    assert content == f"{BODY}\n\n{fields}"
+
+
+def test_stream_filter_without_marker_shows_everything():
+    shown, _ = stream_through_filter(BODY, 5)
+    assert shown == BODY
+
+
+def test_missing_marker_summarizes_fields_separately():
+    bot = make_bot(json.dumps({"진단명(추정)": "요약한 진단", "조치결과(권장사항)": "요약한 권장 사항"}, ensure_ascii=False))
+    body = bot._finish_report({"주요 증상": "불면"}, 10, "header", BODY)
+    assert body == BODY
+    assert bot.report_cache["fields"] == {"진단명(추정)": "요약한 진단", "조치결과(권장사항)": "요약한 권장 사항"}
+    assert bot.llm.calls == 1
+
+
+def test_empty_field_summarizes_fields_separately():
+    bot = make_bot(json.dumps({"진단명(추정)": "요약한 진단", "조치결과(권장사항)": "요약한 권장 사항"}, ensure_ascii=False))
+    bot._finish_report({}, 10, "header", f"{BODY}\n[진단명(추정)]:\n[조치결과(권장사항)]: {RECOMMENDATION}")
+    assert bot.report_cache["fields"]["진단명(추정)"] == "요약한 진단"
+    assert bot.llm.calls == 1
+
+
+def test_failed_summary_falls_back_to_placeholder():
+    bot = make_bot("JSON이 아닌 응답")
+    bot._finish_report({}, 10, "header", BODY)
+    assert bot.report_cache["fields"] == {"진단명(추정)": REPORT_FIELD_FAILED, "조치결과(권장사항)": REPORT_FIELD_FAILED}
@@ -0,0 +1,107 @@
+import pytest
+
+from risk_prescorer import prescore, RiskPrescorer
+
+# 부정 없이 드러난 위험 표현 → 3점, 높은 확신도
+RISK_CASES = [
+    "죽고 싶어요",
+    "요즘 자해를 했어요",
+    "살 이유가 없어요",
+    "그냥 다 끝내고 싶다",
+    "죽고 싶다는 생각이 끊임없이 들어요",  # '끊임없이'의 '없'은 부정이 아님
+    "사라지고 싶은 마음이 끝없이 들어요",
+]
+
+# 위험 표현 뒤에 부정이 붙음 → 3점이지만 낮은 확신도
+NEGATED_CASES = [
+    "죽고 싶다는 생각은 없어요",
+    "자살은 생각 안 해봤어요",
+    "자해는 아니에요",
+    "죽고 싶진 않아요",
+    # 위험 표현을 되풀이하며 부정하는 답변 (물음표 뒤, 긴 문장 끝의 부정)
+    "자살이요? 전혀요",
+    "자해요? 그런 생각 해본 적 없어요",
+    "죽고 싶다고 생각해 본 적은 지금까지 살면서 단 한 번도 없어요",
+]
+
+# 부정적 정서가 없는 짧은 답변 → 0점
+CALM_CASES = [
+    "아니요",
+    "괜찮아요",
+    "전혀요, 잘 지내요",
+    "없어요~",
+]
+
+# 판단할 수 없는 답변 → None (LLM이 채점)
+UNDECIDED_CASES = [
+    "아니요 근데 요즘 좀 힘들어요",
+    "괜찮아요. 잠은 잘 못 자요",
+    "잠을 잘 못 자고 입맛도 없어요",
+    "요즘 일이 많아서 피곤하지만 그럭저럭 지내요",
+    "네",
+    "",
+]
+
+
+@pytest.mark.parametrize("text", RISK_CASES)
+def test_risk_phrases(text):
+    result = prescore(text)
+    assert result["score"] == 3
+    assert result["confidence"] >= 0.85
+
+
+@pytest.mark.parametrize("text", NEGATED_CASES)
+def test_negated_risk_phrases(text):
+    result = prescore(text)
+    assert result["score"] == 3
+    assert result["confidence"] < 0.7
+
+
+@pytest.mark.parametrize("text", CALM_CASES)
+def test_calm_phrases(text):
+    result = prescore(text)
+    assert result["score"] == 0
+    assert result["confidence"] >= 0.85
+
+
+@pytest.mark.parametrize("text", UNDECIDED_CASES)
+def test_undecided_text(text):
+    assert prescore(text) is None
+
+
+def test_risk_phrase_in_mixed_text():
+    # 짧은 안심 답변 뒤에 위험 표현이 있으면 위험 표현이 우선
+    result = prescore("괜찮아요. 가끔 죽고 싶어요")
+    assert result["score"] == 3
+    assert result["confidence"] >= 0.85
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("죽고 싶어요", 3),
+    ("괜찮아요", 0),
+    ("죽고 싶다는 생각은 없어요", None),  # 확신도가 낮은 결과는 대체 점수로 쓰지 않음
+    ("아니요 근데 요즘 좀 힘들어요", None),
+])
+def test_fallback_respects_confidence(text, expected):
+    fallback = RiskPrescorer(mode="on").fallback(text)
+    assert (fallback[0] if fallback else None) == expected
+
+
+@pytest.mark.parametrize("mode, shortcut", [("on", True), ("shadow", False), ("off", False)])
+def test_shortcut_modes(mode, shortcut):
+    prescorer = RiskPrescorer(mode=mode)
+    assert (prescorer.shortcut("죽고 싶어요") is not None) == shortcut
+    assert prescorer.shortcut("죽고 싶다는 생각은 없어요") is None
+
+
+def test_off_mode_has_no_fallback():
+    assert RiskPrescorer(mode="off").fallback("죽고 싶어요") is None
+
+
+def test_shadow_mode_records_agreement():
+    prescorer = RiskPrescorer(mode="shadow")
+    prescorer.compare("죽고 싶어요", 3)
+    prescorer.compare("괜찮아요", 2)
+    prescorer.compare("네", 1)  # 사전 점수가 없으면 기록하지 않음
+    assert prescorer.stats["compared"] == 2
+    assert prescorer.agreement_rate() == 0.5
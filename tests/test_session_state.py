@@ -0,0 +1,99 @@
+import time
+
+import pytest
+
+import session_state
+from llm_cache import InMemoryRedis
+from session_state import (SessionConflict, SessionState, SessionStateStore, session_token,
+                           verify_session_token)
+
+
+@pytest.fixture(autouse=True)
+def fixed_secret(monkeypatch):
+    monkeypatch.setenv("SESSION_SECRET", "test-secret")
+    session_state._session_secret.cache_clear()
+    yield
+    session_state._session_secret.cache_clear()
+
+
+# --- 세션 토큰 ---
+def test_token_round_trip():
+    assert verify_session_token(session_token("abc123")) == "abc123"
+
+
+@pytest.mark.parametrize("tamper", [
+    lambda token: token.replace("abc123", "abc124", 1),  # 다른 세션 ID
+    lambda token: token[:-1] + ("0" if token[-1] != "0" else "1"),  # 서명 변조
+    lambda token: ".".join([token.split(".")[0], str(int(token.split(".")[1]) + 3600), token.split(".")[2]]),  # 만료 연장
+    lambda token: token.rsplit(".", 1)[0],  # 서명 없음
+    lambda token: "",
+])
+def test_tampered_token_is_rejected(tamper):
+    assert verify_session_token(tamper(session_token("abc123"))) is None
+
+
+def test_token_signed_with_another_secret_is_rejected(monkeypatch):
+    token = session_token("abc123")
+    monkeypatch.setenv("SESSION_SECRET", "other-secret")
+    session_state._session_secret.cache_clear()
+    assert verify_session_token(token) is None
+
+
+def test_expired_token_is_rejected(monkeypatch):
+    token = session_token("abc123", ttl=60)
+    now = time.time()
+    monkeypatch.setattr(session_state.time, "time", lambda: now + 61)
+    assert verify_session_token(token) is None
+
+
+# --- 스냅샷 저장 (버전 비교 후 저장) ---
+@pytest.fixture
+def store():
+    return SessionStateStore(InMemoryRedis())
+
+
+def test_save_and_load_round_trip(store):
+    state = SessionState(screening_questions=["q1", "q2"], user_data={"이름": "홍길동"})
+    state.chat_history.append({"role": "user", "content": "안녕하세요"})
+    assert store.save(state) == 1
+    loaded = store.load(state.session_id)
+    assert loaded == state
+    assert loaded.version == 1
+
+
+def test_stale_version_save_is_rejected(store):
+    state = SessionState()
+    store.save(state)
+
+    # 두 레플리카가 같은 버전을 불러와 각각 저장
+    first = store.load(state.session_id)
+    second = store.load(state.session_id)
+    first.score = 3
+    store.save(first)
+    second.score = 5
+    with pytest.raises(SessionConflict):
+        store.save(second)
+
+    # 실패한 쪽은 다시 불러와서 처리하면 저장할 수 있음
+    assert store.load(state.session_id).score == 3
+    retry = store.load(state.session_id)
+    retry.score = 5
+    assert store.save(retry) == 3
+
+
+def test_claimed_version_save_is_rejected(store):
+    # 버전 확인과 저장 사이에 다른 쪽이 다음 버전의 claim을 먼저 얻은 경우
+    state = SessionState()
+    store.redis.set(f"{store.prefix}{state.session_id}:claim:1", b"1", nx=True)
+    with pytest.raises(SessionConflict):
+        store.save(state)
+    assert state.version == 0
+    assert store.load(state.session_id) is None
+
+
+def test_only_latest_snapshot_is_kept(store):
+    state = SessionState()
+    for _ in range(3):
+        store.save(state)
+    snapshots = [key for key in store.redis._data if ":claim:" not in key]
+    assert snapshots == [store.prefix + state.session_id]